@@ -0,0 +1,70 @@
+# benchmark the marginal-std centroid smoothing
+# compares the original per-call fftconvolve path against cCentroidFilter
+# (cached kernel spectrum) on full-frame and subframe sizes
+#
+# usage
+# python bench_centroid.py --repeat 5
+
+import time, sys, argparse
+import numpy as np
+
+from pathlib import Path
+from scipy import signal
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils" ))
+from cCentroid import cCentroidFilter, marginal_std_peak
+
+# Parse User Inputs
+parser = argparse.ArgumentParser()
+parser.add_argument('--repeat', type=int, default=5,
+                    help='Number of timed calls per frame size')
+parser.add_argument('--sizes', type=str, default='2160x4096,1024x1024,512x512,256x256',
+                    help='Comma separated list of frame sizes as ROWSxCOLS')
+args = parser.parse_args()
+
+
+def legacy_centroid_std(data):
+    """centroid as originally done in cGuider._find_centroid_std (kernel rebuilt every call)"""
+    kernel = np.outer(signal.windows.gaussian(70, 8), signal.windows.gaussian(70, 8))
+    blurred = signal.fftconvolve(data, kernel, mode='same')
+    return marginal_std_peak(blurred)
+
+
+def fake_frame(nrows, ncols, seed=0):
+    """uint16 frame with poisson background and one gaussian star off center"""
+    rng = np.random.default_rng(seed)
+    frame = rng.poisson(200, (nrows, ncols)).astype(float)
+    y0, x0 = 0.6 * nrows, 0.4 * ncols
+    rows, cols = np.ogrid[:nrows, :ncols]
+    frame += 5000 * np.exp(-((cols - x0)**2 + (rows - y0)**2) / (2 * 4.0**2))
+    return frame.astype(np.uint16)
+
+
+def time_call(func, data, repeat):
+    """return (best time in ms, result of last call)"""
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = func(data)
+        best = min(best, time.perf_counter() - t0)
+    return 1e3 * best, out
+
+
+def main():
+    engine = cCentroidFilter(size=70, sigma=8)
+
+    print(f"{'size':>12} {'legacy ms':>10} {'cached ms':>10} {'speedup':>8}  centroid match")
+    for size in args.sizes.split(','):
+        nrows, ncols = [int(n) for n in size.lower().split('x')]
+        data = fake_frame(nrows, ncols)
+
+        engine.centroid(data) # first call builds the plan, not timed
+        t_old, c_old = time_call(legacy_centroid_std, data, args.repeat)
+        t_new, c_new = time_call(engine.centroid, data, args.repeat)
+
+        match = (int(c_old[0]), int(c_old[1])) == (int(c_new[0]), int(c_new[1]))
+        print(f"{size:>12} {t_old:10.2f} {t_new:10.2f} {t_old / t_new:8.1f}x  {match} ({int(c_new[0])}, {int(c_new[1])})")
+
+
+if __name__ == "__main__":
+    main()
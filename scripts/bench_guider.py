@@ -0,0 +1,198 @@
+# benchmark every cGuider centroid method on synthetic star fields
+# frames have a configurable PSF FWHM, peak SNR, background gradient, hot pixels
+# and number of stars; each method is scored on speed (ms/frame, peak memory)
+# and accuracy (measured centroid / frame-to-frame shift against the truth)
+#
+# usage
+# python bench_guider.py --trials 5 --json bench.json
+# python bench_guider.py --sizes 256x256 --methods wcom,gauss --fwhm 3 --snr 20
+
+import time, sys, argparse, json, platform, subprocess, tempfile, tracemalloc, logging
+import numpy as np
+import yaml
+
+from pathlib import Path
+from datetime import datetime, timezone
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils" ))
+from cFLIR import config_file
+from cGuider import cGuider
+from cLatency import stage_timer
+
+# Parse User Inputs
+parser = argparse.ArgumentParser()
+parser.add_argument('--sizes', type=str, default='2160x4096,512x512,256x256',
+                    help='Comma separated list of frame sizes as ROWSxCOLS')
+parser.add_argument('--methods', type=str, default=','.join(cGuider.METHODS),
+                    help='Comma separated list of centroid methods')
+parser.add_argument('--trials', type=int, default=5, help='Shifted frames measured per method and size')
+parser.add_argument('--fwhm', type=float, default=4.0, help='PSF FWHM in pixels')
+parser.add_argument('--snr', type=float, default=100.0, help='Peak SNR of the guide star')
+parser.add_argument('--stars', type=int, default=5, help='Number of stars (the first is the brightest)')
+parser.add_argument('--background', type=float, default=200.0, help='Sky level in ADU at the frame center')
+parser.add_argument('--gradient', type=float, default=0.05, help='Background gradient in ADU/pixel along x')
+parser.add_argument('--hot-pixels', type=int, default=20, help='Number of hot pixels')
+parser.add_argument('--hot-level', type=float, default=2000.0,
+                    help='Hot pixel level in ADU above the sky (65535 saturates them)')
+parser.add_argument('--read-noise', type=float, default=5.0, help='Read noise in ADU')
+parser.add_argument('--max-shift', type=float, default=3.0, help='Largest true shift between frames (px)')
+parser.add_argument('--seed', type=int, default=0)
+parser.add_argument('--json', type=str, default=None, help='Write the results to this JSON file')
+args = parser.parse_args()
+
+
+def star_field(shape, stars, fwhm, background, gradient, hot_pixels, read_noise, rng):
+    """
+    uint16 synthetic guide frame
+
+    stars      - (N, 3) array of x (col), y (row), peak amplitude in ADU
+    hot_pixels - (M, 2) array of row, col raised by args.hot_level
+    Stars are rendered in a +-4 FWHM box each so full frames stay cheap.
+    """
+    nrows, ncols = shape
+    sky = background + gradient * (np.arange(ncols) - ncols / 2)[None, :]
+    image = np.broadcast_to(sky, shape).astype(np.float64)
+    sig = fwhm / 2.3548
+    half = int(np.ceil(4 * fwhm))
+    for x0, y0, amp in stars:
+        r0, r1 = max(int(y0) - half, 0), min(int(y0) + half + 1, nrows)
+        c0, c1 = max(int(x0) - half, 0), min(int(x0) + half + 1, ncols)
+        rows, cols = np.ogrid[r0:r1, c0:c1]
+        image[r0:r1, c0:c1] += amp * np.exp(-((cols - x0)**2 + (rows - y0)**2) / (2 * sig**2))
+    image = rng.poisson(np.maximum(image, 0)) + rng.normal(0, read_noise, shape)
+    image[hot_pixels[:, 0], hot_pixels[:, 1]] += args.hot_level
+    return np.clip(image, 0, 65535).astype(np.uint16)
+
+
+def peak_for_snr(snr, background, read_noise):
+    """peak amplitude with peak / sqrt(peak + background + read_noise^2) = snr"""
+    var = background + read_noise**2
+    return 0.5 * (snr**2 + snr * np.sqrt(snr**2 + 4 * var))
+
+
+def make_scene(shape, rng):
+    """random star list (brightest first, kept away from the edges) and hot pixel positions"""
+    nrows, ncols = shape
+    margin = 4 * args.fwhm + args.max_shift + 2
+    amp = peak_for_snr(args.snr, args.background, args.read_noise)
+    n = max(args.stars, 1)
+    stars = np.column_stack([rng.uniform(margin, ncols - margin, n),
+                             rng.uniform(margin, nrows - margin, n),
+                             amp * np.r_[1.0, rng.uniform(0.05, 0.5, n - 1)]])
+    # guide star near the middle, as it would be when guiding
+    stars[0, :2] = ncols / 2 + rng.uniform(-0.1, 0.1) * ncols, nrows / 2 + rng.uniform(-0.1, 0.1) * nrows
+    hot = np.column_stack([rng.integers(0, nrows, args.hot_pixels), rng.integers(0, ncols, args.hot_pixels)])
+    return stars, hot
+
+
+def make_guider(tmp):
+    """cGuider with its data/log dirs in tmp (nothing is written next to real data)"""
+    with open(config_file) as f:
+        config = yaml.safe_load(f)
+    config.update({'data_dir': str(Path(tmp) / 'data'), 'log_dir': str(Path(tmp) / 'logs'),
+                   'psf_fwhm': args.fwhm, 'tracking': False})
+    bench_config = Path(tmp) / 'guider.yaml'
+    with open(bench_config, 'w') as f:
+        yaml.safe_dump(config, f)
+    guider = cGuider('bench', config_file=str(bench_config))
+    guider.logger.setLevel(logging.WARNING)
+    for handler in guider.logger.handlers:
+        handler.setLevel(logging.WARNING)
+    return guider
+
+
+def bench_method(guider, method, shape, rng):
+    """score one method on one frame size; returns a result dict"""
+    guider.centroid_method = method
+    stars, hot = make_scene(shape, rng)
+    render = lambda s: star_field(shape, s, args.fwhm, args.background, args.gradient,
+                                  hot, args.read_noise, rng)
+
+    times, abs_err, shift_err = [], [], []
+    peak_mem = 0
+    for trial in range(args.trials + 1):
+        shift = rng.uniform(-args.max_shift, args.max_shift, 2)
+        moved = stars.copy()
+        moved[:, :2] += shift
+        reference, frame = render(stars), render(moved)
+
+        # reference frame: starts the lock / registration / catalogue, not timed
+        guider.reset_lock()
+        ref = guider._find_centroid(reference)
+
+        if trial == 0:
+            # warm-up (plans, caches) and peak memory of one call, not timed
+            tracemalloc.start()
+            guider._find_centroid(frame)
+            peak_mem = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            continue
+
+        t0 = time.perf_counter()
+        found = guider._find_centroid(frame)
+        times.append(1e3 * (time.perf_counter() - t0))
+
+        if found is None or ref is None:
+            abs_err.append(np.nan)
+            shift_err.append(np.nan)
+            continue
+        found, ref = np.asarray(found, float), np.asarray(ref, float)
+        shift_err.append(np.hypot(*(found - ref - shift)))
+        if method not in ('register', 'multi'):   # these return target + shift, not a position
+            abs_err.append(np.hypot(*(found - moved[0, :2])))
+
+    def _stat(values, func):
+        values = np.asarray(values, float)
+        values = values[np.isfinite(values)]
+        return round(float(func(values)), 4) if len(values) else None
+
+    return {'method': method, 'rows': shape[0], 'cols': shape[1],
+            'ms_median': _stat(times, np.median), 'ms_max': _stat(times, np.max),
+            'peak_mem_mb': round(peak_mem / 2**20, 2),
+            'shift_err_rms_px': _stat(shift_err, lambda v: np.sqrt(np.mean(v**2))),
+            'shift_err_max_px': _stat(shift_err, np.max),
+            'abs_err_rms_px': _stat(abs_err, lambda v: np.sqrt(np.mean(v**2))) if abs_err else None,
+            'failures': int(np.sum(~np.isfinite(np.asarray(shift_err, float))))}
+
+
+def version():
+    """git description of the tree being benchmarked, if available"""
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    stage_timer.enabled = False   # time the methods, not the latency recorder
+    methods = args.methods.split(',')
+    sizes = [tuple(int(n) for n in size.lower().split('x')) for size in args.sizes.split(',')]
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        guider = make_guider(tmp)
+        print(f"{'size':>10} {'method':>9} {'ms/frame':>9} {'mem MB':>7} {'shift rms':>10} "
+              f"{'shift max':>10} {'abs rms':>8} {'fail':>5}")
+        for shape in sizes:
+            for method in methods:
+                rng = np.random.default_rng(args.seed)   # same scenes for every method
+                res = bench_method(guider, method, shape, rng)
+                results.append(res)
+                fmt = lambda v, w, p: f"{v:{w}.{p}f}" if v is not None else f"{'-':>{w}}"
+                print(f"{shape[0]:>4}x{shape[1]:<5} {method:>9} {fmt(res['ms_median'], 9, 2)} "
+                      f"{res['peak_mem_mb']:7.1f} {fmt(res['shift_err_rms_px'], 10, 3)} "
+                      f"{fmt(res['shift_err_max_px'], 10, 3)} {fmt(res['abs_err_rms_px'], 8, 3)} "
+                      f"{res['failures']:5d}")
+
+    if args.json:
+        out = {'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+               'version': version(), 'python': platform.python_version(), 'numpy': np.__version__,
+               'machine': platform.machine(), 'params': vars(args), 'results': results}
+        with open(args.json, 'w') as f:
+            json.dump(out, f, indent=1)
+        print(f'Wrote {args.json}')
+
+
+if __name__ == "__main__":
+    main()
@@ -6,25 +6,36 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 from matplotlib.patches import Rectangle
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
 from pathlib import Path
 import threading
 import time, sys
+import yaml
 from datetime import datetime, timezone
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
-from cFLIR import cFLIR
+from cFLIR import cFLIR, config_file
 from cGuider import cGuider
+from cPipeline import cGuidePipeline, cLatestSlot
+from cLatency import stage_timer
+from cStacker import cFrameStacker
+from cPreview import cPreviewPyramid
+from cFrameStats import cFrameStats
 
 
 # ── Extended guider that exposes centroid and accepts a custom target ─────────
 
 class EnhancedGuider(cGuider):
-    """Overrides run() to store centroid and accept a target pixel."""
+    """Overrides measure()/run() to store centroid and accept a target pixel."""
 
-    def run(self, data, target=None, subframe=None):
+    def measure(self, data, target=None, subframe=None, t_frame=None):
         """
         target: (col, row) in image coords for desired star position.
                 Defaults to image center if None.
+        t_frame: unix time of mid-exposure (default now), keys the guide log record
+
+        returns (xcentroid, ycentroid, dx, dy) or None if the star was not found
         """
         if subframe is not None:
             x0, xf, y0, yf = subframe
@@ -41,18 +52,28 @@ class EnhancedGuider(cGuider):
         else:
             self.xref, self.yref = 0, 0
 
-        self.xcentroid, self.ycentroid = self._find_centroid(self.subdata)
+        centroid = self._locate(self.subdata)
+        self.star_found = centroid is not None
+        if not self.star_found:
+            self.logger.warning('Star not found (tracking window / multi-star match), skipping correction')
+            self._log_measurement(t_frame)
+            return None
+        self.xcentroid, self.ycentroid = centroid
         dx, dy = self._calc_offset(self.xcentroid, self.ycentroid, Nx, Ny,
                                    self.xref, self.yref)
         self.dx_px, self.dy_px = dx, dy
         self.dx_arcs, self.dy_arcs = self._pixel_to_arcsec(dx, dy)
+        self._log_measurement(t_frame, centroid, dx, dy)
+        return self.xcentroid, self.ycentroid, dx, dy
 
-        # Fix upstream bug: second condition was checking dx_arcs twice.
-        # Guard session: cGuider.connect() swallows telnet failures so session
-        # may not exist if the TCS is unreachable.
-        if (np.abs(self.dx_arcs) < 10 and np.abs(self.dy_arcs) < 10
-                and hasattr(self, 'session')):
-            self.offset_to_TCS(np.round(self.dx_arcs, 2), np.round(self.dy_arcs, 2))
+    def run(self, data, target=None, subframe=None, t_frame=None, now=None):
+        if self.measure(data, target=target, subframe=subframe, t_frame=t_frame) is None:
+            return
+        # Fix upstream bug: second condition was checking dx_arcs twice (see correct()).
+        # Guard session: cGuider.connect() swallows socket failures so session
+        # may be None if the TCS is unreachable.
+        if getattr(self, 'session', None) is not None:
+            self.correct(self.dx_arcs, self.dy_arcs, t_frame=t_frame, now=now)
 
 
 # ── Target pixel dialog ───────────────────────────────────────────────────────
@@ -129,6 +150,22 @@ class CameraGUI:
     C_INFO   = '#3498DB'
     C_DIM    = '#7F8C8D'
 
+    # Centroid combobox label -> cGuider.centroid_method
+    CENTROID_METHODS = {"Marginal Std":   'std',
+                        "Center of Mass": 'com',
+                        "Pyramid":        'pyramid',
+                        "Windowed CoM":   'wcom',
+                        "Gaussian Fit":   'gauss',
+                        "Peak Quadratic": 'quad',
+                        "Registration":   'register',
+                        "Multi-star":     'multi'}
+
+    # how the averaged frames are combined: (cFrameStacker mode, shift-and-add)
+    STACK_MODES = {"Mean":          ('mean', False),
+                   "Clipped mean":  ('clip', False),
+                   "Median":        ('median', False),
+                   "Shift-and-add": ('mean', True)}
+
     def __init__(self, root):
         self.root = root
         self.root.title("HIRAX Guiding Camera v2")
@@ -146,9 +183,22 @@ class CameraGUI:
         self.guide_target     = (1870, 1210)   # None = image center; always in full-frame coords
         self.last_centroid    = None   # cached for redraws (image/subframe coords)
         self.last_target      = None
+        self.last_origin      = (0, 0)   # full-frame (col, row) of the displayed image origin
         self._img_x_min       = 0     # full-frame col offset of displayed image origin
         self._img_y_min       = 0     # full-frame row offset of displayed image origin
 
+        self.stacker          = None   # cFrameStacker, built on first use (buffers are reused)
+        self._display_buffer  = None   # pooled frame buffer reference backing current_image
+        self.pipeline         = None   # cGuidePipeline while pipelined capture runs
+        self.latest           = cLatestSlot(on_drop=self._release_frame)   # newest result for the display
+        self.display_rate     = 5.0    # Hz the display refreshes at most, from the camera config once connected
+        self._capture_stop    = None   # threading.Event ending the capture thread's loop
+        self._capture_worker  = None
+        self.preview          = cPreviewPyramid(reduce='max')   # screen-resolution uint8 image
+        self._view            = None   # (shape, (c0, c1, r0, r1)) zoomed region of the image, None = all
+        self._stats           = None   # (image, cFrameStats) of the displayed frame
+        self.saturation       = 65000  # ADU, from the camera config once connected
+
         self.subframe_enabled = False
         self.subframe         = [1870, 1210, 256, 256]   # [x_col_center, y_row_center, w, h]
         self.full_frame_size  = [4096, 2160]
@@ -157,6 +207,7 @@ class CameraGUI:
 
         self._apply_style()
         self._build_ui()
+        self._render_tick()
 
     # ── Style ─────────────────────────────────────────────────────────────────
 
@@ -241,6 +292,15 @@ class CameraGUI:
             sb.bind('<FocusOut>', lambda _e: self.update_subframe_display())
             setattr(self, attr, sb)
 
+        self.tracking_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(ctrl, text="Track ROI", variable=self.tracking_var,
+                        command=self._on_tracking_change).grid(row=1, column=9, padx=(15, 5), pady=3)
+
+        # overlap exposure, centroiding and TCS I/O on separate threads in continuous mode
+        self.pipelined_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(ctrl, text="Pipelined", variable=self.pipelined_var).grid(
+            row=1, column=10, columnspan=2, padx=5, pady=3, sticky=tk.W)
+
         # Row 2: guiding + guide target
         self.guiding_button = ttk.Button(ctrl, text="Start Guiding",
                                          command=self.toggle_guiding, style="Accent.TButton")
@@ -260,7 +320,7 @@ class CameraGUI:
         self.centroid_method_var = tk.StringVar(value="Marginal Std")
         self.centroid_combo = ttk.Combobox(
             ctrl, textvariable=self.centroid_method_var,
-            values=["Marginal Std", "Center of Mass"],
+            values=list(self.CENTROID_METHODS),
             state="readonly", width=14
         )
         self.centroid_combo.grid(row=2, column=7, padx=5, pady=3)
@@ -276,6 +336,11 @@ class CameraGUI:
         ttk.Spinbox(ctrl, from_=1, to=20, increment=1,
                     textvariable=self.avg_frames_var, width=4).grid(row=2, column=11, padx=5, pady=3)
 
+        ttk.Label(ctrl, text="Combine:").grid(row=2, column=12, padx=(10, 2), pady=3, sticky=tk.E)
+        self.stack_mode_var = tk.StringVar(value="Mean")
+        ttk.Combobox(ctrl, textvariable=self.stack_mode_var, values=list(self.STACK_MODES),
+                     state="readonly", width=12).grid(row=2, column=13, padx=5, pady=3)
+
         # Row 3: scale
         ttk.Label(ctrl, text="Scale:").grid(row=3, column=0, padx=5, pady=3, sticky=tk.E)
         self.scale_var = tk.StringVar(value="Auto (99%)")
@@ -317,6 +382,7 @@ class CameraGUI:
         self.centroid_label    = _stat(stats, "Centroid:", 1, 0)
         self.pixel_coord_label = _stat(stats, "Cursor:",   1, 2)
         self.pixel_flux_label  = _stat(stats, "Flux:",     1, 4)
+        self.background_label  = _stat(stats, "Bkg:",      1, 6)
 
         self.status_label = ttk.Label(stats, text="Ready", foreground=self.C_GOOD)
         self.status_label.grid(row=2, column=0, columnspan=8, padx=5, pady=2, sticky=tk.W)
@@ -335,7 +401,10 @@ class CameraGUI:
 
         self.canvas.mpl_connect('motion_notify_event', self.on_mouse_move)
         self.canvas.mpl_connect('button_press_event', self.on_image_click)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.mpl_connect('scroll_event', self.on_scroll)
 
+        self._init_artists()
         self._display_blank()
 
     # ── Camera ────────────────────────────────────────────────────────────────
@@ -344,6 +413,9 @@ class CameraGUI:
         if self.camera_connected:
             if self.guiding_active:
                 self.toggle_guiding()
+            self._stop_pipeline(wait=True)   # the acquire stage must let go of the camera first
+            self._stop_capture(wait=True)
+            self.latest.clear()
             self.camera.disconnect()
             try:
                 self.guider.disconnect()
@@ -357,6 +429,8 @@ class CameraGUI:
         else:
             try:
                 self.camera = cFLIR(self.current_night)
+                self.saturation = self.camera.config.get('saturation', 65000)
+                self.display_rate = self.camera.config.get('display_rate', 5.0)
                 self.camera.connect()
                 self.camera_connected = True
                 self.camera_status_label.config(text="CONNECTED", foreground=self.C_GOOD)
@@ -367,6 +441,8 @@ class CameraGUI:
                 return
             # Connect to TCS independently of guiding state
             self.guider = EnhancedGuider(self.current_night)
+            self.guider.tracking = self.tracking_var.get()
+            self._on_centroid_method_change()
             self.guider.connect()
             if self.guider.session is not None:
                 self.status_label.config(text="Camera + TCS connected", foreground=self.C_GOOD)
@@ -390,6 +466,25 @@ class CameraGUI:
             self.pixel_coord_label.config(text="(-, -)")
             self.pixel_flux_label.config(text="N/A")
 
+    def on_scroll(self, event):
+        """Mouse wheel zooms the view around the cursor (by 2x per step); zooming out returns to the whole frame."""
+        if event.inaxes != self.ax or self.current_image is None:
+            return
+        nrows, ncols = self.current_image.shape
+        c0, c1, r0, r1 = self._view[1] if self._view is not None else (0, ncols, 0, nrows)
+        scale = 0.5 if event.button == 'up' else 2.0
+        w = min(max((c1 - c0) * scale, 16), ncols)
+        h = min(max((r1 - r0) * scale, 16), nrows)
+        if w >= ncols and h >= nrows:
+            self._view = None
+        else:
+            # keep the pixel under the cursor where it is
+            cx, cy = event.xdata - self._img_x_min, event.ydata - self._img_y_min
+            c0 = int(np.clip(cx - (cx - c0) * scale, 0, ncols - w))
+            r0 = int(np.clip(cy - (cy - r0) * scale, 0, nrows - h))
+            self._view = (self.current_image.shape, (c0, c0 + int(w), r0, r0 + int(h)))
+        self._redraw()
+
     def on_image_click(self, event):
         """Left-click on image to propose a new guide target (stores full-frame coords).
 
@@ -425,12 +520,87 @@ class CameraGUI:
 
     # ── Display helpers ───────────────────────────────────────────────────────
 
+    def _init_artists(self):
+        """
+        Create the image, colorbar and overlay artists once; frames only update them.
+
+        The image and overlays are animated: a full canvas draw (new extent, scale,
+        title or legend, window resize) renders everything else and _on_draw keeps
+        it as the background, so a new frame is just restore + draw image and
+        overlays + blit of the axes.
+
+        The image shows the uint8 screen-resolution preview of the frame (see
+        cPreviewPyramid); the colorbar has its own mappable in counts.
+        """
+        ax = self.ax
+        self.im = ax.imshow(np.zeros((256, 256), dtype=np.uint8), cmap='inferno', origin='lower',
+                            vmin=0, vmax=255, animated=True)
+        self.scale_map = ScalarMappable(Normalize(0, 1), cmap='inferno')
+        self.colorbar = self.figure.colorbar(self.scale_map, ax=ax, label='Counts')
+        self.colorbar.ax.yaxis.label.set_color('#AAB7B8')
+        self.colorbar.ax.tick_params(colors='#AAB7B8', labelsize=8)
+
+        # subframe box on the full-frame view
+        self.subframe_box = ax.add_patch(Rectangle((0, 0), 1, 1, linewidth=2, edgecolor='cyan',
+                                                   facecolor='none', animated=True, visible=False))
+        # guide target (green circle + crosshair), centroid X and correction arrow
+        self.target_cross, = ax.plot([], [], '+', color=self.C_GOOD, markersize=16,
+                                     markeredgewidth=2, zorder=5, animated=True)
+        self.target_ring,  = ax.plot([], [], 'o', color=self.C_GOOD, markersize=16,
+                                     markeredgewidth=2, fillstyle='none', zorder=5, animated=True)
+        self.centroid_mark, = ax.plot([], [], 'x', color=self.C_BAD, markersize=18,
+                                      markeredgewidth=2.5, zorder=6, animated=True)
+        self.offset_arrow = ax.annotate('', xy=(0, 0), xytext=(0, 0), zorder=7, animated=True,
+                                        visible=False, annotation_clip=True,
+                                        arrowprops=dict(arrowstyle='->', color='#F39C12',
+                                                        lw=2.0, mutation_scale=20))
+        self.offset_label = ax.text(0, 0, '', color='#F39C12', fontsize=8, zorder=7,
+                                    animated=True, visible=False, clip_on=True,
+                                    bbox=dict(boxstyle='round,pad=0.2', fc='#0D1117', alpha=0.75,
+                                              ec='none'))
+        self._animated = [self.im, self.subframe_box, self.target_cross, self.target_ring,
+                          self.centroid_mark, self.offset_arrow, self.offset_label]
+        self._legend_key = None    # (centroid shown, target shown) of the current legend
+        self._background = None    # axes pixels without the animated artists
+        self._style_axes()
+
+    def _on_draw(self, event):
+        """after a full draw: keep the background and put the animated artists back on top"""
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self._animated:
+            self.ax.draw_artist(artist)
+        # the image covers the frame's edge pixels and the legend
+        for artist in list(self.ax.spines.values()) + [self.ax.get_legend()]:
+            if artist is not None:
+                self.ax.draw_artist(artist)
+
+    def _screen_size(self):
+        """(width, height) of the axes in screen pixels, the resolution the preview is built for"""
+        bbox = self.ax.bbox
+        return max(int(bbox.width), 1), max(int(bbox.height), 1)
+
+    def _blit(self):
+        """redraw only the image and overlays"""
+        if self._background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_animated()
+        self.canvas.blit(self.ax.bbox)
+
     def _display_blank(self):
-        self.ax.clear()
-        self.ax.imshow(np.zeros((256, 256)), cmap='inferno', origin='lower')
+        self.im.set_data(np.zeros((256, 256), dtype=np.uint8))
+        self.im.set_extent((-0.5, 255.5, -0.5, 255.5))
+        self.ax.set_xlim(-0.5, 255.5)
+        self.ax.set_ylim(-0.5, 255.5)
+        for artist in self._animated[1:]:
+            artist.set_visible(False)
+        self._set_legend(False, False)
         self.ax.set_title("No Image — Click 'Capture Image'", color='white')
-        self._style_axes()
-        self.canvas.draw()
+        self.canvas.draw_idle()
 
     def _style_axes(self):
         """Apply dark theme and N/S/E/W labels to current axes.
@@ -459,8 +629,9 @@ class CameraGUI:
             self.vmax_entry.config(state=tk.NORMAL)
             self.apply_scale_button.config(state=tk.NORMAL)
             if self.current_image is not None:
-                self.vmin_var.set(str(int(np.min(self.current_image))))
-                self.vmax_var.set(str(int(np.percentile(self.current_image, 99))))
+                stats = self._frame_stats(self.current_image)
+                self.vmin_var.set(str(int(stats.min)))
+                self.vmax_var.set(str(int(stats.percentile(99))))
         else:
             self.vmin_entry.config(state=tk.DISABLED)
             self.vmax_entry.config(state=tk.DISABLED)
@@ -486,16 +657,24 @@ class CameraGUI:
                 return float(self.vmin_var.get()), float(self.vmax_var.get())
             except ValueError:
                 pass
+        stats = self._frame_stats(image)
         if mode == "Auto (95%)":
-            return 0, np.percentile(image, 95)
+            return 0, stats.percentile(95)
         if mode == "Min-Max":
-            return np.min(image), np.max(image)
-        return 0, np.percentile(image, 99)   # default Auto 99%
+            return stats.min, stats.max
+        return 0, stats.percentile(99)   # default Auto 99%
+
+    def _frame_stats(self, image, buffer=None):
+        """cFrameStats of image, computed once per frame (and shared through its pooled buffer)"""
+        if self._stats is None or self._stats[0] is not image:
+            self._stats = (image, cFrameStats.of(image, buffer, self.saturation))
+        return self._stats[1]
 
     # ── Subframe ──────────────────────────────────────────────────────────────
 
     def toggle_subframe(self):
         self.subframe_enabled = self.subframe_var.get()
+        self._reset_lock()
         msg = "Subframe mode enabled" if self.subframe_enabled else "Full frame mode"
         self.status_label.config(text=msg,
                                  foreground=self.C_INFO if self.subframe_enabled else self.C_GOOD)
@@ -509,16 +688,29 @@ class CameraGUI:
             return
         if self.subframe_var.get():
             self._redraw()
+        self._reset_lock()
+
+    def _on_tracking_change(self):
+        if hasattr(self, 'guider'):
+            self.guider.tracking = self.tracking_var.get()
+            self.guider.reset_lock()
+
+    def _reset_lock(self):
+        """Drop the ROI lock / registration reference so the next guide frame starts fresh."""
+        if hasattr(self, 'guider'):
+            self.guider.reset_lock()
 
     def _on_centroid_method_change(self, _event=None):
-        method = 'com' if self.centroid_method_var.get() == "Center of Mass" else 'std'
-        if self.guiding_active and hasattr(self, 'guider'):
+        method = self.CENTROID_METHODS.get(self.centroid_method_var.get(), 'std')
+        if hasattr(self, 'guider'):
             self.guider.centroid_method = method
+            self.guider.reset_lock()
 
     # ── Guiding ───────────────────────────────────────────────────────────────
 
     def toggle_guiding(self):
         self.guiding_active = not self.guiding_active
+        self._reset_lock()
         if self.guiding_active:
             self.guiding_button.config(text="Stop Guiding")
             self.guiding_status_label.config(text="Guiding: ON", foreground=self.C_GOOD)
@@ -531,6 +723,8 @@ class CameraGUI:
             self.guiding_status_label.config(text="Guiding: OFF", foreground=self.C_BAD)
             self.status_label.config(text="Guiding stopped", foreground=self.C_WARN)
             self.guide_error_label.config(text="N/A")
+            if not self.continuous_var.get():
+                self._stop_capture()
             self.last_centroid = None
             self.last_target   = None
             self._redraw()
@@ -565,85 +759,319 @@ class CameraGUI:
                              int(self.subframe_w.get()), int(self.subframe_h.get())]
         except ValueError:
             pass
-        threading.Thread(target=self._capture_thread, daemon=True).start()
+        self.guide_interval = self.interval_var.get()
+        self.latest.reset_stats()
+        continuous = self.continuous_var.get() or self.guiding_active
+        if self.pipelined_var.get() and continuous:
+            self._start_pipeline()
+            return
+        self._capture_stop = threading.Event()
+        if not continuous:
+            self._capture_stop.set()   # one frame
+        self._capture_worker = threading.Thread(target=self._capture_thread,
+                                                args=(self._capture_stop,), daemon=True)
+        self._capture_worker.start()
+
+    def _capture_thread(self, stop):
+        """
+        Capture, archive and guide until stop is set, paced to the guide interval
+        (back to back when not guiding). Results go to the display slot, which
+        shows them at its own rate, so the display never holds up the camera.
+        """
+        try:
+            while True:
+                t_start = time.monotonic()
+                self._capture_cycle()
+                interval = self.guide_interval if self.guiding_active else 0.0
+                if stop.wait(max(t_start + interval - time.monotonic(), 0)):
+                    break
+        except Exception as e:
+            self.root.after(0, self._show_error, str(e))
+            return
+        self.root.after(0, self._capture_done)
 
-    def _capture_thread(self):
+    def _capture_cycle(self):
+        """one sequential acquire / archive / measure / command cycle"""
+        frame = None
         try:
-            header_keys = {}
-            if hasattr(self, 'guider') and self.guider.session is not None:
-                try:
-                    header_keys = self.guider.get_telemetry()
-                except Exception as e:
-                    print(f"[telemetry ERROR] {type(e).__name__}: {e}")
-            
-            header_keys['EXPTIME'] = self.exposure_time
-
-            # Centroid from the previous guide cycle (lag of one cycle by necessity,
-            # since the centroid is computed after the frames are saved).
-            if (self.guiding_active and hasattr(self, 'guider')
-                    and hasattr(self.guider, 'xcentroid')):
-                header_keys['GDRXCEN'] = float(self.guider.xcentroid)
-                header_keys['GDRYCEN'] = float(self.guider.ycentroid)
-
-            n_avg      = int(self.avg_frames_var.get()) if self.guiding_active else 1
-            write_file = self.write_var.get()
-            source     = self.source_var.get()
-            use_sub    = self.subframe_var.get()
-            sub        = self.subframe if use_sub else None
-
-            accumulated = None
-            for _ in range(n_avg):
-                # Never write individual frames here — writing to disk between
-                # exposures in this tight loop was stalling long enough to trip
-                # the camera's heartbeat timeout and disconnect it. Only the
-                # final averaged frame is saved, below.
-                self.camera.expose(self.exposure_time * 1e6,
-                                   source=source,
-                                   writeToFile=False,
-                                   subframe=sub,
-                                   header_keys=header_keys)
-                time.sleep(0.001)
-                if use_sub:
-                    x, y, w, h = self.subframe
-                    frame = self.camera.raw_data[y - h//2:y + h//2, x - w//2:x + w//2]
-                else:
-                    frame = self.camera.raw_data
-                accumulated = frame.astype(float) if accumulated is None else accumulated + frame
-
-            image = (accumulated / n_avg).astype(frame.dtype)
-
-            if write_file:
-                avg_header = dict(header_keys)
-                avg_header['TARGET'] = source
-                avg_header['NAVG'] = (n_avg, 'number of frames averaged')
-                self.camera.writeArrayToFile(image, header_keys=avg_header,
-                                             subframe_meta=sub,
-                                             tag="_avg" if n_avg > 1 else "")
-
-            centroid = None
-            target   = None
+            t0 = stage_timer.start()
+            frame = self._acquire_frame()
+            self._archive_frame(frame)
+            result = self._measure_frame(frame)
+            frame = None   # the result holds the buffer reference now
+            try:
+                self._command_offset(result)
+            finally:
+                # the display takes over the buffer reference (shown even if the offset failed)
+                self.latest.post(result)
+            stage_timer.stop('cycle', t0)
+        except Exception:
+            if frame is not None:
+                self._release_frame(frame)
+            raise
 
-            if self.guiding_active:
-                nrows, ncols = image.shape
-                # guide_target is in full-frame coords; guider needs image (subframe) coords
-                x_min = self.subframe[0] - self.subframe[2] // 2 if self.subframe_enabled else 0
-                y_min = self.subframe[1] - self.subframe[3] // 2 if self.subframe_enabled else 0
-                if self.guide_target is not None:
-                    target = (self.guide_target[0] - x_min, self.guide_target[1] - y_min)
-                else:
-                    target = (ncols // 2, nrows // 2)
-                self.guider.run(image, target=target)
-                centroid = (self.guider.xcentroid, self.guider.ycentroid)
-
-            self.root.after(0, self._update_display, image, centroid, target)
+    def _capture_done(self):
+        self._capture_worker = None
+        self.capturing = False
+        self.capture_button.config(state=tk.NORMAL)
+        self.status_label.config(text="Guiding active" if self.guiding_active else "Ready",
+                                 foreground=self.C_GOOD)
 
+    def _stop_capture(self, wait=False):
+        """end the (non-pipelined) capture loop after its current frame"""
+        if self._capture_stop is not None:
+            self._capture_stop.set()
+        worker = self._capture_worker
+        if wait and worker is not None:
+            worker.join(10.0)
+
+    def _acquire_frame(self):
+        """Fetch telemetry, expose (and average) one guide frame. Runs off the Tk thread."""
+        t0 = stage_timer.start()
+        n_avg      = int(self.avg_frames_var.get()) if self.guiding_active else 1
+        t_mid      = time.time() + 0.5 * n_avg * self.exposure_time
+        header_keys = {}
+        if hasattr(self, 'guider') and self.guider.session is not None:
+            try:
+                # served from the background poller, interpolated to mid-exposure
+                header_keys = self.guider.telemetry(t_mid)
+            except Exception as e:
+                print(f"[telemetry ERROR] {type(e).__name__}: {e}")
+
+        header_keys['EXPTIME'] = self.exposure_time
+
+        # Centroid from the previous guide cycle (lag of one cycle by necessity,
+        # since the centroid is computed after the frames are saved).
+        if (self.guiding_active and hasattr(self, 'guider')
+                and hasattr(self.guider, 'xcentroid')):
+            header_keys['GDRXCEN'] = float(self.guider.xcentroid)
+            header_keys['GDRYCEN'] = float(self.guider.ycentroid)
+
+        write_file = self.write_var.get()
+        source     = self.source_var.get()
+        use_sub    = self.subframe_var.get()
+        sub        = list(self.subframe) if use_sub else None
+        write_each = write_file and n_avg > 1 and self.camera.config.get('write_each_frame', False)
+
+        stacker = self._get_stacker()
+        stacker.start()
+        for _ in range(n_avg):
+            # Individual frames are only queued here (write_each_frame): the
+            # camera's background FITS writer does the disk I/O, which used to
+            # stall this loop long enough to trip the camera's heartbeat timeout.
+            # The (averaged) guide frame is saved by _archive_frame.
+            self.camera.expose(self.exposure_time * 1e6,
+                               source=source,
+                               writeToFile=write_each,
+                               subframe=sub,
+                               header_keys=header_keys)
+            time.sleep(0.001)
+            # with hardware_roi the camera already read out (about) the subframe only
+            frame, origin = self.camera.crop(sub)
+            if n_avg == 1:
+                break
+            stacker.add(frame)
+
+        # a single frame is used in place (a reference keeps its pooled buffer from being
+        # reused), an average is written into a pooled buffer of its own
+        if n_avg == 1:
+            buffer = self.camera.frame.retain()
+            image = frame
+        else:
+            buffer = self.camera.pool.get(frame.shape)
+            stacker.result(out=buffer.writable)
+            image = buffer.array
+        # the archive reference is kept apart from 'buffer': with the pipeline the same
+        # dict goes to the archive and process stages, which release independently
+        archive = buffer.retain() if write_file else None   # handed to the FITS writer
+        stage_timer.stop('acquire', t0)
+        return {'image': image, 'header_keys': header_keys, 'n_avg': n_avg, 't_mid': t_mid,
+                'write': write_file, 'source': source, 'sub': sub, 'origin': origin,
+                'buffer': buffer, 'archive': archive}
+
+    @staticmethod
+    def _release_frame(item, key='buffer'):
+        """give back the pooled buffer reference held by a frame / result dict (once)"""
+        buffer = item.pop(key, None)
+        if buffer is not None:
+            buffer.release()
+
+    def _get_stacker(self):
+        """cFrameStacker for the selected combine mode (kept between cycles so its buffers are reused)"""
+        mode, register = self.STACK_MODES.get(self.stack_mode_var.get(), ('mean', False))
+        if self.stacker is None or (self.stacker.mode, self.stacker.register) != (mode, register):
+            config = self.camera.config
+            self.stacker = cFrameStacker(mode=mode, register=register,
+                                         depth=config.get('stack_depth', 5),
+                                         nsigma=config.get('stack_nsigma', 3.0))
+        return self.stacker
+
+    def _archive_frame(self, frame):
+        """Queue the (averaged) frame on the FITS writer if 'Write to File' was on when it was taken."""
+        if not frame['write']:
+            return
+        t0 = stage_timer.start()
+        try:
+            n_avg = frame['n_avg']
+            avg_header = dict(frame['header_keys'])
+            avg_header['TARGET'] = frame['source']
+            avg_header['NAVG'] = (n_avg, 'number of frames averaged')
+            # subframe as saved (it is clipped at the sensor edge)
+            nrows, ncols = frame['image'].shape
+            x0, y0 = frame['origin']
+            sub_meta = (x0 + ncols // 2, y0 + nrows // 2, ncols, nrows) if frame['sub'] is not None else None
+            self.camera.writeArrayToFile(frame['image'], header_keys=avg_header,
+                                         subframe_meta=sub_meta,
+                                         tag="_avg" if n_avg > 1 else "",
+                                         buffer=frame.pop('archive'))   # released by the writer
+        finally:
+            self._release_frame(frame, 'archive')   # only if it never reached the writer
+        stage_timer.stop('archive', t0)
+
+    def _measure_frame(self, frame):
+        """Centroid a frame against the guide target; returns a result dict for _command_offset/display."""
+        image = frame['image']
+        result = {'image': image, 'centroid': None, 'target': None, 't_mid': frame['t_mid'],
+                  'origin': frame['origin'], 'buffer': frame['buffer']}
+        if not self.guiding_active:
+            return result
+
+        nrows, ncols = image.shape
+        # guide_target is in full-frame coords; guider needs image (subframe) coords
+        x_min, y_min = frame['origin']
+        if self.guide_target is not None:
+            target = (self.guide_target[0] - x_min, self.guide_target[1] - y_min)
+        else:
+            target = (ncols // 2, nrows // 2)
+        result['target'] = target
+
+        t0 = stage_timer.start()
+        try:
+            measured = self.guider.measure(image, target=target, t_frame=frame['t_mid'])
+        except Exception:
+            self._release_frame(frame)   # the frame won't reach the display
+            raise
+        if measured is not None:
+            result['centroid'] = (self.guider.xcentroid, self.guider.ycentroid)
+            result['dx_arcs'], result['dy_arcs'] = self.guider.dx_arcs, self.guider.dy_arcs
+            result['log_seq'] = self.guider.log_seq
+        stage_timer.stop('measure', t0)
+        return result
+
+    def _command_offset(self, result):
+        """Send the correction measured by _measure_frame to the TCS."""
+        if result['centroid'] is None or not self.guiding_active:
+            return
+        # Guard session: cGuider.connect() swallows socket failures so session
+        # may be None if the TCS is unreachable.
+        if getattr(self.guider, 'session', None) is not None:
+            t0 = stage_timer.start()
+            self.guider.correct(result['dx_arcs'], result['dy_arcs'], t_frame=result['t_mid'],
+                                seq=result['log_seq'])
+            stage_timer.stop('command', t0)
+
+    # ── Pipelined capture ─────────────────────────────────────────────────────
+
+    def _start_pipeline(self):
+        """Run acquisition, centroiding and TCS offsets on separate threads (see cGuidePipeline)."""
+        self._last_acquire = 0.0
+
+        def _acquire():
+            # pace to the guide interval; with interval 0 the camera exposes back to back
+            interval = self.guide_interval if self.guiding_active else 0.0
+            wait = self._last_acquire + interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_acquire = time.monotonic()
+            return self._acquire_frame()
+
+        self.pipeline = cGuidePipeline(acquire=_acquire,
+                                       process=self._measure_frame,
+                                       command=self._command_offset,
+                                       archive=self._archive_frame,
+                                       on_result=self.latest.post,
+                                       on_drop=self._release_frame,
+                                       logger=self.camera.logger)
+        # keep the camera acquiring between frames: expose() then only picks up the
+        # next frame and touches the camera when the exposure or subframe changes
+        try:
+            self.camera.start_stream(self.exposure_time * 1e6,
+                                     list(self.subframe) if self.subframe_var.get() else None)
         except Exception as e:
-            self.root.after(0, self._show_error, str(e))
+            self.camera.logger.warning(f'Streaming unavailable, exposing frame by frame: {e}')
+        self.pipeline.start()
+        self.status_label.config(text="Pipelined capture running", foreground=self.C_INFO)
+
+    def _stop_pipeline(self, wait=False):
+        if self.pipeline is not None:
+            pipeline, self.pipeline = self.pipeline, None
+
+            def _stop():
+                pipeline.stop()
+                if self.pipeline is None:   # not restarted meanwhile
+                    self.camera.stop_stream()
+
+            if wait:
+                _stop()
+            else:
+                # stop off the Tk thread: draining the archive queue may take a while
+                threading.Thread(target=_stop, daemon=True).start()
+        self.capturing = False
+        self.capture_button.config(state=tk.NORMAL)
 
     # ── Main display update ───────────────────────────────────────────────────
 
-    def _update_display(self, image, centroid=None, target=None):
+    def _render_tick(self):
+        """
+        Show the newest result, at most display_rate times a second. Capture and
+        guiding post every result to self.latest and carry on; results arriving
+        faster than the display refreshes replace each other there (counted as
+        dropped), so a slow redraw costs frames on screen, not guide cycles.
+        """
+        t0 = time.monotonic()
+        try:
+            result = self.latest.take()
+            if result is not None:
+                self._update_display(result['image'], result['centroid'], result['target'],
+                                     result['origin'], result.pop('buffer', None))
+                self._show_capture_status()
+        finally:
+            period = 1.0 / max(self.display_rate, 0.1)
+            delay = max(period - (time.monotonic() - t0), 0.001)
+            self.root.after(int(1000 * delay), self._render_tick)
+
+    def _show_capture_status(self):
+        """status bar after a new frame: capture / pipeline throughput and frames shown / dropped"""
+        if self.capturing:
+            try:
+                self.guide_interval = self.interval_var.get()
+            except tk.TclError:
+                pass
+        if self.pipeline is not None:
+            # frames keep arriving from the pipeline; show per-stage throughput instead
+            status = self.pipeline.format_stats()
+            writer = self.camera.writer.stats()
+            if writer['submitted']:
+                status += (f" | disk queue {writer['depth']}/{self.camera.writer.queue.maxsize}"
+                           f" blocked {writer['blocked_s']:.1f}s")
+        else:
+            status = "Guiding active" if self.guiding_active else ("Capturing" if self.capturing else "Ready")
+        if self.capturing:
+            status += f" | display {self.latest.format_stats()}"
+        self.status_label.config(text=status, foreground=self.C_GOOD)
+
+    def _update_display(self, image, centroid=None, target=None, origin=None, buffer=None):
+        """
+        origin: full-frame (col, row) of image[0, 0] (default: that of the last frame)
+        buffer: pooled buffer reference backing image, held until the next image replaces it
+        """
+        if buffer is not None:
+            if self._display_buffer is not None:
+                self._display_buffer.release()
+            self._display_buffer = buffer
         self.current_image = image
+        if origin is not None:
+            self.last_origin = origin
         # Cache for redraws (scale change, subframe toggle, etc.)
         if centroid is not None:
             self.last_centroid = centroid
@@ -651,13 +1079,15 @@ class CameraGUI:
             self.last_target = target
 
         nrows, ncols = image.shape
-        peak = np.max(image)
-        mean = np.mean(image)
-        mn   = np.min(image)
+        stats = self._frame_stats(image, buffer)
 
-        self.peak_flux_label.config(text=f"{peak:.1f}")
-        self.mean_flux_label.config(text=f"{mean:.1f}")
-        self.min_flux_label.config(text=f"{mn:.1f}")
+        self.peak_flux_label.config(text=f"{stats.max:.1f}")
+        self.mean_flux_label.config(text=f"{stats.mean:.1f}")
+        self.min_flux_label.config(text=f"{stats.min:.1f}")
+        bkg = f"{stats.background:.1f} ± {stats.noise:.1f}"
+        if stats.n_saturated:
+            bkg += f"   sat {100 * stats.saturated:.3f}%"
+        self.background_label.config(text=bkg, foreground=self.C_BAD if stats.n_saturated else '')
 
         if self.guiding_active and hasattr(self, 'guider'):
             dx_a = getattr(self.guider, 'dx_arcs', None)
@@ -666,12 +1096,7 @@ class CameraGUI:
                 # EW = dy_arcs, NS = -dx_arcs  (from offset_to_TCS)
                 self.guide_error_label.config(text=f"EW {dy_a:+.2f}\"  NS {-dx_a:+.2f}\"")
         if centroid:
-            self.centroid_label.config(text=f"({centroid[0]}, {centroid[1]})")
-
-        # ── Clear axes and draw image ──
-        if hasattr(self, 'colorbar'):
-            self.colorbar.remove()
-        self.ax.clear()
+            self.centroid_label.config(text=f"({centroid[0]:.1f}, {centroid[1]:.1f})")
 
         vmin, vmax = self._get_scale_limits(image)
 
@@ -681,27 +1106,42 @@ class CameraGUI:
         ff_ncols, ff_nrows = self.full_frame_size   # [4096, 2160]
         image_is_subframe = (ncols < ff_ncols or nrows < ff_nrows)
 
-        if image_is_subframe:
-            sf_x, sf_y, sf_w, sf_h = self.subframe
-            x_min = sf_x - sf_w // 2
-            y_min = sf_y - sf_h // 2
-            x_max = sf_x + sf_w // 2
-            y_max = sf_y + sf_h // 2
-        else:
-            x_min, y_min = 0, 0
-            x_max, y_max = ncols, nrows
+        # The camera reports where the frame sits on the sensor (the subframe may
+        # be clipped at the edge), so the extent follows the frame itself.
+        x_min, y_min = self.last_origin
+        x_max, y_max = x_min + ncols, y_min + nrows
         self._img_x_min = x_min
         self._img_y_min = y_min
 
-        im = self.ax.imshow(image, cmap='inferno', origin='lower', vmin=vmin, vmax=vmax,
-                            extent=[x_min, x_max, y_min, y_max])
+        # ── Image: screen-resolution preview of the view, in the existing artist ──
+        # anything outside the axes (ticks, colorbar, title, legend) needs a full draw,
+        # otherwise only the axes are blitted
+        full_draw = False
+        if self._clim_changed(vmin, vmax):
+            self.scale_map.set_clim(vmin, vmax)
+            full_draw = True
+        if image is not self.preview.image:
+            self.preview.set_frame(image)
+        self.preview.set_scale(*self.scale_map.get_clim())
+        if self._view is not None and self._view[0] != image.shape:
+            self._view = None   # zoomed into a frame of another size
+        view = self._view[1] if self._view is not None else (0, ncols, 0, nrows)
+        data, (c0, c1, r0, r1) = self.preview.render(view, self._screen_size())
+        self.im.set_data(data)
+        extent = (x_min + c0, x_min + c1, y_min + r0, y_min + r1)
+        if tuple(self.im.get_extent()) != extent:
+            self.im.set_extent(extent)
+        limits = (x_min + view[0], x_min + view[1]), (y_min + view[2], y_min + view[3])
+        if (self.ax.get_xlim(), self.ax.get_ylim()) != limits:
+            self.ax.set_xlim(*limits[0])
+            self.ax.set_ylim(*limits[1])
+            full_draw = True
 
         # ── Subframe box overlay on full-frame view ──
+        self.subframe_box.set_visible(not image_is_subframe)
         if not image_is_subframe:
             sf_x, sf_y, sf_w, sf_h = self.subframe
-            self.ax.add_patch(Rectangle((sf_x - sf_w // 2, sf_y - sf_h // 2),
-                                        sf_w, sf_h, linewidth=2,
-                                        edgecolor='cyan', facecolor='none'))
+            self.subframe_box.set_bounds(sf_x - sf_w // 2, sf_y - sf_h // 2, sf_w, sf_h)
 
         # ── Guide target marker (green circle + crosshair) ──
         # guide_target is in full-frame coords — plot directly.
@@ -713,86 +1153,93 @@ class CameraGUI:
         else:
             disp_target = None
 
-        if disp_target is not None:
-            tx, ty = disp_target
-            self.ax.plot(tx, ty, '+', color=self.C_GOOD, markersize=16,
-                         markeredgewidth=2, zorder=5, label='Guide target')
-            self.ax.plot(tx, ty, 'o', color=self.C_GOOD, markersize=16,
-                         markeredgewidth=2, fillstyle='none', zorder=5)
+        for marker in (self.target_cross, self.target_ring):
+            marker.set_data(*(([disp_target[0]], [disp_target[1]]) if disp_target is not None else ([], [])))
+            marker.set_visible(disp_target is not None)
 
         # ── Centroid X and correction arrow ──
         # centroid is in image (subframe) coords — shift to full-frame for display.
+        self.centroid_mark.set_visible(centroid is not None)
+        self.offset_arrow.set_visible(False)
+        self.offset_label.set_visible(False)
         if centroid is not None:
             cx = centroid[0] + x_min
             cy = centroid[1] + y_min
-            self.ax.plot(cx, cy, 'x', color=self.C_BAD, markersize=18,
-                         markeredgewidth=2.5, zorder=6, label='Centroid')
+            self.centroid_mark.set_data([cx], [cy])
 
             if disp_target is not None:
                 tx, ty = disp_target
                 ddx, ddy = tx - cx, ty - cy
                 dist = np.sqrt(ddx**2 + ddy**2)
                 if dist > 0.5:
-                    self.ax.annotate(
-                        '', xy=(tx, ty), xytext=(cx, cy),
-                        arrowprops=dict(arrowstyle='->', color='#F39C12',
-                                        lw=2.0, mutation_scale=20),
-                        zorder=7
-                    )
+                    self.offset_arrow.xy = (tx, ty)
+                    self.offset_arrow.set_position((cx, cy))
+                    self.offset_arrow.set_visible(True)
                     # Distance label at midpoint
-                    self.ax.text((cx + tx) / 2 + 3, (cy + ty) / 2 + 3,
-                                 f"{dist:.1f} px", color='#F39C12', fontsize=8, zorder=7,
-                                 bbox=dict(boxstyle='round,pad=0.2', fc='#0D1117', alpha=0.75,
-                                           ec='none'))
+                    self.offset_label.set_position(((cx + tx) / 2 + 3, (cy + ty) / 2 + 3))
+                    self.offset_label.set_text(f"{dist:.1f} px")
+                    self.offset_label.set_visible(True)
 
-        # ── Title ──
+        # ── Title (the peak is in the statistics bar, so it changes with settings only) ──
         parts = []
         if self.source_var.get():
             parts.append(self.source_var.get())
-        parts.append(f"Exp: {self.exposure_time:.1f}s  Peak: {peak:.0f}")
+        parts.append(f"Exp: {self.exposure_time:.1f}s")
         if self.subframe_enabled:
             parts.append(f"Subframe {self.subframe[2]}×{self.subframe[3]}")
         if self.guiding_active:
             parts.append("● GUIDING")
-        self.ax.set_title("   ".join(parts) if parts else "Camera Image")
-
-        self._style_axes()
+        title = "   ".join(parts) if parts else "Camera Image"
+        if title != self.ax.get_title():
+            self.ax.set_title(title)
+            full_draw = True
 
         # ── Legend (only when overlay is active) ──
+        full_draw |= self._set_legend(centroid is not None, disp_target is not None)
+
+        if full_draw:
+            self.canvas.draw_idle()   # _on_draw puts image and overlays back and keeps the background
+        else:
+            self._blit()
+
+    def _set_legend(self, centroid, target):
+        """show a legend for the overlays present; returns True if it changed (full draw needed)"""
+        if (centroid, target) == self._legend_key:
+            return False
+        self._legend_key = (centroid, target)
+        if self.ax.get_legend() is not None:
+            self.ax.get_legend().remove()
         legend_items = []
-        if centroid is not None:
+        if centroid:
             legend_items.append(
                 plt.Line2D([0], [0], marker='x', linestyle='None', color='w',
                            markeredgecolor=self.C_BAD, markersize=10, label='Centroid'))
-        if disp_target is not None:
+        if target:
             legend_items.append(
                 plt.Line2D([0], [0], marker='o', linestyle='None', color='w',
                            markeredgecolor=self.C_GOOD, markerfacecolor='none',
                            markersize=10, label='Guide target'))
         if legend_items:
-            leg = self.ax.legend(handles=legend_items, loc='upper right', fontsize=8,
-                                 facecolor='#1C2733', edgecolor='#2C3E50', labelcolor='white')
-
-        # ── Colorbar ──
-        self.colorbar = self.figure.colorbar(im, ax=self.ax, label='Counts')
-        self.colorbar.ax.yaxis.label.set_color('#AAB7B8')
-        self.colorbar.ax.tick_params(colors='#AAB7B8', labelsize=8)
+            self.ax.legend(handles=legend_items, loc='upper right', fontsize=8,
+                           facecolor='#1C2733', edgecolor='#2C3E50', labelcolor='white')
+        return True
 
-        self.canvas.draw()
+    # auto scale limits move with the noise every frame; the colour scale (and with it
+    # the colorbar, which needs a full draw) only follows changes beyond this fraction
+    CLIM_TOLERANCE = 0.02
 
-        self.status_label.config(text="Guiding active" if self.guiding_active else "Ready",
-                                 foreground=self.C_GOOD)
-        self.capture_button.config(state=tk.NORMAL)
-        self.capturing = False
-
-        if self.continuous_var.get() or self.guiding_active:
-            delay = int(self.interval_var.get() * 1000) if self.guiding_active else 100
-            self.root.after(delay, self.capture_image)
+    def _clim_changed(self, vmin, vmax):
+        cur_min, cur_max = self.scale_map.get_clim()
+        if self.scale_var.get() == "Custom":
+            return (vmin, vmax) != (cur_min, cur_max)
+        tol = self.CLIM_TOLERANCE * max(cur_max - cur_min, 1)
+        return abs(vmin - cur_min) > tol or abs(vmax - cur_max) > tol
 
     def _show_error(self, error_msg):
         self.status_label.config(text=f"Error: {error_msg}", foreground=self.C_BAD)
         self.capture_button.config(state=tk.NORMAL)
         self.capturing = False
+        self._capture_worker = None
 
     # ── Continuous ────────────────────────────────────────────────────────────
 
@@ -801,10 +1248,14 @@ class CameraGUI:
             self.status_label.config(text="Continuous — capturing...", foreground=self.C_INFO)
             self.capture_image()
         elif not self.guiding_active:
+            self._stop_pipeline()
+            self._stop_capture()
             self.status_label.config(text="Ready", foreground=self.C_GOOD)
 
 
 def main():
+    with open(config_file) as f:
+        stage_timer.enabled = (yaml.safe_load(f) or {}).get('latency_stats', True)
     root = tk.Tk()
     app = CameraGUI(root)
     root.mainloop()
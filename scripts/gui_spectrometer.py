@@ -9,12 +9,14 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
 from matplotlib.figure import Figure
 import threading
+import time
 from datetime import datetime, timezone
 import sys
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils" ))
 from cH4RPro import cH4RPro
+from cPipeline import cLatestSlot
 
 
 class SpectrometerGUI:
@@ -35,6 +37,11 @@ class SpectrometerGUI:
         self.capturing = False
         self.continuous_mode = False
         
+        # Acquisition runs on its own thread; the plot shows the newest spectrum
+        # at most display_rate times a second and skips the rest
+        self.latest = cLatestSlot()
+        self.display_rate = 5.0  # Hz
+        
         # Wavelength range limits
         self.wl_min = None
         self.wl_max = None
@@ -51,6 +58,7 @@ class SpectrometerGUI:
         self.use_background = False
         
         self._create_widgets()
+        self._render_tick()
         
     def _create_widgets(self):
         """Create all GUI widgets"""
@@ -444,6 +452,7 @@ class SpectrometerGUI:
         mode_text = "continuously" if self.continuous_mode else ""
         self.status_label.config(text=f"Acquiring spectra {mode_text}...", foreground="orange")
         self.acquire_button.config(state=tk.DISABLED)
+        self.latest.reset_stats()
         
         # Run in background thread
         thread = threading.Thread(target=self._acquire_thread)
@@ -451,31 +460,49 @@ class SpectrometerGUI:
         thread.start()
     
     def _acquire_thread(self):
-        """Background thread for acquisition"""
+        """Background thread for acquisition, looping while continuous mode is on"""
         try:
-            # Get parameters
-            exposure_sec = self.exposure_var.get()
-            integration_time_us = int(exposure_sec * 1e6)
-            num_spectra = self.num_spectra_var.get()
-            self.h4rpro.source = self.source_var.get()
+            while True:
+                # Get parameters
+                exposure_sec = self.exposure_var.get()
+                integration_time_us = int(exposure_sec * 1e6)
+                num_spectra = self.num_spectra_var.get()
+                self.h4rpro.source = self.source_var.get()
 
-            # Acquire spectra
-            wl, flx = self.h4rpro.read_spectra(integration_time_us, num_spectra)
-            
-            # Calculate mean
-            averaged_flux = np.mean(flx, axis=0)
-            
-            # Store data
-            self.current_wl = wl
-            self.current_flux = flx
-            self.averaged_flux = averaged_flux
+                # Acquire spectra
+                wl, flx = self.h4rpro.read_spectra(integration_time_us, num_spectra)
+                
+                # Calculate mean
+                averaged_flux = np.mean(flx, axis=0)
+                
+                # Hand to the display, which picks up the newest at its own rate
+                self.latest.post((wl, flx, averaged_flux))
+                
+                if not (self.continuous_mode and self.connected):
+                    break
             
-            # Update GUI in main thread
-            self.root.after(0, self._update_plot)
+            self.root.after(0, self._acquire_done)
             
         except Exception as e:
             self.root.after(0, self._show_error, str(e))
     
+    def _acquire_done(self):
+        """Acquisition loop finished (single shot, or continuous mode switched off)"""
+        self.acquire_button.config(state=tk.NORMAL)
+        self.capturing = False
+    
+    def _render_tick(self):
+        """Plot the newest spectrum, at most display_rate times a second"""
+        t0 = time.monotonic()
+        try:
+            item = self.latest.take()
+            if item is not None:
+                self.current_wl, self.current_flux, self.averaged_flux = item
+                self._update_plot()
+        finally:
+            delay = max(1.0 / self.display_rate - (time.monotonic() - t0), 0.001)
+            self.root.after(int(1000 * delay), self._render_tick)
+    
     def _update_plot(self):
         """Update the plot with new data"""
         if self.current_wl is None or self.averaged_flux is None:
@@ -530,18 +557,12 @@ class SpectrometerGUI:
         
         self.canvas.draw()
         
-        # Update status
-        status_text = "Continuous acquisition" if self.continuous_mode else "Acquisition complete"
+        # Update status (shown / dropped: spectra plotted / skipped by the capped display rate)
+        if self.continuous_mode and self.capturing:
+            status_text = f"Continuous acquisition | display {self.latest.format_stats()}"
+        else:
+            status_text = "Acquisition complete"
         self.status_label.config(text=status_text, foreground="green")
-        
-        if not self.continuous_mode:
-            self.acquire_button.config(state=tk.NORMAL)
-        
-        self.capturing = False
-        
-        # Continue acquiring if in continuous mode
-        if self.continuous_mode and self.connected:
-            self.root.after(100, self.acquire_spectrum)
     
     def _show_error(self, error_msg):
         """Show error message"""
@@ -0,0 +1,168 @@
+# replay a night's archived guide frames through the guider, offline
+# frames are read from data_dir/<night>/Guider (or --dir) in time order and
+# pushed through cGuider.run (or the GUI's EnhancedGuider) as fast as possible
+# or at their original cadence; offsets go to the local TCS stand-in from
+# tests/test_server.py instead of the telescope. The controller runs on the
+# frames' own clock (GTIME, with the frame read out EXPTIME / 2 later), so its
+# latency, in-flight commands and lead match the night, not the replay's wall time
+#
+# usage
+# python replay_guiding.py 20251208 --method wcom --out replay.csv
+# python replay_guiding.py 20251208 --realtime --speed 4
+# python replay_guiding.py 20251208 --guide-log replay.glog   # keep the replay's guide records
+# python replay_guiding.py 20251208 --config kalman.yaml       # try another controller / tuning
+
+import time, sys, argparse, csv, threading
+import numpy as np
+
+from pathlib import Path
+from datetime import datetime
+from astropy.io import fits
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils" ))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "tests" ))
+from cFLIR import config_file
+from cGuider import cGuider
+from cLatency import stage_timer
+import test_server
+
+# Parse User Inputs
+parser = argparse.ArgumentParser()
+parser.add_argument('night', type=str, help='Night to replay, YYYYMMDD')
+parser.add_argument('--dir', type=str, default=None,
+                    help='Directory of guide_*.fits files (default data_dir/<night>/Guider)')
+parser.add_argument('--method', type=str, default='std', choices=cGuider.METHODS,
+                    help='Centroid method')
+parser.add_argument('--tracking', action='store_true', help='Turn ROI tracking on')
+parser.add_argument('--enhanced', action='store_true',
+                    help='Use the guiding GUI EnhancedGuider (image center target) instead of cGuider')
+parser.add_argument('--realtime', action='store_true', help='Replay at the original frame cadence')
+parser.add_argument('--speed', type=float, default=1.0, help='Speed-up factor for --realtime')
+parser.add_argument('--limit', type=int, default=None, help='Replay at most this many frames')
+parser.add_argument('--pattern', type=str, default='guide_*.fits', help='Glob of the frames to replay')
+parser.add_argument('--out', type=str, default=None, help='CSV file for the per-frame results')
+parser.add_argument('--guide-log', type=str, default=None,
+                    help="Binary guide log for the replayed frames (default: in memory only, the night's log is not touched)")
+parser.add_argument('--config', type=str, default=config_file,
+                    help='Guider config (controller, centroid, dirs) to replay with (default config/guider.yaml)')
+args = parser.parse_args()
+
+
+def frame_time(filename, header):
+    """unix time of a frame from its GTIME header (or the time tag ending the file name)"""
+    tag = header.get('GTIME') or Path(filename).stem.rsplit('_', 1)[-1]
+    try:
+        return datetime.strptime(tag, "%Y-%m-%dT%H.%M.%S.%f").timestamp()
+    except ValueError:
+        return Path(filename).stat().st_mtime
+
+
+def load_frames(folder, pattern, limit=None):
+    """[(unix time, filename, exposure s)] of the guide frames in folder, oldest first"""
+    frames = []
+    for filename in sorted(Path(folder).glob(pattern)):
+        try:
+            header = fits.getheader(filename)
+        except OSError as e:
+            print(f'Skipping {filename.name}: {e}')
+            continue
+        frames.append((frame_time(filename, header), filename, header.get('EXPTIME', 0.0)))
+    frames.sort()
+    return frames[:limit] if limit else frames
+
+
+def start_mock_tcs():
+    """run the TCS stand-in on a free local port, returns (port, stop event)"""
+    stop, ready = threading.Event(), threading.Event()
+    port = []
+    # the stand-in logs every command, keep the replay output readable
+    server = threading.Thread(target=test_server.serve, daemon=True,
+                              kwargs=dict(port=0, stop=stop, log=lambda *a: None,
+                                          ready=lambda p: (port.append(p), ready.set())))
+    server.start()
+    if not ready.wait(5):
+        raise RuntimeError('TCS stand-in did not start')
+    return port[0], stop
+
+
+def make_guider(port):
+    if args.enhanced:
+        from gui_guiding import EnhancedGuider
+        guider = EnhancedGuider(args.night, config_file=args.config, guide_log=args.guide_log or False)
+    else:
+        guider = cGuider(args.night, config_file=args.config, guide_log=args.guide_log or False)
+    guider.centroid_method = args.method
+    guider.tracking = args.tracking
+    guider.config.update({'HOST_IP': '127.0.0.1', 'PORT': port, 'TIMEOUT': 5,
+                          'telemetry_interval': 0})
+    guider.connect()
+    if guider.session is None:
+        raise RuntimeError('Could not connect to the TCS stand-in')
+    return guider
+
+
+def main():
+    port, stop = start_mock_tcs()
+    guider = make_guider(port)
+    folder = Path(args.dir) if args.dir else guider.data_dir
+    frames = load_frames(folder, args.pattern, args.limit)
+    if not frames:
+        print(f'No {args.pattern} files in {folder}')
+        return
+    print(f'Replaying {len(frames)} frames from {folder} with method {args.method!r}')
+
+    stage_timer.clear()
+    rows, latency = [], []
+    t_first = frames[0][0]
+    t_start = time.perf_counter()
+    for t_frame, filename, exposure in frames:
+        if args.realtime:
+            wait = (t_frame - t_first) / args.speed - (time.perf_counter() - t_start)
+            if wait > 0:
+                time.sleep(wait)
+
+        data = fits.getdata(filename)
+        guider.dx_arcs = guider.dy_arcs = None
+        guider.controller.terms = {}
+        t0 = time.perf_counter()
+        guider.run(data, t_frame=t_frame, now=t_frame + 0.5 * exposure)
+        latency.append(1e3 * (time.perf_counter() - t0))
+
+        terms = guider.controller.terms
+        found = getattr(guider, 'star_found', True) and guider.dx_arcs is not None
+        rows.append({'file': filename.name, 'time': f'{t_frame:.3f}',
+                     'found': found,
+                     'dx_arcs': f'{guider.dx_arcs:.3f}' if found else '',
+                     'dy_arcs': f'{guider.dy_arcs:.3f}' if found else '',
+                     'cmd_x': f"{terms['cmd_x']:.2f}" if terms.get('sent') else '',
+                     'cmd_y': f"{terms['cmd_y']:.2f}" if terms.get('sent') else '',
+                     'ctrl_latency_s': f"{terms['latency']:.3f}" if terms else '',
+                     'latency_ms': f'{latency[-1]:.2f}'})
+    elapsed = time.perf_counter() - t_start
+    stages = stage_timer.format_stats()   # disconnect() writes and clears the recorder
+
+    guider.disconnect()
+    stop.set()
+
+    latency = np.array(latency)
+    dx = np.array([float(r['dx_arcs']) for r in rows if r['found']])
+    dy = np.array([float(r['dy_arcs']) for r in rows if r['found']])
+    sent = sum(1 for r in rows if r['cmd_x'])
+    print(f'{len(rows)} frames in {elapsed:.2f} s  ({len(rows) / elapsed:.1f} frames/s)')
+    print(f'latency per frame  p50 {np.percentile(latency, 50):.1f}  p95 {np.percentile(latency, 95):.1f}  '
+          f'max {latency.max():.1f} ms')
+    if len(dx):
+        print(f'star found in {len(dx)}/{len(rows)} frames, {sent} offsets sent, '
+              f'rms offset dx {np.sqrt(np.mean(dx**2)):.3f}" dy {np.sqrt(np.mean(dy**2)):.3f}"')
+    print(stages)
+
+    if args.out:
+        with open(args.out, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f'Wrote per-frame results to {args.out}')
+
+
+if __name__ == '__main__':
+    main()
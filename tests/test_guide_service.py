@@ -0,0 +1,142 @@
+import socket
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+from cFramePool import cFramePool
+from cGuideService import cGuideService, cGuideClient, send_message
+
+STAR = (2000, 1100)   # full-frame (col, row) of the fake star
+
+
+class FakeCamera:
+    """stands in for cFLIR: a 4096x2160 frame with one star, read out as the subframe"""
+
+    def __init__(self, delay=0.005):
+        self.pool   = cFramePool(size=6)
+        self.frame  = None
+        self.delay  = delay
+        self.origin = (0, 0)
+        self.stream_subframe = None
+
+    def start_stream(self, exposure_time=None, subframe=None):
+        self.stream_subframe = subframe
+
+    def stop_stream(self):
+        pass
+
+    def expose(self, exposure_time, header_keys={}, source="", writeToFile=True, subframe=None):
+        time.sleep(self.delay)
+        x, y, w, h = subframe if subframe is not None else (2048, 1080, 4096, 2160)
+        self.origin = (x - w // 2, y - h // 2)
+        if self.frame is not None:
+            self.frame.release()
+        self.frame = self.pool.get((h, w))
+        self.frame.writable[:] = 100
+        col, row = STAR[0] - self.origin[0], STAR[1] - self.origin[1]
+        if 0 <= row < h and 0 <= col < w:
+            self.frame.writable[row, col] = 5000
+
+    def crop(self, subframe=None):
+        return self.frame.array, self.origin
+
+    def writeArrayToFile(self, image, header_keys={}, subframe_meta=None, tag="", buffer=None):
+        if buffer is not None:
+            buffer.release()
+
+
+class FakeGuider:
+    """stands in for cGuider: the brightest pixel is the centroid, 0.1 arcsec per pixel"""
+    session = None
+    centroid_method = 'std'
+    tracking = False
+    log_seq = None
+    METHODS = ('std',)
+
+    def __init__(self):
+        self.resets = 0
+
+    def reset_lock(self):
+        self.resets += 1
+
+    def measure(self, data, subframe=None, xref=0, yref=0, t_frame=None):
+        nrows, ncols = data.shape
+        row, col = np.unravel_index(np.argmax(data), data.shape)
+        dx, dy = col - xref - nrows // 2, row - yref - ncols // 2
+        self.dx_arcs, self.dy_arcs = 0.1 * dx, 0.1 * dy
+        return col, row, dx, dy
+
+
+def start_service(**settings):
+    camera, guider = FakeCamera(), FakeGuider()
+    service = cGuideService(camera, guider, port=0, **settings)
+    service.start()
+    return service, camera, guider
+
+
+def test_results():
+    """a viewer gets frames and full-frame centroids; settings sent as commands apply to the loop"""
+    service, camera, guider = start_service(subframe=[2000, 1100, 256, 256], target=[2000, 1100])
+    guide = cGuideClient(port=service.port, timeout=5)
+    try:
+        guide.start()
+        guide.subscribe(frames=True, rate=20)
+        header, image = guide.latest(timeout=5)
+        assert image.shape == (256, 256) and image.max() == 5000
+        assert header['centroid'] == list(STAR) and header['dx_arcs'] == 0 and header['dy_arcs'] == 0
+
+        guide.set(target=[1990, 1105], exposure=0.02)
+        time.sleep(0.3)
+        header, image = guide.latest(timeout=5)
+        assert header['target'] == [1990, 1105]
+        assert np.isclose(header['dx_arcs'], 1.0) and np.isclose(header['dy_arcs'], -0.5)
+        assert guider.resets >= 2   # guide start and the target change
+
+        status = guide.stop()
+        assert not status['running'] and status['settings']['exposure'] == 0.02
+        assert status['frames'] > 10
+    finally:
+        guide.close()
+        service.close()
+    time.sleep(0.1)
+    assert camera.pool.stats()['in_use'] == 1   # only the camera's last frame
+
+
+def test_slow_viewer():
+    """a viewer that never reads skips results; the loop and the other viewers carry on"""
+    service, camera, guider = start_service()
+    stalled = socket.create_connection(('127.0.0.1', service.port))
+    guide = cGuideClient(port=service.port, timeout=5)
+    try:
+        send_message(stalled, {'cmd': 'subscribe', 'frames': True, 'rate': 0})
+        guide.subscribe(frames=False, rate=0)
+        guide.start()
+        time.sleep(1.0)
+        status = guide.status()
+        assert status['frames'] > 50
+        slow = max(status['viewers'], key=lambda v: v['dropped'])
+        assert slow['dropped'] > 0 and slow['shown'] < status['frames']
+        header, image = guide.latest(timeout=5)
+        assert image is None and header['seq'] > 50
+    finally:
+        guide.close()
+        stalled.close()
+        service.close()
+
+
+def test_bad_command():
+    """unknown commands, settings and centroid methods are refused with an error reply"""
+    service, camera, guider = start_service()
+    guide = cGuideClient(port=service.port, timeout=5)
+    try:
+        for cmd, args in (('set', {'gain': 2}), ('set', {'method': 'bogus'}), ('jump', {})):
+            with pytest.raises(RuntimeError):
+                guide.request(cmd, **args)
+        assert guide.status()['ok']
+    finally:
+        guide.close()
+        service.close()
@@ -0,0 +1,63 @@
+import csv
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pytest
+import yaml
+from astropy.io import fits
+
+pytest.importorskip('PySpin')   # cGuider is built on the camera class
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def write_frames(folder, n=8, cadence=2.0, age=86400.0, offset=(40, -25)):
+    """n guide frames taken `age` s ago, the star held `offset` px from the image center"""
+    rng = np.random.default_rng(1)
+    yy, xx = np.mgrid[:256, :256]
+    star = 3000 * np.exp(-((xx - 128 - offset[0])**2 + (yy - 128 - offset[1])**2) / 8)
+    t0 = time.time() - age
+    for k in range(n):
+        header = fits.Header()
+        header['GTIME'] = datetime.fromtimestamp(t0 + k * cadence).strftime("%Y-%m-%dT%H.%M.%S.%f")
+        header['EXPTIME'] = 0.1
+        data = (rng.normal(100, 3, star.shape) + star).astype(np.float32)
+        fits.writeto(folder / f'guide_{k:03d}.fits', data, header)
+
+
+def replay(tmp_path, **config):
+    """replay the frames in tmp_path/frames with the repo config plus config, returns the CSV rows"""
+    with open(ROOT / 'config' / 'guider.yaml') as f:
+        settings = yaml.safe_load(f)
+    settings.update({'data_dir': str(tmp_path / 'data'), 'log_dir': str(tmp_path / 'logs'),
+                     'tracking': False, **config})
+    with open(tmp_path / 'guider.yaml', 'w') as f:
+        yaml.safe_dump(settings, f)
+    out = tmp_path / 'replay.csv'
+    subprocess.run([sys.executable, str(ROOT / 'scripts' / 'replay_guiding.py'), 'replay',
+                    '--dir', str(tmp_path / 'frames'), '--config', str(tmp_path / 'guider.yaml'),
+                    '--out', str(out)], check=True, capture_output=True, timeout=120)
+    with open(out) as f:
+        return list(csv.DictReader(f))
+
+
+@pytest.mark.parametrize('config', [{'controller': 'p', 'controller_smith': True},
+                                    {'controller': 'kalman'}])
+def test_replay_clock(tmp_path, config):
+    """day-old frames: the controller sees the frames' latency, not their age"""
+    (tmp_path / 'frames').mkdir()
+    write_frames(tmp_path / 'frames')
+    rows = replay(tmp_path, controller_settle=1.0, **config)
+    assert len(rows) == 8 and all(r['cmd_x'] for r in rows)
+    assert all(float(r['ctrl_latency_s']) < 1.0 for r in rows)
+    cmd = np.array([[float(r['cmd_x']), float(r['cmd_y'])] for r in rows])
+    if config['controller'] == 'p':
+        # frames 2 s apart, past the 1 s settle: every command is the same kp x error
+        assert np.allclose(cmd, cmd[0], atol=0.02) and np.all(np.abs(cmd[0]) > 0.2)
+    else:
+        # the drift is led by latency + settle, not by a day
+        assert np.all(np.abs(cmd) < 10)
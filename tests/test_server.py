@@ -1,5 +1,9 @@
+import argparse
 import re
+import select
 import socket
+import time
+from collections import deque
 
 TCP_IP = '127.0.0.1'
 TCP_PORT = 5005
@@ -19,33 +23,126 @@ REQSTAT_RESPONSE = (
     b'Cass ring angle = 143.66\x00'
 )
 
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-s.bind((TCP_IP, TCP_PORT))
-s.listen(1)
-print(f'Listening on {TCP_IP}:{TCP_PORT}')
 
-while True:
-    conn, addr = s.accept()
-    print('Connection address:', addr)
+def respond(cmd):
+    """TCS reply to one command, or None for unknown commands (the TCS stays silent)."""
+    if cmd == 'REQPOS':
+        return REQPOS_RESPONSE
+    elif cmd == 'REQSTAT':
+        return REQSTAT_RESPONSE
+    elif cmd in ('NAME', '?NAME'):
+        return b'NAME = Crab Nebula\n'
+    elif re.match(r'^PT\s+-?\d+\.?\d*\s+-?\d+\.?\d*$', cmd):
+        return b'0'     # no terminator, like the real TCS
+    return None
 
+
+def handle(conn, delay=0.0, latency=0.0, chunk=None, drop_after=None, silent=(), log=print):
+    """
+    Serve one client connection.
+
+    Commands may arrive several per recv() (pipelined clients) or split across
+    recv()s; they are split on CR / LF.
+
+    delay      - seconds to wait before every reply (a slow TCS: replies queue up)
+    latency    - seconds a reply lags its command's arrival (a network round trip:
+                 commands that arrive together are answered together)
+    chunk      - send replies in pieces of this many bytes (exercises client framing)
+    drop_after - close the connection after this many commands (exercises reconnect)
+    silent     - commands that never get a reply (exercises client timeouts)
+    log        - callable for the progress messages (print)
+    returns the number of commands served
+    """
+    buf = b''
+    n = 0
+    queue = deque()   # (due time, reply or None, command number), oldest first
     while True:
-        data = conn.recv(BUFFER_SIZE)
-        if not data:
-            break
-        cmd = data.decode('ascii').strip()
-        print(f'Received: {cmd!r}')
-
-        if cmd == 'REQPOS':
-            conn.sendall(REQPOS_RESPONSE)
-        elif cmd == 'REQSTAT':
-            conn.sendall(REQSTAT_RESPONSE)
-        elif cmd == 'NAME':
-            conn.sendall(b'NAME = Crab Nebula\n')
-        elif re.match(r'^PT\s+-?\d+\.?\d*\s+-?\d+\.?\d*$', cmd):
-            conn.sendall(b'0')
-        else:
-            print(f'Unknown command: {cmd!r}')
-
-    conn.close()
-    print('Client disconnected, waiting for next connection...')
\ No newline at end of file
+        timeout = max(queue[0][0] - time.monotonic(), 0) if queue else None
+        if select.select([conn], [], [], timeout)[0]:
+            data = conn.recv(BUFFER_SIZE)
+            if not data:
+                break
+            t_recv = time.monotonic()
+            buf += data
+            *cmds, buf = re.split(rb'[\r\n]', buf)
+            for raw in cmds:
+                cmd = raw.decode('ascii').strip()
+                if not cmd:
+                    continue
+                log(f'Received: {cmd!r}')
+                n += 1
+                reply = None if cmd.split()[0] in silent else respond(cmd)
+                if reply is None:
+                    log(f'No reply to: {cmd!r}')
+                queue.append((t_recv + latency, reply, n))
+        while queue and queue[0][0] <= time.monotonic():
+            _, reply, k = queue.popleft()
+            if reply is not None:
+                time.sleep(delay)
+                step = chunk or len(reply)
+                for i in range(0, len(reply), step):
+                    conn.sendall(reply[i:i + step])
+                    if chunk:
+                        time.sleep(0.01)
+            if drop_after is not None and k >= drop_after:
+                log(f'Dropping connection after {k} commands')
+                return k
+    return n
+
+
+def serve(host=TCP_IP, port=TCP_PORT, stop=None, ready=None, log=print, **kwargs):
+    """
+    Accept clients one at a time until stop (threading.Event) is set.
+
+    ready - optional callable(port), called once listening (port 0 picks a free port)
+    log   - callable for the progress messages (print)
+    kwargs are passed on to handle()
+    """
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind((host, port))
+    s.listen(1)
+    s.settimeout(0.2)
+    port = s.getsockname()[1]
+    log(f'Listening on {host}:{port}')
+    if ready is not None:
+        ready(port)
+
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                conn, addr = s.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+            # small replies go out at once (no Nagle wait for the client's delayed ACK)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            log(f'Connection address: {addr}')
+            with conn:
+                try:
+                    handle(conn, log=log, **kwargs)
+                except OSError as e:
+                    log(f'Connection error: {e}')
+            log('Client disconnected, waiting for next connection...')
+    finally:
+        s.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in for the P200 TCS remote command socket')
+    parser.add_argument('--host', default=TCP_IP)
+    parser.add_argument('--port', type=int, default=TCP_PORT)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds before every reply')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds each reply lags its command (pipelined commands overlap)')
+    parser.add_argument('--chunk', type=int, default=None, help='send replies in pieces of N bytes')
+    parser.add_argument('--drop-after', type=int, default=None,
+                        help='close each connection after N commands')
+    parser.add_argument('--silent', nargs='*', default=(), help='commands that never get a reply')
+    args = parser.parse_args()
+    serve(args.host, args.port, delay=args.delay, latency=args.latency, chunk=args.chunk,
+          drop_after=args.drop_after, silent=tuple(args.silent))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "utils"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from cTCSClient import cTCSClient
+import test_server
+
+
+def start_server(**kwargs):
+    """run the TCS stand-in on a free port in a background thread, returns (port, stop event)"""
+    stop, ready = threading.Event(), threading.Event()
+    port = []
+    thread = threading.Thread(target=test_server.serve, daemon=True,
+                              kwargs=dict(port=0, stop=stop, ready=lambda p: (port.append(p), ready.set()),
+                                          **kwargs))
+    thread.start()
+    ready.wait(5)
+    return port[0], stop
+
+
+def test_framing():
+    """multi-line NUL terminated replies sent in small pieces come back whole"""
+    port, stop = start_server(chunk=7)
+    tcs = cTCSClient('127.0.0.1', port, timeout=5)
+    try:
+        assert tcs.connect()
+        assert tcs.request('REQPOS\r') == test_server.REQPOS_RESPONSE[:-1].decode()
+        assert tcs.request('?NAME\r') == 'NAME = Crab Nebula'
+        assert tcs.request('PT 1.0 -2.0\n') == '0'
+    finally:
+        tcs.close()
+        stop.set()
+
+
+def test_pipelining():
+    """several requests in flight are matched to their replies in order, in about one round trip"""
+    port, stop = start_server(latency=0.05)
+    tcs = cTCSClient('127.0.0.1', port, timeout=5)
+    try:
+        assert tcs.connect()
+        t0 = time.monotonic()
+        pos, name, stat = tcs.request_many(['REQPOS\r', '?NAME\r', 'REQSTAT\r'])
+        assert time.monotonic() - t0 < 2 * 0.05   # a serial client needs 3 round trips
+        assert pos.startswith('UTC') and name == 'NAME = Crab Nebula' and stat.endswith('143.66')
+    finally:
+        tcs.close()
+        stop.set()
+
+
+def test_reconnect():
+    """the server hangs up after every 2 commands; queries carry on transparently"""
+    port, stop = start_server(drop_after=2)
+    tcs = cTCSClient('127.0.0.1', port, timeout=5, backoff=(0.05, 0.5))
+    try:
+        assert tcs.connect()
+        for _ in range(5):
+            assert tcs.request('?NAME\r') == 'NAME = Crab Nebula'
+        assert tcs.n_reconnects >= 2
+    finally:
+        tcs.close()
+        stop.set()
+
+
+def test_timeout():
+    """an unanswered command times out and the next one still gets its own reply"""
+    port, stop = start_server(silent=('REQSTAT',))
+    tcs = cTCSClient('127.0.0.1', port, timeout=0.5, backoff=(0.05, 0.5))
+    try:
+        assert tcs.connect()
+        try:
+            tcs.request('REQSTAT\r')
+            raise AssertionError('REQSTAT should have timed out')
+        except TimeoutError:
+            pass
+        assert tcs.request('?NAME\r', timeout=5) == 'NAME = Crab Nebula'
+    finally:
+        tcs.close()
+        stop.set()
+
+
+if __name__ == '__main__':
+    for test in (test_framing, test_pipelining, test_reconnect, test_timeout):
+        test()
+        print(f'{test.__name__}: OK')
@@ -0,0 +1,176 @@
+import numpy as np
+from scipy import fft, signal
+
+
+def marginal_std_peak(blurred):
+    """
+    Locate the star in an already-smoothed image from its marginal standard deviations.
+
+    Takes the std of every column and row, subtracts a background estimated from
+    a central strip, normalises, and returns the column/row with the highest
+    variance. Falls back to the image center if the profile is degenerate.
+
+    inputs:
+    -------
+    blurred - 2D array, smoothed guide image
+
+    returns
+    -------
+    x (column), y (row) of the peak in pixels
+    """
+    xstd = np.std(blurred, axis=0)
+    ystd = np.std(blurred, axis=1)
+
+    # Subtract background estimated from a central strip, normalise
+    bg_cols = min(100, len(xstd) // 4)
+    bg_rows = min(100, len(ystd) // 4)
+    xstdn = (xstd - np.median(xstd[bg_cols : bg_cols * 3])) / max(xstd)
+    ystdn = (ystd - np.median(ystd[bg_rows : bg_rows * 3])) / max(ystd)
+
+    try:
+        x = np.where(xstdn == max(xstdn))[0][0]
+        y = np.where(ystdn == max(ystdn))[0][0]
+    except IndexError:
+        x, y = blurred.shape[1] // 2, blurred.shape[0] // 2
+
+    return x, y
+
+
+class cCentroidFilter:
+    """
+    Gaussian smoothing filter for the marginal-std centroid.
+
+    Gives the same result as
+        signal.fftconvolve(data, np.outer(g, g), mode='same')
+    with g = signal.windows.gaussian(size, sigma), but the kernel and its
+    spectrum are only computed once per image shape and the transforms run in
+    float32 on a fast FFT length. Repeated calls on the same frame size (the
+    normal guiding case) therefore cost one forward and one inverse real FFT.
+    """
+
+    def __init__(self, size=70, sigma=8, workers=-1):
+        """
+        size    - int, kernel width in pixels (default 70)
+        sigma   - float, gaussian sigma in pixels (default 8)
+        workers - int, threads handed to scipy.fft (-1 uses all cores)
+        """
+        self.size    = size
+        self.sigma   = sigma
+        self.workers = workers
+
+        # 1D gaussian; the 2D kernel is its outer product (separable)
+        self.window  = signal.windows.gaussian(size, sigma).astype(np.float32)
+        self._plans  = {}   # image shape -> (fft shape, kernel spectrum, crop slices)
+
+    def _plan(self, shape):
+        """Build (or fetch) the padded FFT shape and cached kernel spectrum for an image shape."""
+        plan = self._plans.get(shape)
+        if plan is None:
+            ny, nx = shape
+            fshape = (fft.next_fast_len(ny + self.size - 1, True),
+                      fft.next_fast_len(nx + self.size - 1, True))
+
+            # spectrum of the separable kernel = outer product of the 1D spectra
+            gy = fft.fft(self.window, fshape[0])
+            gx = fft.rfft(self.window, fshape[1])
+            spectrum = (gy[:, None] * gx[None, :]).astype(np.complex64)
+
+            # 'same' output is centered within the 'full' convolution
+            start = (self.size - 1) // 2
+            crop = (slice(start, start + ny), slice(start, start + nx))
+
+            plan = (fshape, spectrum, crop)
+            self._plans[shape] = plan
+        return plan
+
+    def clear(self):
+        """Drop all cached plans (e.g. after a large change of subframe sizes)."""
+        self._plans.clear()
+
+    def smooth(self, data):
+        """
+        Convolve data with the gaussian kernel ('same' size output).
+
+        data - 2D array, guide image (any numeric dtype)
+
+        returns float32 array with the same shape as data
+        """
+        fshape, spectrum, crop = self._plan(np.shape(data))
+
+        F = fft.rfft2(np.asarray(data, dtype=np.float32), fshape, workers=self.workers)
+        F *= spectrum
+        return fft.irfft2(F, fshape, workers=self.workers)[crop]
+
+    def centroid(self, data):
+        """Smooth data and return the marginal-std peak (x, y)."""
+        return marginal_std_peak(self.smooth(data))
+
+
+def bin_image(data, factor):
+    """
+    Block-sum data by factor along both axes (edges that do not fill a block are dropped).
+
+    Summing in uint32/float32 keeps a single pass over the frame, which is much
+    cheaper than filtering at full resolution.
+    """
+    nrows, ncols = np.shape(data)
+    ny, nx = nrows // factor, ncols // factor
+    blocks = np.asarray(data)[:ny * factor, :nx * factor].reshape(ny, factor, nx, factor)
+    dtype = np.uint32 if np.issubdtype(blocks.dtype, np.integer) else np.float32
+    return blocks.sum(axis=(1, 3), dtype=dtype)
+
+
+class cPyramidSearch:
+    """
+    Coarse-to-fine star search for large (full-frame) guide images.
+
+    The frame is block-summed by `factor`, lightly smoothed and the brightest
+    blob is found on that coarse level. The position is then refined on the
+    full-resolution pixels in a `refine_box` sized cutout around it. Only the
+    binning touches every pixel, so acquisition from a 4096x2160 frame costs a
+    small fraction of a full-frame convolution.
+    """
+
+    def __init__(self, factor=8, refine_box=64, sigma=8):
+        """
+        factor     - int, binning factor of the coarse level
+        refine_box - int, side of the full resolution box used for the refinement
+        sigma      - float, full resolution PSF smoothing sigma (scaled down by factor)
+        """
+        self.factor     = int(factor)
+        self.refine_box = int(refine_box)
+
+        coarse_sigma = max(sigma / self.factor, 0.5)
+        self.coarse_filter = cCentroidFilter(size=max(int(6 * coarse_sigma) | 1, 3), sigma=coarse_sigma)
+
+    def coarse(self, data):
+        """Return the (x, y) full-resolution position of the brightest blob on the coarse level."""
+        binned = bin_image(data, self.factor)
+        smoothed = self.coarse_filter.smooth(binned)
+        iy, ix = np.unravel_index(np.argmax(smoothed), smoothed.shape)
+        # block centre in full resolution pixels
+        return ix * self.factor + self.factor // 2, iy * self.factor + self.factor // 2
+
+    def centroid(self, data, refine):
+        """
+        Coarse search followed by a full-resolution refinement.
+
+        data   - 2D array, guide image
+        refine - callable(cutout) -> (x, y) in cutout coords, run on the full resolution box
+
+        returns (x, y) in data coords
+        """
+        nrows, ncols = np.shape(data)
+        if min(nrows, ncols) < self.factor * 4:
+            return refine(data) # too small to bother with a pyramid
+
+        x, y = self.coarse(data)
+
+        # fixed size box, slid back inside the frame at the edges
+        h = min(self.refine_box, nrows)
+        w = min(self.refine_box, ncols)
+        r0 = int(np.clip(y - h // 2, 0, nrows - h))
+        c0 = int(np.clip(x - w // 2, 0, ncols - w))
+
+        xr, yr = refine(data[r0:r0 + h, c0:c0 + w])
+        return xr + c0, yr + r0
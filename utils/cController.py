@@ -0,0 +1,209 @@
+import time
+from collections import deque
+import numpy as np
+
+
+class cGuideController:
+    """
+    Base class of the guide loop controllers.
+
+    update() turns a measured offset (arcsec, same axes/sign as cGuider.dx_arcs,
+    dy_arcs) into the offset to command; commanded() records what was actually
+    sent and when the TCS acknowledged it.
+
+    Latency bookkeeping shared by all controllers:
+        latency   - running mean of (time of update - mid-exposure time of the frame),
+                    i.e. the measured cycle latency
+        in_flight - sum of the commands that the measured frame cannot show yet,
+                    i.e. acknowledged later than t_frame - settle
+    Every cycle's inputs, terms and output are appended to self.history for tuning.
+    """
+
+    def __init__(self, settle=1.0, max_command=None, history=1000):
+        """
+        settle      - float, seconds between an offset being acknowledged and the
+                      telescope having finished the move
+        max_command - float or None, clamp on the commanded offset per axis (arcsec)
+        history     - int, cycles kept in self.history
+        """
+        self.settle      = settle
+        self.max_command = max_command
+        self.history     = deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        """Forget the loop state (e.g. when guiding restarts or the target changes)."""
+        self.latency  = None
+        self.total    = np.zeros(2)         # sum of every command sent
+        self.commands = deque(maxlen=64)    # recent (t_ack, ux, uy)
+        self.t_last   = None
+        self.terms    = {}
+        self._reset()
+
+    def _reset(self):
+        pass
+
+    def in_flight(self, t_frame):
+        """(x, y) sum of commanded offsets not yet visible in a frame taken at t_frame"""
+        pending = np.zeros(2)
+        for t_ack, ux, uy in self.commands:
+            if t_ack + self.settle > t_frame:
+                pending += (ux, uy)
+        return pending
+
+    def update(self, err_x, err_y, t_frame=None, now=None):
+        """
+        err_x, err_y - measured offset in arcsec
+        t_frame      - unix time of the frame's mid-exposure (default now)
+        now          - unix time of the update (default time.time(), given when replaying a log)
+
+        returns (ux, uy) offset to command in arcsec
+        """
+        now = time.time() if now is None else now
+        t_frame = now if t_frame is None else t_frame
+        lag = max(now - t_frame, 0.0)
+        self.latency = lag if self.latency is None else 0.8 * self.latency + 0.2 * lag
+
+        err = np.array([err_x, err_y], dtype=float)
+        pending = self.in_flight(t_frame)
+        u, terms = self._control(err, pending, t_frame)
+        if self.max_command is not None:
+            u = np.clip(u, -self.max_command, self.max_command)
+        self.t_last = t_frame
+
+        self.terms = {'t': now, 't_frame': t_frame, 'latency': self.latency,
+                      'err_x': float(err[0]), 'err_y': float(err[1]),
+                      'pending_x': float(pending[0]), 'pending_y': float(pending[1]),
+                      'cmd_x': float(u[0]), 'cmd_y': float(u[1]), 'sent': False}
+        self.terms.update({k: float(v) for k, v in terms.items()})
+        self.history.append(self.terms)
+        return float(u[0]), float(u[1])
+
+    def _control(self, err, pending, t_frame):
+        """returns (2,) command and a dict of per-axis terms"""
+        raise NotImplementedError
+
+    def commanded(self, ux, uy, t_ack=None):
+        """Record an offset sent to (and acknowledged by) the TCS."""
+        t_ack = time.time() if t_ack is None else t_ack
+        self.commands.append((t_ack, ux, uy))
+        self.total += (ux, uy)
+        if self.terms:
+            self.terms.update({'sent': True, 't_ack': t_ack, 'cmd_x': float(ux), 'cmd_y': float(uy)})
+
+    def format_terms(self):
+        """one line summary of the last cycle for the log"""
+        skip = ('t', 't_frame', 't_ack', 'sent')
+        return ' '.join(f'{k}={v:+.3f}' for k, v in self.terms.items()
+                        if k not in skip and v is not None)
+
+
+class cPIDController(cGuideController):
+    """
+    PID on the measured offset, optionally as a Smith predictor.
+
+    With kp only this is the old fixed-gain correction. With smith=True the
+    commands still in flight (sent but not yet visible in the frame) are
+    subtracted from the measured error first, so a slow telescope response
+    is not corrected twice - the usual cause of overshoot at short cadences.
+    The integral is clamped to +-i_limit arcsec (anti-windup).
+    """
+
+    def __init__(self, kp=0.5, ki=0.0, kd=0.0, smith=False, i_limit=2.0, **kwargs):
+        """
+        kp, ki, kd - proportional (1), integral (1/s) and derivative (s) gains
+        smith      - bool, subtract in-flight commands from the error (Smith predictor)
+        i_limit    - float, clamp of the integral term in arcsec
+        kwargs go to cGuideController (settle, max_command, history)
+        """
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.smith   = smith
+        self.i_limit = i_limit
+        super().__init__(**kwargs)
+
+    def _reset(self):
+        self.integral = np.zeros(2)
+        self.err_last = None
+
+    def _control(self, err, pending, t_frame):
+        e = err - pending if self.smith else err
+        dt = None if self.t_last is None else t_frame - self.t_last
+
+        if dt is not None and dt > 0:
+            self.integral = np.clip(self.integral + e * dt, -self.i_limit / max(self.ki, 1e-9),
+                                    self.i_limit / max(self.ki, 1e-9))
+        deriv = (e - self.err_last) / dt if (dt and dt > 0 and self.err_last is not None) else np.zeros(2)
+        self.err_last = e
+
+        p, i, d = self.kp * e, self.ki * self.integral, self.kd * deriv
+        terms = {'p_x': p[0], 'p_y': p[1], 'i_x': i[0], 'i_y': i[1], 'd_x': d[0], 'd_y': d[1]}
+        return p + i + d, terms
+
+
+class cKalmanController(cGuideController):
+    """
+    Constant-velocity Kalman filter on the uncorrected drift.
+
+    The drift is reconstructed as measured error + commands already applied to
+    the frame, filtered per axis with a [position, rate] state, and predicted to
+    the time the new command will take effect (t_frame + measured latency +
+    settle). The command removes `gain` x (predicted drift - everything already
+    commanded), so a steady drift is led rather than chased.
+    """
+
+    def __init__(self, q=0.01, r=0.04, gain=1.0, **kwargs):
+        """
+        q    - float, process noise of the drift rate (arcsec^2 / s^3)
+        r    - float, measurement noise variance (arcsec^2), e.g. seeing jitter
+        gain - float, fraction of the predicted error removed per cycle
+        kwargs go to cGuideController (settle, max_command, history)
+        """
+        self.q, self.r, self.gain = q, r, gain
+        super().__init__(**kwargs)
+
+    def _reset(self):
+        self.x = None                        # (2 axes, [position, rate])
+        self.P = None                        # shared 2x2 covariance
+
+    def _control(self, err, pending, t_frame):
+        drift = err + self.total - pending   # error the telescope would show uncorrected
+
+        if self.x is None:
+            self.x = np.stack([drift, np.zeros(2)], axis=1)
+            self.P = np.diag([self.r, self.r])
+        else:
+            dt = max(t_frame - self.t_last, 1e-3)
+            F = np.array([[1, dt], [0, 1]])
+            Q = self.q * np.array([[dt**3 / 3, dt**2 / 2], [dt**2 / 2, dt]])
+            self.x = self.x @ F.T
+            self.P = F @ self.P @ F.T + Q
+            K = self.P[:, 0] / (self.P[0, 0] + self.r)
+            self.x = self.x + np.outer(drift - self.x[:, 0], K)
+            self.P = self.P - np.outer(K, self.P[0, :])
+
+        lead = (self.latency or 0.0) + self.settle
+        predicted = self.x[:, 0] + self.x[:, 1] * lead
+        u = self.gain * (predicted - self.total)
+        terms = {'drift_x': self.x[0, 0], 'drift_y': self.x[1, 0],
+                 'rate_x': self.x[0, 1], 'rate_y': self.x[1, 1], 'lead': lead}
+        return u, terms
+
+
+def make_controller(kind='p', **kwargs):
+    """
+    Build a controller by name.
+
+    kind - 'p' (proportional), 'pi', 'pid' or 'kalman'
+    kwargs are passed on; gains that do not belong to the kind are ignored
+    """
+    common = {k: kwargs[k] for k in ('settle', 'max_command', 'history') if k in kwargs}
+    if kind in ('p', 'pi', 'pid'):
+        return cPIDController(kp=kwargs.get('kp', 0.5),
+                              ki=kwargs.get('ki', 0.0) if kind != 'p' else 0.0,
+                              kd=kwargs.get('kd', 0.0) if kind == 'pid' else 0.0,
+                              smith=kwargs.get('smith', False),
+                              i_limit=kwargs.get('i_limit', 2.0), **common)
+    if kind == 'kalman':
+        return cKalmanController(q=kwargs.get('q', 0.01), r=kwargs.get('r', 0.04),
+                                 gain=kwargs.get('gain', 1.0), **common)
+    raise ValueError(f"Unknown controller '{kind}', use 'p', 'pi', 'pid' or 'kalman'")
@@ -0,0 +1,284 @@
+import io, os, threading, time, logging, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from astropy.io import fits
+
+from cPipeline import cStageQueue
+from cLatency import stage_timer
+from cFrameStats import cFrameStats
+
+
+class cFITSWriter:
+    """
+    Background FITS writer, so disk I/O never runs between exposures.
+
+    submit() queues (filename, data, header) on a bounded lossless queue and
+    returns; worker threads write the files. When the queue is full submit()
+    blocks (back-pressure) and the time spent blocked is counted, so a disk
+    that can't keep up shows in stats() instead of as camera timeouts.
+
+    Files are flushed after writing but fsync'ed in batches (every fsync_batch
+    files or fsync_interval seconds), one fsync per file without the per-file
+    stall. drain() / close() wait for every queued file and fsync them.
+
+    Data must not change until written: pass pooled frame buffers along as
+    `buffer` (a reference the writer releases once the file is written).
+
+    With compression ('RICE_1', 'HCOMPRESS_1', 'GZIP_1', 'GZIP_2') integer images
+    are written lossless tile-compressed, as a CompImageHDU in `<filename>.fz`.
+    The compression runs in a pool of `processes` worker processes (astropy holds
+    the GIL while compressing tiles, so threads would share one core); each
+    writer thread has one file in compression at a time, so use workers >=
+    processes. Float images are written uncompressed (compressing them would
+    quantize them).
+
+    With quality=True the frame statistics (cFrameStats, shared with other users
+    of a pooled frame) go into the header as DATAMIN/DATAMAX/SKYLEVEL/... keywords.
+    """
+
+    COMPRESSION = ('RICE_1', 'HCOMPRESS_1', 'GZIP_1', 'GZIP_2')
+
+    def __init__(self, queue_size=16, workers=1, fsync_batch=8, fsync_interval=2.0,
+                 compression=None, processes=2, quality=False, saturation=65000,
+                 timer=stage_timer, logger=None):
+        """
+        queue_size     - int, frames queued before submit() blocks
+        workers        - int, writer threads (FITS writes release the GIL in the file I/O)
+        fsync_batch    - int, fsync after this many files (0 = leave it to the OS)
+        fsync_interval - float, seconds after which written files are fsync'ed regardless
+        compression    - None (plain FITS) or one of COMPRESSION
+        processes      - int, compression processes (0 = compress in the writer threads)
+        quality        - bool, add image statistics keywords to the header
+        saturation     - ADU counted as saturated for the SATFRAC keyword
+        timer          - cStageTimer recording 'write' (per file), 'compress' and 'write_wait' (blocked submit)
+        """
+        if compression is not None and compression not in self.COMPRESSION:
+            raise ValueError(f"Unknown FITS compression '{compression}', use one of {self.COMPRESSION}")
+        self.compression    = compression
+        self.quality        = quality
+        self.saturation     = saturation
+        self.n_processes    = int(processes)
+        self.executor       = None
+        self._compress_lock = threading.Lock()
+        self.queue          = cStageQueue(queue_size, 'lossless')
+        self.n_workers      = max(int(workers), 1)
+        self.fsync_batch    = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.timing         = timer
+        self.logger         = logger or logging.getLogger()
+        self.cond           = threading.Condition()
+        self.threads        = []
+        self._unsynced      = []     # (file, replaces) written and flushed, still open, waiting for fsync
+        self._last_sync     = time.monotonic()
+        self.pending        = 0      # submitted, not yet written
+        self.n_submitted = self.n_written = self.n_failed = self.n_fsync = 0
+        self.max_depth      = 0
+        self.blocked        = 0.0    # seconds submit() waited for room in the queue
+        self.max_blocked    = 0.0
+        self.raw_bytes      = 0      # image bytes written ...
+        self.file_bytes     = 0      # ... and the size of the files they went into
+        self.t_compress     = 0.0    # seconds spent compressing (summed over processes)
+
+    def start(self):
+        if self.threads:
+            return
+        if self.queue.closed:
+            self.queue = cStageQueue(self.queue.maxsize, 'lossless')
+        self.threads = [threading.Thread(target=self._run, name=f'fits-writer-{i}', daemon=True)
+                        for i in range(self.n_workers)]
+        for thread in self.threads:
+            thread.start()
+        if self.compression and self.n_processes > 0 and self.executor is None:
+            # spawn, not fork: the writer threads (and the GUI / camera threads) are already running
+            self.executor = ProcessPoolExecutor(max_workers=self.n_processes,
+                                                mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, filename, data, header=None, buffer=None, replaces=None):
+        """
+        queue one file; blocks while the queue is full
+
+        filename - str / Path (.fz is appended when compressing)
+        data     - array to write (not copied, must stay unchanged until written)
+        header   - fits.Header or dict
+        buffer   - optional cFrameBuffer reference backing data, released after writing
+        replaces - optional path of a file this one supersedes (e.g. an uncompressed copy),
+                   deleted once the file is written and synced
+        """
+        self.start()
+        with self.cond:
+            self.pending += 1
+            self.n_submitted += 1
+        t0 = time.perf_counter()
+        if not self.queue.put((str(filename), data, header, buffer, replaces)):
+            with self.cond:
+                self.pending -= 1
+                self.cond.notify_all()
+            if buffer is not None:
+                buffer.release()
+            raise RuntimeError(f'FITS writer is closed, {filename} not written')
+        waited = time.perf_counter() - t0
+        self.blocked += waited
+        self.max_blocked = max(self.max_blocked, waited)
+        if self.timing is not None:
+            self.timing.record('write_wait', t0, waited)
+        self.max_depth = max(self.max_depth, len(self.queue))
+
+    def _run(self):
+        while True:
+            job = self.queue.get(timeout=0.5)
+            if job is None:
+                if self.queue.closed:
+                    return
+                self._sync(force=False)
+                continue
+            self._write(*job)
+
+    def _write(self, filename, data, header, buffer, replaces):
+        t0 = time.perf_counter()
+        f = None
+        compressed = None
+        try:
+            if header is not None and not isinstance(header, fits.Header):
+                header = fits.Header(list(header.items()))
+            if self.quality:
+                header = fits.Header() if header is None else header
+                for key, card in cFrameStats.of(data, buffer, self.saturation).keywords().items():
+                    header[key] = card
+            if self.compression and data.dtype.kind in 'iu':
+                filename += '.fz'
+                t1 = time.perf_counter()
+                if self.executor is not None:
+                    # data is pickled to the process by the time the result is back
+                    compressed = self.executor.submit(compress_fits, data, header, self.compression).result()
+                else:
+                    with self._compress_lock:   # the HCOMPRESS codec is not thread safe
+                        compressed = compress_fits(data, header, self.compression)
+                if self.timing is not None:
+                    self.timing.stop('compress', t1)
+                self.t_compress += time.perf_counter() - t1
+            if os.path.exists(filename):   # as hdu.writeto(filename): never overwrite
+                raise OSError(f'File {filename} already exists')
+            f = open(filename, 'wb')
+            if compressed is not None:
+                f.write(compressed)
+            else:
+                fits.PrimaryHDU(data, header=header).writeto(f)
+            f.flush()
+            ok = True
+        except Exception as e:
+            self.logger.error(f'Could not write {filename}: {type(e).__name__}: {e}')
+            if f is not None:
+                f.close()
+                f = None
+            ok = False
+        finally:
+            if buffer is not None:
+                buffer.release()
+        if self.timing is not None:
+            self.timing.stop('write', t0)
+
+        with self.cond:
+            if ok:
+                self.n_written += 1
+                self.raw_bytes += data.nbytes
+                self.file_bytes += f.tell()
+                self.logger.info(f'Wrote guide image to {filename}')
+            else:
+                self.n_failed += 1
+            if f is not None:
+                self._unsynced.append((f, replaces))
+        self._sync(force=False)
+        with self.cond:
+            self.pending -= 1
+            self.cond.notify_all()
+
+    def _sync(self, force=True):
+        """fsync and close the written files if the batch is full / due (or force)"""
+        with self.cond:
+            due = (force or (self.fsync_batch and len(self._unsynced) >= self.fsync_batch)
+                   or time.monotonic() - self._last_sync >= self.fsync_interval)
+            if not due or not self._unsynced:
+                return
+            files, self._unsynced = self._unsynced, []
+            self._last_sync = time.monotonic()
+        for f, replaces in files:
+            try:
+                if self.fsync_batch:
+                    os.fsync(f.fileno())
+            except OSError as e:
+                self.logger.warning(f'fsync of {f.name} failed: {e}')
+            finally:
+                f.close()
+            if replaces is not None:
+                # only once its replacement is on disk
+                try:
+                    os.remove(replaces)
+                except OSError as e:
+                    self.logger.warning(f'Could not remove {replaces}: {e}')
+        with self.cond:
+            self.n_fsync += 1
+
+    def drain(self, timeout=None):
+        """wait until every submitted file is written and synced; returns False on timeout"""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while self.pending:
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self.logger.error(f'FITS writer drain timed out with {self.pending} files pending')
+                    return False
+                self.cond.wait(remaining)
+        self._sync(force=True)
+        return True
+
+    def close(self, timeout=None):
+        """drain, then stop the worker threads"""
+        drained = self.drain(timeout)
+        self.queue.close()
+        for thread in self.threads:
+            thread.join(1.0)
+        self.threads = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.n_written:
+            self.logger.info(f'FITS writer: {self.format_stats()}')
+        return drained
+
+    def stats(self):
+        """dict of files submitted / written / failed / pending, queue depth and back-pressure"""
+        with self.cond:
+            return {'submitted': self.n_submitted, 'written': self.n_written, 'failed': self.n_failed,
+                    'pending': self.pending, 'depth': len(self.queue), 'max_depth': self.max_depth,
+                    'blocked_s': self.blocked, 'max_blocked_ms': 1e3 * self.max_blocked,
+                    'fsyncs': self.n_fsync, 'mb_written': self.file_bytes / 2**20,
+                    'ratio': self.raw_bytes / self.file_bytes if self.file_bytes else None,
+                    'compress_mb_s': self.raw_bytes / 2**20 / self.t_compress if self.t_compress else None}
+
+    def format_stats(self):
+        st = self.stats()
+        text = (f"written {st['written']}/{st['submitted']} (failed {st['failed']}, pending {st['pending']}), "
+                f"queue max {st['max_depth']}/{self.queue.maxsize}, blocked {st['blocked_s']:.2f} s "
+                f"(max {st['max_blocked_ms']:.0f} ms), {st['mb_written']:.1f} MB")
+        if st['compress_mb_s']:
+            text += (f", {self.compression} ratio {st['ratio']:.2f} "
+                     f"at {st['compress_mb_s']:.0f} MB/s per process")
+        return text
+
+
+# header keywords describing the uncompressed primary array, set anew by CompImageHDU
+STRUCTURAL = ('SIMPLE', 'EXTEND', 'BITPIX', 'NAXIS', 'NAXIS1', 'NAXIS2', 'BZERO', 'BSCALE')
+
+
+def compress_fits(data, header, compression):
+    """
+    bytes of a FITS file with an empty primary HDU and data as a lossless
+    tile-compressed image extension (HCOMPRESS with scale 0 is lossless too).
+    A module function so it can run in a worker process.
+    """
+    header = fits.Header() if header is None else header.copy()
+    for key in STRUCTURAL:
+        header.remove(key, ignore_missing=True)
+    hdu = fits.CompImageHDU(data, header=header, compression_type=compression, hcomp_scale=0)
+    buf = io.BytesIO()
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(buf)
+    return buf.getvalue()
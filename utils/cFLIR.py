@@ -1,12 +1,20 @@
 from datetime import datetime,timezone
+from contextlib import contextmanager
 import logging, os
 from pathlib import Path
 import numpy as np
 from astropy.io import fits
 
-import PySpin
+try:
+    import PySpin
+except ImportError: # no camera SDK, e.g. offline replay / benchmarks; connect() will fail
+    PySpin = None
 
 from cLogging import setup_logging
+from cLatency import stage_timer
+from cFramePool import cFramePool
+from cFITSWriter import cFITSWriter, compress_fits
+from cFrameStats import cFrameStats
 import logging, yaml
 
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
@@ -14,6 +22,35 @@ os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 config_file = str(Path(__file__).resolve().parent.parent / "config" / "guider.yaml")
 
 
+def roi_window(subframe, sensor, offset_inc=(1, 1), size_inc=(1, 1), min_size=(1, 1)):
+    """
+    sensor readout window covering a subframe, on the camera's increments
+
+    subframe   - (x, y, w, h) center col, center row, width, height in full-frame pixels
+    sensor     - (width, height) of the full frame
+    offset_inc - (x, y) step of the OffsetX / OffsetY nodes
+    size_inc   - (x, y) step of the Width / Height nodes
+    min_size   - (x, y) smallest Width / Height
+
+    returns (x0, y0, w, h): offsets and size to program, the window is grown
+    outwards (and moved back inside the sensor) so it contains the subframe
+    """
+    def _axis(center, size, full, o_inc, s_inc, s_min):
+        lo = max(center - size // 2, 0)
+        hi = min(center + size // 2, full)
+        lo = (lo // o_inc) * o_inc
+        n = -(-max(hi - lo, s_min) // s_inc) * s_inc
+        n = min(n, (full // s_inc) * s_inc)
+        if lo + n > full:
+            lo = max(((full - n) // o_inc) * o_inc, 0)
+        return lo, n
+
+    x, y, w, h = subframe
+    x0, nx = _axis(x, w, sensor[0], offset_inc[0], size_inc[0], min_size[0])
+    y0, ny = _axis(y, h, sensor[1], offset_inc[1], size_inc[1], min_size[1])
+    return x0, y0, nx, ny
+
+
 class cFLIR:
     def __init__(self, night, config_file=config_file):
         # Define attributes
@@ -36,9 +73,49 @@ class cFLIR:
         self.logger = setup_logging(log_dir=self.log_dir,
                                     log_name=self.name,
                                     log_level=logging.DEBUG)
+
+        # per-stage latency recorder shared with the guider / GUI (see cLatency);
+        # switched on/off once per process from latency_stats by the script's main()
+        self.timing = stage_timer
+
+        # read out only the subframe (OffsetX/OffsetY/Width/Height) instead of cropping
+        # the full frame; raw_data then covers self.roi and starts at raw_origin
+        self.hardware_roi = self.config.get('hardware_roi', True)
+        self.roi          = None     # programmed (x0, y0, w, h), None = unknown / full frame
+        self.raw_origin   = (0, 0)   # full-frame (col, row) of raw_data[0, 0]
+
+        # streaming session (start_stream / stream): acquisition keeps running between
+        # frames and camera nodes are only written when a setting changes
+        self.streaming = False
+        self.exposure  = None   # exposure time (us) programmed with auto exposure off, None = unknown
+        self._nodes    = {}     # node name -> value last written by _set_node
+        self._roi_limits = None # sensor size and ROI node increments, read once per connection
+
+        # frames are copied once, from the SDK buffer into a pooled buffer; raw_data is a
+        # read-only view of self.frame, which stays valid until the next frame arrives.
+        # Consumers keeping it longer take a reference: buf = camera.frame.retain() ... buf.release()
+        self.pool  = cFramePool(size=self.config.get('frame_pool_size', 8), logger=self.logger)
+        self.frame = None
+
+        # FITS files are written by a background thread so disk I/O never delays the next
+        # exposure (async_write: False writes them in the calling thread, as before),
+        # optionally tile-compressed in worker processes (compression, see cFITSWriter)
+        self.async_write = self.config.get('async_write', True)
+        self.writer = cFITSWriter(queue_size=self.config.get('write_queue', 16),
+                                  workers=self.config.get('write_workers', 1),
+                                  fsync_batch=self.config.get('fsync_batch', 8),
+                                  fsync_interval=self.config.get('fsync_interval', 2.0),
+                                  compression=self.config.get('compression', None),
+                                  processes=self.config.get('compress_processes', 2),
+                                  quality=self.config.get('quality_keywords', True),
+                                  saturation=self.config.get('saturation', 65000),
+                                  timer=self.timing, logger=self.logger)
         
 
     def connect(self):
+        if PySpin is None:
+            raise ImportError('PySpin (Spinnaker SDK) is not installed, cannot connect to the FLIR camera')
+
         # Retrieve singleton reference to system object
         self.system = PySpin.System.GetInstance()
 
@@ -69,14 +146,23 @@ class cFLIR:
 
             # Print device info
             self.device_info = self._get_device_info()
+            self.roi = None
+            self.exposure = None
+            self._nodes = {}
+            self._roi_limits = None
 
         except PySpin.SpinnakerException as ex:
                 print('Error: %s' % ex)
                 return False
 
     def disconnect(self):
+        # every queued FITS file is on disk before the camera goes away
+        self.writer.close()
+
         # Deinitialize camera
         try:
+            if self.streaming:
+                self.stop_stream()
             self.cam.DeInit()
 
             del self.cam
@@ -92,20 +178,193 @@ class cFLIR:
             self.logger.error('Could not disconnect camera')
 
     def expose(self,exposure_time,header_keys={},source="",writeToFile=True, subframe=None):
+        """
+        take one frame into self.raw_data
+
+        Inside a streaming session (start_stream / stream) this is the next frame of
+        the running acquisition: only an exposure or readout window change touches the
+        camera. Otherwise acquisition is started and stopped around the frame and auto
+        exposure restored afterwards.
+        """
         if not self._configure_exposure(exposure_time):
             raise RuntimeError('Could not configure exposure time on FLIR guider camera')
         header_keys['TARGET'] = source
 
-        # Acquire images
-        acquired = self.acquire_images(header_keys, writeToFile, subframe)
+        if self.streaming:
+            self._update_stream_roi(subframe)
+            acquired = self._grab(self._grab_timeout(), header_keys, writeToFile, subframe)
+        else:
+            # readout window: the subframe (if hardware_roi) or the full sensor
+            self.set_roi(subframe if self.hardware_roi else None)
 
-        # Reset exposure
-        self._reset_exposure()
+            # Acquire images
+            acquired = self.acquire_images(header_keys, writeToFile, subframe)
+
+            # Reset exposure
+            self._reset_exposure()
 
         if not acquired:
             self.logger.warning('FLIR guider image acquisition Failed.')
             raise RuntimeError('FLIR guider image acquisition failed (incomplete frame or camera error) — camera may have disconnected')
 
+    def _set_node(self, name, value):
+        """write a camera node (QuickSpin name) unless it already holds value from an earlier write"""
+        if self._nodes.get(name) == value:
+            return False
+        getattr(self.cam, name).SetValue(value)
+        self._nodes[name] = value
+        return True
+
+    def start_stream(self, exposure_time=None, subframe=None):
+        """
+        configure the camera once and leave acquisition running, so expose() / frames()
+        just pick up the next frame (the camera runs at its native rate meanwhile)
+
+        exposure_time - float, microseconds (default: keep the programmed one)
+        subframe      - (x, y, w, h) readout window if hardware_roi, see set_roi()
+        """
+        if self.streaming:
+            return
+        if exposure_time is not None and not self._configure_exposure(exposure_time):
+            raise RuntimeError('Could not configure exposure time on FLIR guider camera')
+        self.set_roi(subframe if self.hardware_roi else None)
+        self.stream_subframe = subframe
+        try:
+            self._set_node('AcquisitionMode', PySpin.AcquisitionMode_Continuous)
+            try:
+                # hand out the newest frame, not the oldest queued one (guiding wants the latest)
+                handling = self.cam.TLStream.StreamBufferHandlingMode
+                if handling.GetValue() != PySpin.StreamBufferHandlingMode_NewestOnly:
+                    handling.SetValue(PySpin.StreamBufferHandlingMode_NewestOnly)
+            except PySpin.SpinnakerException as ex:
+                self.logger.warning(f'Could not set stream buffer handling to NewestOnly: {ex}')
+            self.cam.BeginAcquisition()
+        except PySpin.SpinnakerException as ex:
+            raise RuntimeError(f'Could not start FLIR guider acquisition: {ex}')
+        self.streaming = True
+        self.logger.info('Started streaming acquisition')
+
+    def stop_stream(self):
+        """end the streaming session and restore auto exposure"""
+        if not self.streaming:
+            return
+        self.streaming = False
+        try:
+            self.cam.EndAcquisition()
+        except PySpin.SpinnakerException as ex:
+            self.logger.warning(f'Could not end FLIR guider acquisition: {ex}')
+        self._reset_exposure()
+        self.logger.info('Stopped streaming acquisition')
+
+    @contextmanager
+    def stream(self, exposure_time=None, subframe=None):
+        """
+        streaming session as a context manager:
+
+            with camera.stream(exposure_us, subframe) as cam:
+                for image, origin in cam.frames():
+                    ...
+        """
+        self.start_stream(exposure_time, subframe)
+        try:
+            yield self
+        finally:
+            self.stop_stream()
+
+    def frames(self, count=None, timeout=None, subframe=None):
+        """
+        iterate over the frames of the running stream
+
+        count    - int, stop after this many frames (default: until the stream stops)
+        timeout  - int, ms to wait per frame (default exposure time + 1 s)
+        subframe - (x, y, w, h) to crop (default the stream's subframe)
+        yields (image, (col, row)) like crop(); image is a view of raw_data, which a
+        later frame replaces (copy it to keep it). Incomplete frames are skipped.
+        """
+        subframe = self.stream_subframe if subframe is None else subframe
+        n = 0
+        while self.streaming and (count is None or n < count):
+            if not self._grab(timeout or self._grab_timeout(), writeToFile=False):
+                continue
+            n += 1
+            yield self.crop(subframe)
+
+    def _update_stream_roi(self, subframe):
+        """reprogram the readout window of a running stream if subframe needs another one (size nodes are locked while acquiring)"""
+        self.stream_subframe = subframe
+        if self._roi_for(subframe if self.hardware_roi else None) == self.roi:
+            return
+        self.cam.EndAcquisition()
+        self.set_roi(subframe if self.hardware_roi else None)
+        self.cam.BeginAcquisition()
+
+    def _grab_timeout(self):
+        """GetNextImage timeout in ms: exposure time + 1 s"""
+        return int((self.exposure or 0) / 1000 + 1000)
+
+    def set_roi(self, subframe=None):
+        """
+        program the sensor readout window so only the subframe crosses the GigE link
+
+        subframe - (x, y, w, h) center col, center row, width, height in full-frame
+                   pixels, or None for the full sensor
+        The window is aligned to the camera's increments, so it can be slightly larger
+        than the subframe (see crop()). Nothing is written if it is already programmed.
+
+        returns the programmed (x0, y0, w, h), or None if the camera refused it
+        """
+        try:
+            roi = self._roi_for(subframe)
+            if roi == self.roi:
+                return roi
+
+            # offsets to 0 first so every width / height is valid, then size, then offsets
+            x0, y0, w, h = roi
+            self.cam.OffsetX.SetValue(0)
+            self.cam.OffsetY.SetValue(0)
+            self.cam.Width.SetValue(w)
+            self.cam.Height.SetValue(h)
+            self.cam.OffsetX.SetValue(x0)
+            self.cam.OffsetY.SetValue(y0)
+        except PySpin.SpinnakerException as ex:
+            self.logger.error(f'Could not set readout window {subframe}: {ex}')
+            self.roi = None
+            return None
+
+        self.roi = roi
+        self.logger.info(f'Readout window set to {w}x{h} at ({x0}, {y0})')
+        return roi
+
+    def _roi_for(self, subframe):
+        """readout window (x0, y0, w, h) set_roi() would program for subframe"""
+        if self._roi_limits is None:
+            # constant for the camera, read once
+            self._roi_limits = dict(sensor=(self.cam.WidthMax.GetValue(), self.cam.HeightMax.GetValue()),
+                                    offset_inc=(self.cam.OffsetX.GetInc(), self.cam.OffsetY.GetInc()),
+                                    size_inc=(self.cam.Width.GetInc(), self.cam.Height.GetInc()),
+                                    min_size=(self.cam.Width.GetMin(), self.cam.Height.GetMin()))
+        if subframe is None:
+            return (0, 0) + self._roi_limits['sensor']
+        return roi_window(subframe, **self._roi_limits)
+
+    def crop(self, subframe=None):
+        """
+        the subframe of the last image, whatever window was read out
+
+        subframe - (x, y, w, h) center col, center row, width, height in full-frame
+                   pixels, or None for everything read out
+        returns (image, (col, row)): a view of raw_data and the full-frame position of
+        its [0, 0] pixel. The subframe is clipped to what was read out.
+        """
+        x0, y0 = self.raw_origin
+        if subframe is None:
+            return self.raw_data, (x0, y0)
+        x, y, w, h = subframe
+        nrows, ncols = self.raw_data.shape
+        c0, r0 = max(x - w//2, x0), max(y - h//2, y0)
+        c1, r1 = min(x + w//2, x0 + ncols), min(y + h//2, y0 + nrows)
+        return self.raw_data[r0 - y0:r1 - y0, c0 - x0:c1 - x0], (c0, r0)
+
     def _get_device_info(self):
         """
         This function prints the device information of the camera from the transport
@@ -193,6 +452,9 @@ class cFLIR:
         :rtype: bool
         """
 
+        if self.exposure == exposure_time:
+            return True # already programmed (and auto exposure off), nothing to write
+
         self.logger.info(f'Configuring Exposure Time to {exposure_time}us')
 
         try:
@@ -220,7 +482,7 @@ class cFLIR:
                     self.logger.error('Unable to disable automatic exposure. Aborting...')
                     return False
 
-                self.cam.ExposureAuto.SetValue(PySpin.ExposureAuto_Off)
+                self._set_node('ExposureAuto', PySpin.ExposureAuto_Off)
             except:
                 self.logger.error('Could not configure exposure time')
                 return False
@@ -245,6 +507,7 @@ class cFLIR:
                 self.logger.warning('Exposure time is greater than the maximum allowed. Capping to Max.')
             exposure_time_to_set = min(self.cam.ExposureTime.GetMax(), exposure_time)
             self.cam.ExposureTime.SetValue(exposure_time_to_set)
+            self.exposure = exposure_time
             self.logger.info('Guider Shutter time set to %s us...\n' % exposure_time_to_set)
 
         except PySpin.SpinnakerException as ex:
@@ -275,7 +538,8 @@ class cFLIR:
                 print('Unable to enable automatic exposure (node retrieval). Non-fatal error...')
                 return False
 
-            self.cam.ExposureAuto.SetValue(PySpin.ExposureAuto_Continuous)
+            self._set_node('ExposureAuto', PySpin.ExposureAuto_Continuous)
+            self.exposure = None # auto exposure changes it from here on
 
             print('Automatic exposure enabled...')
 
@@ -305,8 +569,8 @@ class cFLIR:
                 print('Unable to set acquisition mode to continuous. Aborting...')
                 return False
 
-            self.cam.AcquisitionMode.SetValue(PySpin.AcquisitionMode_Continuous)
-            print('Acquisition mode set to continuous...')
+            if self._set_node('AcquisitionMode', PySpin.AcquisitionMode_Continuous):
+                print('Acquisition mode set to continuous...')
 
             # Begin acquiring images
             self.cam.BeginAcquisition()
@@ -330,48 +594,71 @@ class cFLIR:
                 return False
 
             # Retrieve, convert, and save images
-            try:
-                # Retrieve next received image and ensure image completion
-                # By default, GetNextImage will block indefinitely until an image arrives.
-                # In this example, the timeout value is set to [exposure time + 1000]ms to ensure that an image has enough time to arrive under normal conditions
-                image_result = self.cam.GetNextImage(timeout)
-                self.last_time_tag = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H.%M.%S.%f")
+            result = self._grab(timeout, header_keys, writeToFile, subframe)
 
+            # End acquisition
+            self.cam.EndAcquisition()
 
-                if image_result.IsIncomplete():
-                    print('Image incomplete with image status %d...' % image_result.GetImageStatus())
-                    result = False
+        except PySpin.SpinnakerException as ex:
+            print('Error: %s' % ex)
+            result = False
 
-                else:
-                    # Print image information
-                    width = image_result.GetWidth()
-                    height = image_result.GetHeight()
-                    print('Grabbed Image width = %d, height = %d' % (width, height))
+        return result
+    
+    def _grab(self, timeout, header_keys={}, writeToFile=False, subframe=None):
+        """
+        retrieve the next image of the running acquisition into self.raw_data
+        (and write it to file if writeToFile)
 
-                    # Convert image to Mono8
-                    self.image_converted = image_result#.Convert(PySpin.PixelFormat_Mono8)
-                    
-                    raw_data = self.image_converted.GetData().astype(np.uint16)
-                    self.raw_data = raw_data.reshape(2160, 4096)
+        returns True if successful, False otherwise (incomplete frame or camera error)
+        """
+        result = True
+        try:
+            # Retrieve next received image and ensure image completion
+            # By default, GetNextImage will block indefinitely until an image arrives.
+            # In this example, the timeout value is set to [exposure time + 1000]ms to ensure that an image has enough time to arrive under normal conditions
+            t0 = self.timing.start()
+            image_result = self.cam.GetNextImage(timeout)
+            self.timing.stop('grab', t0)
+            self.last_time_tag = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H.%M.%S.%f")
 
-                    if writeToFile:  self.writeToFile(header_keys,subframe=subframe)
-                    
-                # Release image
-                image_result.Release()
 
-            except PySpin.SpinnakerException as ex:
-                print('Error: %s' % ex)
+            if image_result.IsIncomplete():
+                print('Image incomplete with image status %d...' % image_result.GetImageStatus())
                 result = False
 
-            # End acquisition
-            self.cam.EndAcquisition()
+            else:
+                # Print image information
+                width = image_result.GetWidth()
+                height = image_result.GetHeight()
+                if not self.streaming:
+                    print('Grabbed Image width = %d, height = %d' % (width, height))
+
+                # Convert image to Mono8
+                self.image_converted = image_result#.Convert(PySpin.PixelFormat_Mono8)
+                
+                t0 = self.timing.start()
+                # the one copy of the frame: SDK buffer -> pooled buffer (widened to uint16)
+                frame = self.pool.get((height, width))
+                np.copyto(frame.writable, self.image_converted.GetNDArray(), casting='unsafe')
+                if self.frame is not None:
+                    self.frame.release()
+                self.frame = frame
+                self.raw_data = frame.array
+                self.raw_origin = (image_result.GetXOffset(), image_result.GetYOffset())
+                self.timing.stop('convert', t0)
+
+                if writeToFile:  self.writeToFile(header_keys,subframe=subframe)
+                
+            # Release image
+            image_result.Release()
 
         except PySpin.SpinnakerException as ex:
             print('Error: %s' % ex)
             result = False
 
         return result
-    
+
     def writeToFile(self, header_keys={}, subframe=None):
         """Save data to file
         
@@ -393,44 +680,28 @@ class cFLIR:
         elif self.file_format=='FITS':
 
             filename = str(self.data_dir / f"guide_{source}_{self.last_time_tag}.fits")
-            if subframe is not None:
-                x, y, w, h = subframe   # x=col center, y=row center
-                image = self.raw_data[y-h//2:y+h//2, x-w//2:x+w//2]
-            else:
-                image = self.raw_data
-            
-            hdu = fits.PrimaryHDU(image)
+            image, (c0, r0) = self.crop(subframe)
 
-            for key, value in self.device_info.items():
-                hdu.header[key] = value
-            hdu.header['GTIME'] = self.last_time_tag
-
-            # subframe settings
+            # subframe settings (what was saved, the subframe may be clipped at the sensor edge)
+            subframe_meta = None
             if subframe is not None:
-                x, y, w, h = subframe
-                hdu.header['SFENAB'] = (True,  'subframe enabled')
-                hdu.header['SFX']    = (x,     'subframe center X (col)')
-                hdu.header['SFY']    = (y,     'subframe center Y (row)')
-                hdu.header['SFW']    = (w,     'subframe width (pixels)')
-                hdu.header['SFH']    = (h,     'subframe height (pixels)')
-            else:
-                hdu.header['SFENAB'] = (False, 'subframe enabled')
-
-            # add user input header keywords
-            for hdr_key in header_keys.keys():
-                hdu.header[hdr_key] = header_keys[hdr_key]
+                h, w = image.shape
+                subframe_meta = (c0 + w//2, r0 + h//2, w, h)
 
-            hdu.writeto(filename)
-            self.logger.info(f"Wrote guide image to {filename}")
+            # image is a view of the pooled frame: the writer holds a reference until it's written
+            self._write_fits(filename, image, self._fits_header(header_keys, subframe_meta),
+                             buffer=self.frame.retain())
         else:
             self.logger.error('File format in yaml file should be FITS or TIFF')
 
-    def writeArrayToFile(self, image, header_keys={}, subframe_meta=None, tag=""):
+    def writeArrayToFile(self, image, header_keys={}, subframe_meta=None, tag="", buffer=None):
         """Save an already-prepared image array (e.g. an average of several frames).
 
         Unlike writeToFile(), this does not read from self.raw_data and does not
         crop — pass in the image already at the size you want saved. subframe_meta
         (x, y, w, h), if given, is recorded in the header only (no cropping applied).
+        The file is written in the background: image must not change until then,
+        so pass the pooled buffer it lives in as buffer (or a copy as image).
 
         inputs
         ------
@@ -438,38 +709,65 @@ class cFLIR:
         header_keys (dict): FITS header keywords to add
         subframe_meta (tuple): (x, y, w, h) subframe center/size to record in the header
         tag (str): extra string inserted into the filename, e.g. "_avg"
+        buffer (cFrameBuffer): reference to the pooled buffer holding image, handed over
+            to the writer (released once the file is written, or right away on error)
         """
         source = header_keys.get('TARGET', "")
         self.last_time_tag = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H.%M.%S.%f")
 
         if self.file_format != 'FITS':
             self.logger.error('writeArrayToFile currently only supports FITS format')
+            if buffer is not None:
+                buffer.release()
             return
 
         filename = str(self.data_dir / f"guide_{source}{tag}_{self.last_time_tag}.fits")
+        self._write_fits(filename, image, self._fits_header(header_keys, subframe_meta), buffer)
 
-        hdu = fits.PrimaryHDU(image)
-
+    def _fits_header(self, header_keys, subframe_meta=None):
+        """fits.Header with the device info, GTIME, subframe keywords and header_keys"""
+        header = fits.Header()
         for key, value in self.device_info.items():
-            hdu.header[key] = value
-        hdu.header['GTIME'] = self.last_time_tag
+            header[key] = value
+        header['GTIME'] = self.last_time_tag
 
         if subframe_meta is not None:
             x, y, w, h = subframe_meta
-            hdu.header['SFENAB'] = (True,  'subframe enabled')
-            hdu.header['SFX']    = (x,     'subframe center X (col)')
-            hdu.header['SFY']    = (y,     'subframe center Y (row)')
-            hdu.header['SFW']    = (w,     'subframe width (pixels)')
-            hdu.header['SFH']    = (h,     'subframe height (pixels)')
+            header['SFENAB'] = (True,  'subframe enabled')
+            header['SFX']    = (x,     'subframe center X (col)')
+            header['SFY']    = (y,     'subframe center Y (row)')
+            header['SFW']    = (w,     'subframe width (pixels)')
+            header['SFH']    = (h,     'subframe height (pixels)')
         else:
-            hdu.header['SFENAB'] = (False, 'subframe enabled')
+            header['SFENAB'] = (False, 'subframe enabled')
 
+        # add user input header keywords
         for hdr_key in header_keys.keys():
-            hdu.header[hdr_key] = header_keys[hdr_key]
-
-        hdu.writeto(filename)
-        self.logger.info(f"Wrote averaged guide image to {filename}")
-
+            header[hdr_key] = header_keys[hdr_key]
+        return header
+
+    def _write_fits(self, filename, image, header, buffer=None):
+        """queue the file on the background writer (or write it now, async_write: False)"""
+        if self.async_write:
+            # blocks only if the writer is write_queue files behind
+            self.writer.submit(filename, image, header, buffer)
+            return
+        try:
+            t0 = self.timing.start()
+            if self.writer.quality:
+                for key, card in cFrameStats.of(image, buffer, self.writer.saturation).keywords().items():
+                    header[key] = card
+            if self.writer.compression and image.dtype.kind in 'iu':
+                filename += '.fz'
+                with open(filename, 'xb') as f:
+                    f.write(compress_fits(image, header, self.writer.compression))
+            else:
+                fits.PrimaryHDU(image, header=header).writeto(filename)
+            self.timing.stop('write', t0)
+            self.logger.info(f"Wrote guide image to {filename}")
+        finally:
+            if buffer is not None:
+                buffer.release()
 
 if __name__=='__main__':
     night = datetime.now(timezone.utc).strftime("%Y%m%d")
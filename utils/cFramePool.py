@@ -0,0 +1,114 @@
+import threading, logging
+import numpy as np
+
+
+class cFrameBuffer:
+    """
+    One pooled frame.
+
+    array is a read-only view of the frame; every holder that keeps it beyond the
+    current call takes a reference with retain() and gives it back with release().
+    When the last reference is released the memory goes back to the pool, so
+    holding `array` after release() is a bug (it will be overwritten).
+    """
+
+    def __init__(self, pool, capacity, dtype):
+        self.pool     = pool
+        self.data     = np.empty(capacity, dtype=dtype)   # flat storage, any shape up to capacity
+        self.refs     = 0
+        self.array    = None    # read-only (rows, cols) view handed to consumers
+        self.writable = None    # writable view of the same memory, for the producer only
+        self.meta     = {}      # derived data cached with the frame (e.g. cFrameStats), cleared on reuse
+
+    @property
+    def capacity(self):
+        return self.data.size
+
+    def _checkout(self, shape):
+        self.writable = self.data[:int(np.prod(shape))].reshape(shape)
+        self.array = self.writable.view()
+        self.array.flags.writeable = False
+        self.meta.clear()
+        self.refs = 1
+
+    def retain(self):
+        """take another reference, returns self"""
+        with self.pool.lock:
+            if self.refs <= 0:
+                raise RuntimeError('Frame buffer was already returned to the pool')
+            self.refs += 1
+        return self
+
+    def release(self):
+        """drop a reference; the buffer returns to the pool with the last one"""
+        with self.pool.lock:
+            if self.refs <= 0:
+                raise RuntimeError('Frame buffer released more often than retained')
+            self.refs -= 1
+            if self.refs == 0:
+                self.array = self.writable = None
+                self.pool._put_back(self)
+
+
+class cFramePool:
+    """
+    Pool of preallocated frame buffers, so continuous guiding copies each camera
+    frame exactly once (into a pooled buffer) and allocates nothing per frame.
+
+        buf = pool.get((rows, cols))         # 1 reference, owned by the caller
+        np.copyto(buf.writable, camera_data)
+        consumer(buf.retain())               # consumer calls buf.release() when done
+        buf.release()
+
+    Buffers are flat and reused for any frame shape that fits, so readout window
+    changes don't reallocate. When every buffer is in use, get() allocates one
+    more (counted in stats()['grown']) rather than stall the camera.
+    """
+
+    def __init__(self, size=6, dtype=np.uint16, logger=None):
+        """
+        size   - int, buffers kept by the pool (more are allocated while all are in use)
+        dtype  - dtype of the frames
+        """
+        self.size    = max(int(size), 1)
+        self.dtype   = np.dtype(dtype)
+        self.logger  = logger or logging.getLogger()
+        self.lock    = threading.Lock()
+        self._free   = []
+        self.n_alloc = 0     # buffers allocated in total
+        self.n_grown = 0     # allocations beyond size (every buffer was in use)
+
+    def get(self, shape):
+        """buffer for a frame of shape with one reference, its .writable view to fill in"""
+        n = int(np.prod(shape))
+        with self.lock:
+            buf = next((b for b in self._free if b.capacity >= n), None)
+            if buf is not None:
+                self._free.remove(buf)
+            elif self._free and self.n_alloc >= self.size:
+                # only smaller buffers are free (readout window grew): replace one
+                self._free.remove(min(self._free, key=lambda b: b.capacity))
+                self.n_alloc -= 1
+            if buf is None:
+                buf = cFrameBuffer(self, n, self.dtype)
+                self.n_alloc += 1
+                if self.n_alloc > self.size:
+                    self.n_grown += 1
+                    if self.n_grown == 1:
+                        self.logger.warning(f'Frame pool exhausted ({self.size} buffers in use), '
+                                            'allocating more - is a consumer not releasing frames?')
+            buf._checkout(shape)
+        return buf
+
+    def _put_back(self, buf):
+        """called with the lock held; buffers allocated beyond size are dropped"""
+        if self.n_alloc > self.size:
+            self.n_alloc -= 1
+        else:
+            self._free.append(buf)
+
+    def stats(self):
+        """dict with buffers allocated, free, in use and grown beyond size"""
+        with self.lock:
+            return {'allocated': self.n_alloc, 'free': len(self._free),
+                    'in_use': self.n_alloc - len(self._free), 'grown': self.n_grown}
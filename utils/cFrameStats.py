@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class cFrameStats:
+    """
+    Statistics of one frame from a single histogram pass.
+
+    For integer frames (uint8 / uint16) one bincount over the frame gives the
+    min, max, mean, std, any percentile (exactly as np.percentile), the
+    background (median) and noise (1.4826 MAD) and the saturated fraction, so
+    the display scale, image statistics and FITS quality keywords don't each
+    walk the 8.8 Mpx frame (np.percentile alone partitions it every call).
+    Other dtypes fall back to numpy reductions, percentiles computed on demand.
+
+    Use cFrameStats.of(image, buffer) to compute a frame's statistics once: with
+    the pooled cFrameBuffer the frame lives in, the result is cached on it and
+    every consumer of the frame (display, archive) gets the same object.
+    """
+
+    CHUNK = 1 << 18   # pixels per bincount call (keeps its intp temporary in cache)
+
+    def __init__(self, image, saturation=65000):
+        """
+        image      - 2D array
+        saturation - ADU at and above which a pixel counts as saturated
+        """
+        data = np.asarray(image)
+        self.shape      = data.shape
+        self.saturation = saturation
+        self.n          = data.size
+        self._pct       = {}
+        if data.dtype.kind == 'u' and data.dtype.itemsize <= 2:
+            self._from_histogram(data)
+        else:
+            self._from_data(data)
+
+    @classmethod
+    def of(cls, image, buffer=None, saturation=65000):
+        """statistics of image, cached on the cFrameBuffer holding it (if given)"""
+        if buffer is None:
+            return cls(image, saturation)
+        key = ('stats', image.__array_interface__['data'][0], image.shape, image.strides, saturation)
+        stats = buffer.meta.get(key)
+        if stats is None:
+            stats = buffer.meta[key] = cls(image, saturation)
+        return stats
+
+    def _from_histogram(self, data):
+        rows = max(self.CHUNK // max(data.shape[-1], 1), 1)
+        hist = np.zeros(np.iinfo(data.dtype).max + 1, dtype=np.int64)
+        for r0 in range(0, data.shape[0], rows):
+            counts = np.bincount(data[r0:r0 + rows].ravel())
+            hist[:len(counts)] += counts
+        levels = np.flatnonzero(hist)
+        self.min, self.max = int(levels[0]), int(levels[-1])
+        self.hist   = hist[self.min:self.max + 1]     # counts of ADU min..max
+        self.cdf    = np.cumsum(self.hist)
+        values      = np.arange(self.min, self.max + 1, dtype=np.float64)
+        self.mean   = float(self.hist @ values) / self.n
+        self.std    = float(np.sqrt(max(self.hist @ (values - self.mean)**2 / self.n, 0.0)))
+        self.n_saturated = int(self.hist[max(int(np.ceil(self.saturation)) - self.min, 0):].sum())
+        self.background  = self.percentile(50)
+        # MAD from the histogram of |value - median|
+        dev = np.abs(values - self.background)
+        order = np.argsort(dev, kind='stable')
+        cum = np.cumsum(self.hist[order])
+        self.noise = 1.4826 * float(dev[order][np.searchsorted(cum, (self.n - 1) // 2, side='right')])
+
+    def _from_data(self, data):
+        self.hist = self.cdf = None
+        finite = data[np.isfinite(data)] if data.dtype.kind == 'f' else data.ravel()
+        self._data  = finite
+        self.n      = finite.size
+        self.min    = float(finite.min())
+        self.max    = float(finite.max())
+        self.mean   = float(finite.mean())
+        self.std    = float(finite.std())
+        self.n_saturated = int(np.count_nonzero(finite >= self.saturation))
+        self.background  = self.percentile(50)
+        self.noise  = 1.4826 * float(np.median(np.abs(finite - self.background)))
+
+    def percentile(self, q):
+        """q-th percentile (0-100), linear interpolation between order statistics as np.percentile"""
+        if q not in self._pct:
+            if self.cdf is None:
+                self._pct[q] = float(np.percentile(self._data, q))
+            else:
+                rank = q / 100 * (self.n - 1)
+                k = int(np.floor(rank))
+                lo = self.min + int(np.searchsorted(self.cdf, k, side='right'))
+                hi = self.min + int(np.searchsorted(self.cdf, min(k + 1, self.n - 1), side='right'))
+                self._pct[q] = lo + (rank - k) * (hi - lo)
+        return self._pct[q]
+
+    @property
+    def saturated(self):
+        """fraction of pixels at or above saturation"""
+        return self.n_saturated / self.n if self.n else 0.0
+
+    def keywords(self):
+        """FITS quality keywords, {key: (value, comment)}"""
+        return {'DATAMIN':  (self.min,                     'minimum pixel value'),
+                'DATAMAX':  (self.max,                     'maximum pixel value'),
+                'DATAMEAN': (round(self.mean, 3),          'mean pixel value'),
+                'SKYLEVEL': (round(self.background, 3),    'median pixel value (ADU)'),
+                'SKYNOISE': (round(self.noise, 3),         'robust sigma, 1.4826 MAD (ADU)'),
+                'SATFRAC':  (float(f'{self.saturated:.3g}'), f'fraction of pixels >= {self.saturation}')}
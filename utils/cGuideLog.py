@@ -0,0 +1,197 @@
+import json, threading, time
+from pathlib import Path
+import numpy as np
+
+
+# one guide cycle; pixel quantities are in the coordinates of the centroided image
+# (subframe / ROI), arcsec and commands are in the cGuider.dx_arcs / dy_arcs frame
+GUIDE_DTYPE = np.dtype([
+    ('t',       'f8'),   # unix time of the frame's mid-exposure
+    ('t_cmd',   'f8'),   # unix time the TCS acknowledged the offset (nan if none sent)
+    ('seq',     'u4'),   # record number in the log file (continues across reopens)
+    ('found',   '?'),    # star found (False: no centroid, nothing commanded)
+    ('sent',    '?'),    # offset sent to the TCS
+    ('xc',      'f4'),   # centroid (col, row) in px
+    ('yc',      'f4'),
+    ('dx_px',   'f4'),   # offset from the target in px
+    ('dy_px',   'f4'),
+    ('dx_arcs', 'f4'),   # offset from the target in arcsec
+    ('dy_arcs', 'f4'),
+    ('cmd_x',   'f4'),   # commanded correction in arcsec
+    ('cmd_y',   'f4'),
+    ('flux',    'f4'),   # background subtracted ADU in the box around the centroid
+    ('fwhm',    'f4'),   # px, from the second moments
+    ('peak',    'f4'),   # ADU above background
+    ('method',  'S8'),   # centroid method
+    ('tcs',     'S16'),  # TCS reply to the offset
+])
+
+MAGIC       = b'GUIDELOG'
+HEADER_SIZE = 512
+
+
+class cGuideLog:
+    """
+    Per-frame guide record, held in a preallocated structured-array ring and
+    appended to a binary columnar file.
+
+    The file is a fixed HEADER_SIZE byte header (magic + JSON dtype description)
+    followed by raw GUIDE_DTYPE records, so a whole night reads back as one
+    np.memmap (see load()). Writing a record is a row store into the ring plus
+    one small write(), some 10 us for a full record.
+
+    A cycle is logged in two steps, because measuring and commanding may run on
+    different threads (pipelined GUI):
+
+        seq = log.begin(t=t_mid, found=True, xc=..., ...)   # after the centroid
+        log.update(seq, sent=True, cmd_x=..., ...)          # after the TCS acknowledged
+
+    Rows stay pending (in the ring only) until `lag` newer frames have begun or
+    the log is flushed/closed, then they go to disk in order. A late update()
+    rewrites its row in place, as long as the row is still in the ring.
+    """
+
+    def __init__(self, filename=None, size=4096, lag=2):
+        """
+        filename - str / Path of the binary log, or None to keep the ring in memory only.
+                   An existing file with the same record layout is appended to.
+        size     - int, records kept in the in-memory ring
+        lag      - int, frames a row stays pending for its update() before being written
+        """
+        self.size     = int(size)
+        self.lag      = max(int(lag), 1)
+        self.ring     = np.zeros(self.size, dtype=GUIDE_DTYPE)
+        self.blank    = np.zeros((), dtype=GUIDE_DTYPE)   # new rows: nan floats, False flags
+        for name in GUIDE_DTYPE.names:
+            if GUIDE_DTYPE[name].kind == 'f':
+                self.blank[name] = np.nan
+        self.n        = 0          # records begun in total
+        self.seq0     = 0          # records already in the file when it was opened
+        self.pending  = []         # ring indices not yet on disk, oldest first
+        self.lock     = threading.Lock()
+        self.filename = None
+        self.file     = None
+        if filename is not None:
+            self.open(filename)
+
+    def open(self, filename):
+        """open (or create) the binary log; a file with another layout is left alone and a new name used"""
+        filename = Path(filename)
+        if filename.exists() and filename.stat().st_size >= HEADER_SIZE:
+            try:
+                same = read_header(filename) == GUIDE_DTYPE
+            except ValueError:
+                same = False
+            if not same:
+                filename = filename.with_name(f"{filename.stem}_{time.strftime('%H.%M.%S')}{filename.suffix}")
+        new = not filename.exists() or filename.stat().st_size < HEADER_SIZE
+        self.file = open(filename, 'wb' if new else 'r+b')
+        if new:
+            self.file.write(make_header(GUIDE_DTYPE))
+        else:
+            # drop a partial record left by a crash so the rows stay aligned
+            size = filename.stat().st_size
+            self.file.truncate(size - (size - HEADER_SIZE) % GUIDE_DTYPE.itemsize)
+            self.file.seek(0, 2)
+        self.file.flush()
+        self.filename = filename
+        self.seq0 = (self.file.tell() - HEADER_SIZE) // GUIDE_DTYPE.itemsize
+
+    def begin(self, **fields):
+        """
+        start the record of a new frame; fields are GUIDE_DTYPE names, the rest
+        default to nan / False. returns the frame's seq, the key for update()
+        """
+        with self.lock:
+            i = self.n % self.size
+            self.ring[i] = self.blank
+            row = self.ring[i]
+            for name, value in fields.items():
+                row[name] = value
+            seq = self.seq0 + self.n
+            row['seq'] = seq
+            self.n += 1
+            self.pending.append(i)
+            while len(self.pending) > self.lag:
+                self._write(self.pending.pop(0))
+            return seq
+
+    def update(self, seq=None, **fields):
+        """
+        add fields (e.g. the command and TCS reply) to the record begun as seq
+        (default the latest); a record already on disk is rewritten in place.
+        returns False if the record has left the ring
+        """
+        with self.lock:
+            k = self.n - 1 if seq is None else seq - self.seq0
+            if not max(self.n - self.size, 0) <= k < self.n:
+                return False
+            i = k % self.size
+            for name, value in fields.items():
+                self.ring[i][name] = value
+            if i not in self.pending and self.file is not None:
+                self.file.seek(HEADER_SIZE + (self.seq0 + k) * GUIDE_DTYPE.itemsize)
+                self._write(i)
+                self.file.seek(0, 2)
+            return True
+
+    def _write(self, i):
+        if self.file is not None:
+            self.file.write(self.ring[i:i + 1].tobytes())
+            self.file.flush()
+
+    def flush(self):
+        """write every pending record"""
+        with self.lock:
+            while self.pending:
+                self._write(self.pending.pop(0))
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def history(self):
+        """records still in the ring, oldest first (a copy)"""
+        with self.lock:
+            if self.n <= self.size:
+                return self.ring[:self.n].copy()
+            i = self.n % self.size
+            return np.concatenate([self.ring[i:], self.ring[:i]])
+
+    def last(self):
+        """the latest record (a copy), or None"""
+        with self.lock:
+            return self.ring[(self.n - 1) % self.size].copy() if self.n else None
+
+
+def make_header(dtype):
+    header = MAGIC + json.dumps({'version': 1, 'descr': dtype.descr}).encode('ascii')
+    if len(header) > HEADER_SIZE:
+        raise ValueError('guide log record layout does not fit in the header')
+    return header.ljust(HEADER_SIZE, b' ')
+
+
+def read_header(filename):
+    """record dtype of a guide log file"""
+    with open(filename, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if not header.startswith(MAGIC):
+        raise ValueError(f'{filename} is not a guide log')
+    descr = json.loads(header[len(MAGIC):].decode('ascii'))['descr']
+    return np.dtype([tuple(field) for field in descr])
+
+
+def load(filename):
+    """
+    read a guide log back as a read-only structured array memory-mapped on the file
+    (a partial trailing record is ignored)
+
+    e.g. log = load('guide_20251208.glog'); log['t'], log['dx_arcs'][log['found']]
+    """
+    dtype = read_header(filename)
+    n = (Path(filename).stat().st_size - HEADER_SIZE) // dtype.itemsize
+    if n == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(n,))
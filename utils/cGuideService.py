@@ -0,0 +1,522 @@
+import json, socket, threading, time, logging
+import numpy as np
+
+from cPipeline import cGuidePipeline, cLatestSlot
+
+
+def send_message(sock, header, payload=None):
+    """one message: a JSON header line, then header['nbytes'] bytes of payload (a contiguous array) if given"""
+    if payload is not None:
+        header = dict(header, nbytes=payload.nbytes)
+    sock.sendall(json.dumps(header, default=_jsonable).encode() + b'\n')
+    if payload is not None:
+        sock.sendall(memoryview(payload).cast('B'))
+
+
+def read_message(stream):
+    """(header, payload bytes or None) of the next message on a socket file, (None, None) once it is closed"""
+    line = stream.readline()
+    if not line:
+        return None, None
+    header = json.loads(line)
+    payload = None
+    if header.get('nbytes'):
+        payload = stream.read(header['nbytes'])
+        if len(payload) < header['nbytes']:
+            return None, None
+    return header, payload
+
+
+def _jsonable(value):
+    """numpy scalars / arrays in message headers"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _release_message(item):
+    """give back the frame buffer reference a queued viewer message holds"""
+    if item[2] is not None:
+        item[2].release()
+
+
+class cGuideService:
+    """
+    Headless guide loop served on a local socket.
+
+    The camera, centroiding, TCS offsets and archiving run in a cGuidePipeline
+    (as the guiding GUI's pipelined mode) in this process, at the camera's pace.
+    Viewers and controllers connect over TCP and send one JSON command per line:
+
+        {"cmd": "start", "guide": true}       start the loop (settings may be given too)
+        {"cmd": "stop"}                       stop it
+        {"cmd": "set", "exposure": 0.05, "subframe": [1870, 1210, 256, 256], "target": [1870, 1210]}
+        {"cmd": "status"}                     settings, loop and viewer statistics
+        {"cmd": "subscribe", "frames": true, "rate": 5}
+        {"cmd": "shutdown"}                   ask the owner (blocked in wait()) to close the service
+
+    Every command gets a reply line {"ok": true, ...} or {"ok": false, "error": ...}.
+    After "subscribe" the connection also receives {"type": "result", ...} messages
+    (centroid and target in full-frame pixels, offsets in arcsec, see _publish),
+    with the image as `nbytes` of raw pixels following the line if frames is on.
+
+    Each viewer has its own newest-wins slot and sender thread: the loop only
+    posts results there, so a slow or stalled viewer skips results (counted in
+    its dropped count) instead of slowing guiding, and viewers can come and go
+    (or crash) while the loop runs.
+    """
+
+    # settings and their defaults; exposure / interval in seconds, subframe (x, y, w, h)
+    # and target (col, row) in full-frame pixels (None: full frame / image center)
+    SETTINGS = {'exposure': 0.01, 'interval': 1.0, 'subframe': None, 'target': None,
+                'guide': False, 'write': False, 'source': '', 'method': 'std', 'tracking': False}
+
+    def __init__(self, camera, guider, host='127.0.0.1', port=49300, rate=5.0,
+                 send_timeout=10.0, logger=None, **settings):
+        """
+        camera       - connected cFLIR
+        guider       - cGuider (its TCS session may be None: measure only)
+        host, port   - address to listen on (port 0: any free port, see self.port)
+        rate         - float, default results per second sent to a viewer
+        send_timeout - float, seconds a viewer may block a send before it is dropped
+        settings     - initial values of SETTINGS
+        """
+        self.camera       = camera
+        self.guider       = guider
+        self.host         = host
+        self.port         = port
+        self.rate         = rate
+        self.send_timeout = send_timeout
+        self.logger       = logger or logging.getLogger()
+        self.settings     = dict(self.SETTINGS)
+        self.lock         = threading.Lock()
+        self.pipeline     = None
+        self.viewers      = []
+        self.server       = None
+        self.stopped      = threading.Event()   # set by close() / the shutdown command
+        self._reset       = True    # guider lock / method change pending (applied on the process thread)
+        self._last_acquire = 0.0
+        self.seq          = 0       # frames acquired
+        self.set(**settings)
+
+    # ── Settings and loop control ────────────────────────────────────────────
+
+    def set(self, **settings):
+        """change settings (any of SETTINGS); they apply from the next frame"""
+        unknown = set(settings) - set(self.SETTINGS)
+        if unknown:
+            raise ValueError(f'Unknown setting(s) {sorted(unknown)}, use {sorted(self.SETTINGS)}')
+        if 'method' in settings and settings['method'] not in self.guider.METHODS:
+            raise ValueError(f"Unknown centroid method {settings['method']!r}, use one of {list(self.guider.METHODS)}")
+        for key in ('subframe', 'target'):
+            if settings.get(key) is not None:
+                settings[key] = [int(v) for v in settings[key]]
+        with self.lock:
+            self.settings.update(settings)
+            if {'subframe', 'target', 'method', 'tracking'} & set(settings):
+                self._reset = True
+
+    @property
+    def running(self):
+        return self.pipeline is not None
+
+    def start_loop(self):
+        """start acquisition, centroiding, offsets and archiving (no-op if running)"""
+        if self.pipeline is not None:
+            return
+        settings = self._snapshot()
+        self._last_acquire = 0.0
+        self.pipeline = cGuidePipeline(acquire=self._acquire,
+                                       process=self._measure,
+                                       command=self._command,
+                                       archive=self._archive,
+                                       on_result=self._publish,
+                                       on_drop=lambda item: self._release(item, 'buffer'),
+                                       logger=self.logger)
+        try:
+            self.camera.start_stream(settings['exposure'] * 1e6, settings['subframe'])
+        except Exception as e:
+            self.logger.warning(f'Streaming unavailable, exposing frame by frame: {e}')
+        self.pipeline.start()
+
+    def stop_loop(self):
+        """stop the loop; the archive queue is drained first"""
+        if self.pipeline is None:
+            return
+        pipeline, self.pipeline = self.pipeline, None
+        pipeline.stop()
+        self.camera.stop_stream()
+
+    def _snapshot(self):
+        with self.lock:
+            return dict(self.settings)
+
+    # ── Pipeline stages ──────────────────────────────────────────────────────
+
+    @staticmethod
+    def _release(item, key):
+        """give back the pooled buffer reference item[key] (once)"""
+        buffer = item.pop(key, None)
+        if buffer is not None:
+            buffer.release()
+
+    def _acquire(self):
+        settings = self._snapshot()
+        # pace to the guide interval when guiding; otherwise the camera runs back to back
+        interval = settings['interval'] if settings['guide'] else 0.0
+        wait = self._last_acquire + interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_acquire = time.monotonic()
+
+        t_mid = time.time() + 0.5 * settings['exposure']
+        header_keys = {}
+        if getattr(self.guider, 'session', None) is not None:
+            try:
+                header_keys = self.guider.telemetry(t_mid)
+            except Exception as e:
+                self.logger.warning(f'Could not fetch TCS telemetry for header: {e}')
+        header_keys['EXPTIME'] = settings['exposure']
+
+        sub = settings['subframe']
+        self.camera.expose(settings['exposure'] * 1e6, source=settings['source'],
+                           writeToFile=False, subframe=sub, header_keys=header_keys)
+        image, origin = self.camera.crop(sub)
+        buffer = self.camera.frame.retain()
+        self.seq += 1
+        return {'seq': self.seq, 'image': image, 'origin': origin, 't_mid': t_mid,
+                'header_keys': header_keys, 'settings': settings, 'buffer': buffer,
+                # separate reference for the archive stage, which gets the same dict
+                'archive': buffer.retain() if settings['write'] else None}
+
+    def _measure(self, frame):
+        settings = frame['settings']
+        with self.lock:
+            reset, self._reset = self._reset, False
+        if reset:
+            self.guider.centroid_method = settings['method']
+            self.guider.tracking = settings['tracking']
+            self.guider.reset_lock()
+
+        image = frame['image']
+        nrows, ncols = image.shape
+        x0, y0 = frame['origin']
+        if settings['target'] is not None:
+            col_t, row_t = settings['target'][0] - x0, settings['target'][1] - y0
+        else:
+            col_t, row_t = ncols // 2, nrows // 2
+        result = {'seq': frame['seq'], 'image': image, 'origin': frame['origin'], 't_mid': frame['t_mid'],
+                  'target': (col_t, row_t), 'centroid': None, 'guide': settings['guide'],
+                  'buffer': frame['buffer']}
+        try:
+            # measure() takes the target relative to the image center; with these references
+            # (as the GUI's EnhancedGuider) the offsets are centroid - target
+            measured = self.guider.measure(image, xref=col_t - nrows // 2, yref=row_t - ncols // 2,
+                                           t_frame=frame['t_mid'])
+        except Exception:
+            self._release(frame, 'buffer')   # the result won't reach the viewers
+            raise
+        if measured is not None:
+            result['centroid'] = measured[:2]
+            result['dx_arcs'], result['dy_arcs'] = self.guider.dx_arcs, self.guider.dy_arcs
+            result['log_seq'] = self.guider.log_seq
+        return result
+
+    def _command(self, result):
+        result['sent'] = False
+        if (result['guide'] and result['centroid'] is not None
+                and getattr(self.guider, 'session', None) is not None):
+            result['sent'] = self.guider.correct(result['dx_arcs'], result['dy_arcs'],
+                                                 t_frame=result['t_mid'], seq=result['log_seq'])
+
+    def _archive(self, frame):
+        if frame['archive'] is None:
+            return
+        try:
+            header = dict(frame['header_keys'])
+            header['TARGET'] = frame['settings']['source']
+            nrows, ncols = frame['image'].shape
+            x0, y0 = frame['origin']
+            sub_meta = (x0 + ncols // 2, y0 + nrows // 2, ncols, nrows) if frame['settings']['subframe'] else None
+            self.camera.writeArrayToFile(frame['image'], header_keys=header, subframe_meta=sub_meta,
+                                         buffer=frame.pop('archive'))   # released by the writer
+        finally:
+            self._release(frame, 'archive')   # only if it never reached the writer
+
+    def _publish(self, result):
+        """hand a result to every subscribed viewer (runs on the command stage thread, never blocks)"""
+        try:
+            x0, y0 = result['origin']
+            centroid = result['centroid']
+            header = {'type': 'result', 'seq': result['seq'], 't_mid': result['t_mid'],
+                      'origin': [x0, y0],
+                      'target': [result['target'][0] + x0, result['target'][1] + y0],
+                      'centroid': None if centroid is None else [centroid[0] + x0, centroid[1] + y0],
+                      'dx_arcs': result.get('dx_arcs'), 'dy_arcs': result.get('dy_arcs'),
+                      'sent': result.get('sent', False)}
+            for viewer in list(self.viewers):
+                if viewer.subscribed:
+                    if viewer.frames:
+                        viewer.slot.post((header, result['image'], result['buffer'].retain()))
+                    else:
+                        viewer.slot.post((header, None, None))
+        finally:
+            self._release(result, 'buffer')
+
+    # ── Socket service ───────────────────────────────────────────────────────
+
+    def start(self):
+        """listen for viewers (in a background thread); returns the port"""
+        self.stopped.clear()
+        self.server = socket.create_server((self.host, self.port))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, name='guide-service', daemon=True).start()
+        self.logger.info(f'Guide service listening on {self.host}:{self.port}')
+        return self.port
+
+    def _accept(self):
+        while not self.stopped.is_set():
+            try:
+                sock, addr = self.server.accept()
+            except OSError:
+                break   # server socket closed
+            viewer = _cViewer(self, sock, addr)
+            self.viewers.append(viewer)
+            viewer.start()
+            self.logger.info(f'Guide viewer connected from {addr[0]}:{addr[1]}')
+
+    def wait(self, timeout=None):
+        """block until shutdown (or timeout); returns True once shut down"""
+        return self.stopped.wait(timeout)
+
+    def close(self):
+        """stop the loop, disconnect every viewer and stop listening"""
+        self.stop_loop()
+        self.stopped.set()
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        for viewer in list(self.viewers):
+            viewer.close()
+
+    def handle(self, msg, viewer=None):
+        """reply dict to one command message"""
+        cmd = msg.pop('cmd', None)
+        if cmd in ('start', 'set'):
+            self.set(**msg)
+            if cmd == 'start':
+                self.start_loop()
+        elif cmd == 'stop':
+            self.stop_loop()
+        elif cmd == 'subscribe':
+            if viewer is None:
+                raise ValueError('subscribe needs a connection')
+            viewer.subscribe(msg.get('frames', False), msg.get('rate', self.rate))
+        elif cmd == 'shutdown':
+            self.stopped.set()   # the owner, in wait(), closes the service
+        elif cmd != 'status':
+            raise ValueError(f"Unknown command '{cmd}'")
+        return dict(self.status(), ok=True)
+
+    def status(self):
+        """settings, frames acquired, per-stage pipeline statistics and per-viewer shown / dropped counts"""
+        return {'running': self.running, 'settings': self._snapshot(), 'frames': self.seq,
+                'pipeline': self.pipeline.stats() if self.pipeline is not None else None,
+                'viewers': [dict(v.slot.stats(), address=f'{v.addr[0]}:{v.addr[1]}')
+                            for v in list(self.viewers) if v.subscribed]}
+
+    def format_stats(self):
+        """one line summary for the console / log"""
+        text = f'{self.seq} frames'
+        if self.pipeline is not None:
+            text += ' | ' + self.pipeline.format_stats()
+        for viewer in list(self.viewers):
+            if viewer.subscribed:
+                text += f' | viewer {viewer.addr[1]} {viewer.slot.format_stats()}'
+        return text
+
+
+class _cViewer:
+    """one connection: reads commands, and sends results from its own newest-wins slot"""
+
+    def __init__(self, service, sock, addr):
+        self.service    = service
+        self.sock       = sock
+        self.addr       = addr
+        self.slot       = cLatestSlot(on_drop=_release_message)
+        self.send_lock  = threading.Lock()
+        self.subscribed = False
+        self.frames     = False
+        self.rate       = service.rate
+        self.alive      = True
+        # a viewer that stops reading makes sends time out instead of hanging its thread
+        sock.settimeout(service.send_timeout)
+
+    def start(self):
+        threading.Thread(target=self._read, name=f'viewer-{self.addr[1]}', daemon=True).start()
+        threading.Thread(target=self._send, name=f'viewer-send-{self.addr[1]}', daemon=True).start()
+
+    def subscribe(self, frames, rate):
+        self.frames = bool(frames)
+        self.rate = float(rate)
+        self.slot.reset_stats()
+        self.subscribed = True
+
+    def _reply(self, reply):
+        with self.send_lock:
+            send_message(self.sock, reply)
+
+    def _read(self):
+        buf = b''
+        try:
+            while self.alive:
+                try:
+                    data = self.sock.recv(4096)
+                except socket.timeout:
+                    continue
+                if not data:
+                    break
+                buf += data
+                *lines, buf = buf.split(b'\n')
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    try:
+                        reply = self.service.handle(json.loads(line), self)
+                    except Exception as e:
+                        reply = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+                    self._reply(reply)
+        except OSError:
+            pass
+        self.close()
+
+    def _send(self):
+        try:
+            while self.alive:
+                item = self.slot.take(timeout=0.5)
+                if item is None:
+                    continue
+                t0 = time.monotonic()
+                header, image, buffer = item
+                try:
+                    header = dict(header, dropped=self.slot.n_dropped)
+                    if image is None:
+                        self._reply(header)
+                    else:
+                        data = np.ascontiguousarray(image)
+                        with self.send_lock:
+                            send_message(self.sock, dict(header, shape=list(data.shape), dtype=data.dtype.str), data)
+                finally:
+                    _release_message(item)
+                if self.rate > 0:
+                    time.sleep(max(1.0 / self.rate - (time.monotonic() - t0), 0))
+        except OSError as e:
+            self.service.logger.warning(f'Guide viewer {self.addr[0]}:{self.addr[1]} dropped: {e}')
+        self.close()
+
+    def close(self):
+        if not self.alive:
+            return
+        self.alive = False
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.slot.clear()
+        if self in self.service.viewers:
+            self.service.viewers.remove(self)
+        self.service.logger.info(f'Guide viewer {self.addr[0]}:{self.addr[1]} disconnected')
+
+
+class cGuideClient:
+    """
+    Connection to a cGuideService, for viewers and scripts.
+
+        guide = cGuideClient(port=49300)
+        guide.start(exposure=0.05, target=[1870, 1210], guide=True)
+        guide.subscribe(frames=True, rate=2)
+        header, image = guide.latest(timeout=5)    # newest result (image None without frames)
+        guide.close()
+
+    Replies and results share the connection; a reader thread sorts them, keeping
+    only the newest result, so a client that polls slowly never falls behind.
+    """
+
+    def __init__(self, host='127.0.0.1', port=49300, timeout=10.0):
+        self.timeout = timeout
+        self.sock    = socket.create_connection((host, port), timeout=timeout)
+        self.sock.settimeout(None)
+        self.stream  = self.sock.makefile('rb')
+        self.results = cLatestSlot()
+        self.replies = []
+        self.cond    = threading.Condition()
+        self.lock    = threading.Lock()   # one request at a time
+        self.closed  = False
+        threading.Thread(target=self._read, name='guide-client', daemon=True).start()
+
+    def _read(self):
+        try:
+            while True:
+                header, payload = read_message(self.stream)
+                if header is None:
+                    break
+                if header.get('type') == 'result':
+                    image = None
+                    if payload is not None:
+                        image = np.frombuffer(payload, dtype=header['dtype']).reshape(header['shape'])
+                    self.results.post((header, image))
+                else:
+                    with self.cond:
+                        self.replies.append(header)
+                        self.cond.notify_all()
+        except (OSError, ValueError):
+            pass
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def request(self, cmd, **args):
+        """send a command, returns its reply; raises RuntimeError if the service refused it"""
+        with self.lock:
+            send_message(self.sock, dict(args, cmd=cmd))
+            with self.cond:
+                if not self.cond.wait_for(lambda: self.replies or self.closed, self.timeout):
+                    raise TimeoutError(f"No reply to '{cmd}' from the guide service")
+                if not self.replies:
+                    raise ConnectionError('Guide service closed the connection')
+                reply = self.replies.pop(0)
+        if not reply.get('ok'):
+            raise RuntimeError(f"Guide service: {reply.get('error')}")
+        return reply
+
+    def start(self, **settings):
+        return self.request('start', **settings)
+
+    def stop(self):
+        return self.request('stop')
+
+    def set(self, **settings):
+        return self.request('set', **settings)
+
+    def status(self):
+        return self.request('status')
+
+    def subscribe(self, frames=False, rate=5.0):
+        return self.request('subscribe', frames=frames, rate=rate)
+
+    def shutdown(self):
+        return self.request('shutdown')
+
+    def latest(self, timeout=None):
+        """(header, image) of the newest result not seen yet, waiting up to timeout; None if there is none"""
+        return self.results.take(timeout=timeout)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
@@ -1,34 +1,125 @@
 from datetime import datetime,timezone
+import time
 import numpy as np
 import sys
 from pathlib import Path
 #import telnetlib
-import socket
 from scipy import signal
 from PIL import Image
 
 sys.path.insert(0, str(Path(__file__).resolve() ))
-from cFLIR import cFLIR
+from cFLIR import cFLIR, config_file
+from cCentroid import cCentroidFilter, cPyramidSearch, marginal_std_peak
+from cTracker import cROITracker
+from cSubpixel import cSubpixelCentroid
+from cRegistration import cPhaseCorrelator
+from cMultiStar import cMultiStarGuide
+from cTCSClient import cTCSClient
+from cTelemetry import cTelemetryPoller
+from cController import make_controller
+from cGuideLog import cGuideLog
 
 
 class cGuider(cFLIR):
-    def __init__(self,night):
-        super().__init__(night) # do this to get logger and config
+    # centroid methods _find_centroid dispatches on (see centroid_method below)
+    METHODS = ('std', 'com', 'pyramid', *cSubpixelCentroid.METHODS, 'register', 'multi')
+
+    def __init__(self,night,config_file=config_file,guide_log=None):
+        """
+        guide_log - str / Path of the binary guide log, False to keep the records in
+                    memory only, or None (default) for log_dir/guide_<night>.glog
+                    when the config's guide_log is on
+        """
+        super().__init__(night,config_file) # do this to get logger and config
 
         self.logger.info('Trying to connect to TCS')
-        self.centroid_method = 'std'  # 'std' (marginal std) or 'com' (center of mass)
+        # 'std' (marginal std), 'com' (center of mass), 'pyramid' (coarse-to-fine) or
+        # one of the sub-pixel methods 'wcom' (windowed com), 'gauss' (2D fit), 'quad' (peak interpolation)
+        # or 'register' (phase correlation against a reference frame taken at guide start)
+        # or 'multi' (combined offset of all detected stars against the guide-start catalogue)
+        self.centroid_method = 'std'
+        self.centroid_filter = cCentroidFilter(size=70, sigma=8) # cached smoothing kernel for 'std'
+        self.pyramid = cPyramidSearch(factor=self.config.get('pyramid_factor', 8),
+                                      refine_box=self.config.get('pyramid_refine_box', 64))
+        self.subpixel = cSubpixelCentroid(fwhm=self.config.get('psf_fwhm', 4.0))
+        self.centroid_err = None # (xerr, yerr) 1-sigma pixels, set by the sub-pixel methods
+        self.registration = cPhaseCorrelator(whiten=self.config.get('register_whiten', 0.25),
+                                             lowpass=self.config.get('register_lowpass', 0.05))
+        self.multistar = cMultiStarGuide(nsigma=self.config.get('multi_nsigma', 5.0),
+                                         max_stars=self.config.get('multi_max_stars', 20),
+                                         match_radius=self.config.get('multi_match_radius', 20.0),
+                                         saturation=self.config.get('saturation', 65000),
+                                         fwhm=self.config.get('psf_fwhm', 4.0),
+                                         min_stars=self.config.get('multi_min_stars', 1))
+
+        # ROI tracking: once the star is found only a window around it is centroided
+        self.tracking = self.config.get('tracking', False)
+        self.tracker  = cROITracker(window=self.config.get('track_window', 128),
+                                    max_window=self.config.get('track_max_window', 512),
+                                    min_snr=self.config.get('track_min_snr', 8.0))
+        self.star_found = False
+
+        # guide loop controller ('p' = the old fixed gain, 'pi', 'pid' or 'kalman')
+        self.controller = make_controller(self.config.get('controller', 'p'),
+                                          kp=self.config.get('controller_kp', 0.5),
+                                          ki=self.config.get('controller_ki', 0.0),
+                                          kd=self.config.get('controller_kd', 0.0),
+                                          smith=self.config.get('controller_smith', False),
+                                          settle=self.config.get('controller_settle', 1.0),
+                                          q=self.config.get('kalman_q', 0.01),
+                                          r=self.config.get('kalman_r', 0.04))
+
+        # per-frame guide record: ring in memory, appended to log_dir/guide_<night>.glog
+        if guide_log is None and self.config.get('guide_log', True):
+            guide_log = Path(self.log_dir) / f"guide_{self.night}.glog"
+        self.guide_log = cGuideLog(guide_log or None, size=self.config.get('guide_log_size', 4096))
+        self.log_seq = None   # guide log record of the latest measured frame
 
     def connect(self):
-        """connect to TCS via TCP socket"""
+        """
+        connect to TCS via the asyncio client (framed replies, pipelining, auto-reconnect)
+        self.session is None if the TCS could not be reached
+        """
         self.session = None
-        try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(self.config['TIMEOUT'])
-            sock.connect((self.config['HOST_IP'], self.config['PORT']))
-            self.session = sock
-            self.logger.info(f"Connected to TCS at {self.config['HOST_IP']}:{self.config['PORT']}")
-        except Exception as e:
-            self.logger.error(f"Couldn't connect to TCS at {self.config['HOST_IP']}:{self.config['PORT']}: {e}")
+        tcs = cTCSClient(self.config['HOST_IP'], self.config['PORT'],
+                         timeout=self.config['TIMEOUT'],
+                         connect_timeout=self.config.get('tcs_connect_timeout', 5.0),
+                         backoff=tuple(self.config.get('tcs_reconnect_backoff', (0.5, 10.0))),
+                         idle=self.config.get('tcs_reply_idle', 0.05),
+                         logger=self.logger)
+        if tcs.connect():
+            self.session = tcs
+            if self.config.get('telemetry_interval', 1.0):
+                self.start_telemetry()
+
+    def start_telemetry(self, interval=None):
+        """poll the TCS in the background so frames don't wait on get_telemetry() (see telemetry())"""
+        self.stop_telemetry()
+        interval = interval or self.config.get('telemetry_interval', 1.0)
+        self.telemetry_poller = cTelemetryPoller(self.get_telemetry, interval=interval,
+                                                 size=self.config.get('telemetry_buffer', 256),
+                                                 logger=self.logger)
+        self.telemetry_poller.start()
+
+    def stop_telemetry(self):
+        poller = getattr(self, 'telemetry_poller', None)
+        if poller is not None:
+            poller.stop()
+        self.telemetry_poller = None
+
+    def telemetry(self, t=None):
+        """
+        header telemetry for unix time t (default now)
+
+        served from the background poller (RA/DEC/AIRMASS interpolated to t) when it
+        is running and has data, otherwise fetched from the TCS with get_telemetry()
+        """
+        poller = getattr(self, 'telemetry_poller', None)
+        if poller is not None and poller.running:
+            snapshot = poller.snapshot(t)
+            if snapshot is not None:
+                return snapshot
+        return dict(self.get_telemetry())
 
     def _load_image(self,filename,subframe=500):
         """
@@ -50,32 +141,46 @@ class cGuider(cFLIR):
         """Dispatch to the selected centroid algorithm (set via self.centroid_method)."""
         if self.centroid_method == 'com':
             return self._find_centroid_com(data)
+        if self.centroid_method == 'pyramid':
+            return self._find_centroid_pyramid(data)
+        if self.centroid_method in cSubpixelCentroid.METHODS:
+            return self._find_centroid_subpixel(data)
+        if self.centroid_method == 'register':
+            return self._find_centroid_register(data)
+        if self.centroid_method == 'multi':
+            return self._find_centroid_multi(data)
         return self._find_centroid_std(data)
 
+    def _locate(self, data):
+        """
+        Centroid data, going through the ROI tracker when self.tracking is on.
+
+        returns (x, y) in data coords, or None if the tracker or multi-star match lost the star
+        """
+        t0 = self.timing.start()
+        if self.tracking and self.centroid_method not in ('register', 'multi'):
+            centroid = self.tracker.update(data, self._find_centroid)
+        else:
+            centroid = self._find_centroid(data)
+        self.timing.stop('centroid', t0)
+        return centroid
+
+    def reset_lock(self):
+        """Drop the ROI tracking lock, the registration / multi-star references and the controller state (guide start / geometry change)."""
+        self.tracker.reset()
+        self.registration.reset()
+        self.multistar.reset()
+        self.controller.reset()
+
     def _find_centroid_std(self, data):
         """
         Marginal standard-deviation centroid.
         Blurs the image then finds the column/row with the highest variance.
         Robust to noise but assumes one dominant source and image size >= 300 px.
+        The gaussian kernel spectrum is cached per image shape in self.centroid_filter.
         """
-        kernel = np.outer(signal.windows.gaussian(70, 8), signal.windows.gaussian(70, 8))
-        blurred = signal.fftconvolve(data, kernel, mode='same')
-
-        xstd = np.std(blurred, axis=0)
-        ystd = np.std(blurred, axis=1)
-
-        # Subtract background estimated from a central strip, normalise
-        bg_cols = min(100, len(xstd) // 4)
-        bg_rows = min(100, len(ystd) // 4)
-        xstdn = (xstd - np.median(xstd[bg_cols : bg_cols * 3])) / max(xstd)
-        ystdn = (ystd - np.median(ystd[bg_rows : bg_rows * 3])) / max(ystd)
-
-        try:
-            x = np.where(xstdn == max(xstdn))[0][0]
-            y = np.where(ystdn == max(ystdn))[0][0]
-        except IndexError:
-            x, y = data.shape[1] // 2, data.shape[0] // 2
-
+        blurred = self.centroid_filter.smooth(data)
+        x, y = marginal_std_peak(blurred)
         return x, y
 
     def _find_centroid_com(self, data):
@@ -97,6 +202,78 @@ class cGuider(cFLIR):
         y = int(round(np.sum(rows * d) / total))
         return x, y
 
+    def _find_centroid_pyramid(self, data):
+        """
+        Coarse-to-fine centroid for full-frame acquisition.
+        Finds the brightest blob on a binned copy of the frame, then refines with
+        the center-of-mass centroid on a full resolution box around it.
+        """
+        return self.pyramid.centroid(data, refine=self._find_centroid_com)
+
+    def _find_centroid_subpixel(self, data):
+        """
+        Sub-pixel centroid (centroid_method 'wcom', 'gauss' or 'quad').
+        The star is found with the pyramid coarse search, then the pyramid refine box
+        is measured by self.subpixel. Returns float pixels; the 1-sigma errors are
+        stored in self.centroid_err.
+        """
+        self.subpixel.method = self.centroid_method
+        return self.pyramid.centroid(data, refine=self._refine_subpixel)
+
+    def _refine_subpixel(self, cutout):
+        """measure a cutout with the sub-pixel engine, keep the errors, return (x, y)"""
+        x, y, xerr, yerr = self.subpixel.measure(cutout)
+        self.centroid_err = (xerr, yerr)
+        return x, y
+
+    def _find_centroid_register(self, data):
+        """
+        Phase-correlation 'centroid' for extended or faint targets.
+        The first frame (or the first after reset_lock / a shape change) becomes the
+        reference and is assumed to be on target. Later frames are registered against
+        it and the shift is returned as a pseudo-centroid (target + shift), so that
+        _calc_offset yields the shift itself.
+        """
+        if self.registration.shape != np.shape(data):
+            if self.registration.has_reference:
+                self.logger.warning('Guide frame shape changed, taking a new registration reference')
+            self.registration.set_reference(data)
+            shift = (0.0, 0.0)
+        else:
+            shift = self.registration.shift(data)
+
+        Nx, Ny = np.shape(data) # same convention as _calc_offset
+        xref = getattr(self, 'xref', 0)
+        yref = getattr(self, 'yref', 0)
+        return Nx//2 + xref + shift[0], Ny//2 + yref + shift[1]
+
+    def _find_centroid_multi(self, data):
+        """
+        Multi-star pseudo-centroid.
+        The first frame (or the first after reset_lock / a shape change) is detected
+        and kept as the reference catalogue, assumed on target. Later frames return
+        target + the sigma-clipped mean shift of all matched stars, so _calc_offset
+        yields that shift. Returns None when no star can be matched, or while the
+        frame has too few stars for a reference (detection is retried every frame).
+        """
+        if self.multistar.shape != np.shape(data):
+            nstars = self.multistar.set_reference(data)
+            if not self.multistar.has_reference:
+                self.logger.warning(f'Multi-star reference: {nstars} stars found (need '
+                                    f'{self.multistar.min_stars}), retrying on the next frame')
+                return None
+            self.logger.info(f'Multi-star reference catalogue: {nstars} stars')
+            shift = (0.0, 0.0)
+        else:
+            shift = self.multistar.offset(data)
+            if shift is None:
+                return None
+
+        Nx, Ny = np.shape(data) # same convention as _calc_offset
+        xref = getattr(self, 'xref', 0)
+        yref = getattr(self, 'yref', 0)
+        return Nx//2 + xref + shift[0], Ny//2 + yref + shift[1]
+
     def _calc_offset(self,xcentroid,ycentroid,Nx, Ny,xref=0,yref=0):
         """
         computes the offset
@@ -151,34 +328,57 @@ class cGuider(cFLIR):
         plate_scale = self._calc_plate_scale(mag=1.95) # arsec/pixel
         return dx * plate_scale, dy * plate_scale
 
-    def _send_command(self, cmd, bufsize=4096):
-        """Send a command string over the socket and return the response."""
+    def _send_command(self, cmd, timeout=None):
+        """Send a command string to the TCS and return the complete response."""
         if self.session is None:
             raise ConnectionError("TCS socket is not connected")
-        self.session.sendall(cmd.encode('ascii'))
-        return self.session.recv(bufsize).decode('ascii')
+        t0 = self.timing.start()
+        reply = self.session.request(cmd, timeout)
+        self.timing.stop('tcs_' + cmd.split()[0].lstrip('?'), t0)
+        return reply
 
     def expose(self, exposure_time, header_keys={}, source="", writeToFile=True, subframe=None):
         """Wrap cFLIR.expose to inject TCS telemetry into the FITS header."""
         merged = dict(header_keys)
         try:
-            merged.update(self.get_telemetry())
+            # telemetry at mid-exposure (exposure_time is in microseconds)
+            merged.update(self.telemetry(time.time() + 0.5e-6 * exposure_time))
         except Exception as e:
             self.logger.warning(f"Could not fetch TCS telemetry for header: {e}")
         super().expose(exposure_time, header_keys=merged, source=source,
                        writeToFile=writeToFile, subframe=subframe)
 
     def disconnect(self):
-        """disconnect socket"""
+        """disconnect socket, drain the FITS writer, close the guide log, and write the night's latency statistics to the log dir"""
+        self.stop_telemetry()
+        self.guide_log.close()
+        self.writer.close()
+        self.dump_latency()
         try:
             self.session.close()
-            self.logger.info('Closed socket connection')
         except:
             self.logger.warning("Couldn't close socket connection")
         
         # disconnect camera
         #super().disconnect()
 
+    def dump_latency(self):
+        """
+        log the per-stage p50/p95/p99 and write them (plus raw samples) to log_dir/latency_<time>.json;
+        the shared recorder is cleared once written, so each file covers one session
+        """
+        if not self.timing.buffers:
+            return None
+        self.logger.info('Guide cycle latency per stage:\n' + self.timing.format_stats())
+        filename = Path(self.log_dir) / f"latency_{datetime.now(timezone.utc).strftime('%Y-%m-%dT%H.%M.%S')}.json"
+        try:
+            filename = self.timing.dump(filename)
+        except OSError as e:
+            self.logger.warning(f"Couldn't write latency statistics to {filename}: {e}")
+            return None
+        self.timing.clear()
+        return filename
+
     def offset_to_TCS(self, dx_arcs, dy_arcs):
         """
         send offset to TCS???
@@ -219,20 +419,21 @@ class cGuider(cFLIR):
         plt.arrow(xcent,ycent,-1*dx,-1*dy,length_includes_head=True,head_width=10)
         plt.pause(0.1)
 
-    def run(self,data,subframe=None,ploton=False,xref=0,yref=0,gain=0.5):
+    def measure(self,data,subframe=None,xref=0,yref=0,t_frame=None):
         """
-        run centroid finder and push offset to telescope
+        run centroid finder and compute the offset, without sending anything to the TCS
         inputs:
         -------
-        data  - guide camera image
-        xref  - reference x pixel offset from center (default 0)
-        yref  - reference y pixel offset from center (default 0)
-        gain  - proportional gain applied to correction before sending to TCS (default 0.5)
-                values < 1 prevent runaway oscillation from latency/mechanical lag
-        """
-        # data comes from memory now, but can edit this later to load file if data is string(filename)
-        #data = load_image(filename,subframe=subframe)
+        data    - guide camera image
+        xref    - reference x pixel offset from center (default 0)
+        yref    - reference y pixel offset from center (default 0)
+        t_frame - unix time of mid-exposure of data (default now), keys the guide log record
 
+        returns
+        -------
+        (xcentroid, ycentroid, dx, dy) in pixels, or None if the star was not found.
+        offsets in arcsec are stored in self.dx_arcs, self.dy_arcs
+        """
         # apply subframe
         if subframe is not None:
             x0,xf,y0,yf = subframe
@@ -245,13 +446,121 @@ class cGuider(cFLIR):
         self.xref, self.yref = xref, yref
 
         # fit centroid offset in arcsec
-        xcentroid, ycentroid = self._find_centroid(self.subdata)
+        centroid = self._locate(self.subdata)
+        self.star_found = centroid is not None
+        if not self.star_found:
+            self.logger.warning('Star not found (tracking window / multi-star match), skipping correction')
+            self._log_measurement(t_frame)
+            return None
+        xcentroid, ycentroid = centroid
         dx, dy               = self._calc_offset(xcentroid,ycentroid, Nx, Ny,self.xref,self.yref) # *** note: x plots as y axis in python
         self.dx_arcs, self.dy_arcs     = self._pixel_to_arcsec(dx,dy) 
+        self._log_measurement(t_frame, centroid, dx, dy)
+        return xcentroid, ycentroid, dx, dy
+
+    def _star_stats(self, data, xc, yc):
+        """
+        (flux, fwhm, peak) of the star at (xc, yc) for the guide log, nan where undefined
+
+        box of +-2 psf_fwhm around the centroid; background and noise from the box edge,
+        fwhm from the second moments of the pixels 3 sigma above the background
+        """
+        nan = (np.nan, np.nan, np.nan)
+        if self.centroid_method in ('register', 'multi') or not np.isfinite(xc + yc):
+            return nan  # pseudo-centroid, not a star position
+        half = int(np.ceil(2 * self.config.get('psf_fwhm', 4.0)))
+        r0, c0 = int(round(yc)) - half, int(round(xc)) - half
+        if r0 < 0 or c0 < 0 or r0 + 2 * half >= data.shape[0] or c0 + 2 * half >= data.shape[1]:
+            return nan
+        cut = data[r0:r0 + 2 * half + 1, c0:c0 + 2 * half + 1].astype(np.float32)
+        edge = np.concatenate([cut[0], cut[-1], cut[1:-1, 0], cut[1:-1, -1]])
+        bkg = np.median(edge)
+        noise = 1.4826 * np.median(np.abs(edge - bkg))
+        cut -= bkg
+        w = np.where(cut > 3 * noise, cut, 0)
+        total = w.sum()
+        if total <= 0:
+            return float(cut.sum()), np.nan, float(cut.max())
+        rows, cols = np.indices(cut.shape)
+        my, mx = (rows * w).sum() / total, (cols * w).sum() / total
+        var = (((rows - my)**2 + (cols - mx)**2) * w).sum() / (2 * total)
+        return float(cut.sum()), float(2.3548 * np.sqrt(var)), float(cut.max())
+
+    def _log_measurement(self, t_frame, centroid=None, dx=np.nan, dy=np.nan):
+        """start the guide log record of a measured frame (centroid None: star not found), sets log_seq"""
+        t_frame = time.time() if t_frame is None else t_frame
+        if centroid is None:
+            self.log_seq = self.guide_log.begin(t=t_frame, found=False, method=self.centroid_method)
+            return
+        flux, fwhm, peak = self._star_stats(self.subdata, *centroid)
+        self.log_seq = self.guide_log.begin(t=t_frame, found=True, xc=centroid[0], yc=centroid[1],
+                             dx_px=dx, dy_px=dy, dx_arcs=self.dx_arcs, dy_arcs=self.dy_arcs,
+                             flux=flux, fwhm=fwhm, peak=peak, method=self.centroid_method)
+
+    def correct(self,dx_arcs,dy_arcs,gain=None,t_frame=None,seq=None,now=None):
+        """
+        run the guide controller on the measured offset and send its output to the TCS
+        offsets of 10 arcsec or more are ignored
+
+        gain    - if given, plain proportional correction with this gain instead of self.controller
+        t_frame - unix time of the measured frame's mid-exposure (default now), used for
+                  the latency compensation of the controller
+        seq     - guide log record of the measured frame (default log_seq, the latest);
+                  pass it when measuring and commanding run on different threads
+        now     - unix time of this cycle on the clock of t_frame (default time.time());
+                  given when replaying archived frames, the TCS round trip is added to
+                  it for the acknowledgement time
+
+        returns True if an offset was sent
+        """
+        if not (np.abs(dx_arcs) < 10 and np.abs(dy_arcs) < 10):
+            return False
+        if gain is not None:
+            ux, uy = gain * dx_arcs, gain * dy_arcs
+        else:
+            ux, uy = self.controller.update(dx_arcs, dy_arcs, t_frame, now=now)
+        ux, uy = np.round(ux,2), np.round(uy,2)
+        t_send = time.time()
+        reply = self.offset_to_TCS(ux, uy)
+        t_ack = time.time()
+        if now is not None:
+            t_ack = now + (t_ack - t_send)
+        self.controller.commanded(ux, uy, t_ack)
+        seq = self.log_seq if seq is None else seq
+        if not self.guide_log.update(seq, sent=True, t_cmd=t_ack, cmd_x=ux, cmd_y=uy,
+                                     tcs=str(reply).strip()[:16].encode('ascii', 'replace')):
+            self.logger.warning(f'Guide log record {seq} has left the ring, offset {ux}, {uy} not logged')
+        self.logger.debug(f'Controller: {self.controller.format_terms()}')
+        return True
+
+    def reset_controller(self):
+        """clear the controller state (integral, drift estimate, in-flight commands)"""
+        self.controller.reset()
+
+    def run(self,data,subframe=None,ploton=False,xref=0,yref=0,gain=None,t_frame=None,now=None):
+        """
+        run centroid finder and push offset to telescope
+        inputs:
+        -------
+        data    - guide camera image
+        xref    - reference x pixel offset from center (default 0)
+        yref    - reference y pixel offset from center (default 0)
+        gain    - fixed proportional gain overriding the configured controller (default None)
+        t_frame - unix time of mid-exposure of data (default now)
+        now     - unix time of this cycle on the clock of t_frame (default time.time(), see correct())
+        """
+        # data comes from memory now, but can edit this later to load file if data is string(filename)
+        #data = load_image(filename,subframe=subframe)
+        t0 = self.timing.start()
+        measured = self.measure(data, subframe=subframe, xref=xref, yref=yref, t_frame=t_frame)
+        if measured is None:
+            self.timing.stop('guide', t0)
+            return
+        xcentroid, ycentroid, dx, dy = measured
 
         # send to TCS if less than 10 arcsec
-        if np.abs(self.dx_arcs) < 10 and np.abs(self.dy_arcs) < 10:
-            self.offset_to_TCS(np.round(gain * self.dx_arcs,2), np.round(gain * self.dy_arcs,2))
+        self.correct(self.dx_arcs, self.dy_arcs, gain=gain, t_frame=t_frame, now=now)
+        self.timing.stop('guide', t0)
 
         if ploton: self.plot_summary(self.subdata,xcentroid,ycentroid,dx,dy,self.dx_arcs,self.dy_arcs)
 
@@ -265,9 +574,15 @@ class cGuider(cFLIR):
 
         """
         self.header_keys = {}
+        if self.session is None:
+            raise ConnectionError("TCS socket is not connected")
+
+        # all three requests go out back to back, replies are matched in order
+        t0 = self.timing.start()
+        REQPOS, NAME, REQSTAT = self.session.request_many(['REQPOS\r', '?NAME\r', 'REQSTAT\r'])
+        self.timing.stop('tcs_telemetry', t0)
 
         # --- REQPOS ---
-        REQPOS = self._send_command('REQPOS\r')
         self.logger.debug(f"REQPOS raw: {REQPOS!r}")
         utclst, radecha, airmass = REQPOS.split('\n')
         utc, lst = utclst.split(',')
@@ -280,7 +595,6 @@ class cGuider(cFLIR):
         self.header_keys['AIRMASS'] = airmass.strip('air mas=').strip('\x00')
 
         # --- NAME ---
-        NAME = self._send_command('?NAME\r')
         self.logger.debug(f"NAME raw: {NAME!r}")
         self.header_keys['OBJECT'] = NAME.split('=', 1)[-1].strip('\n').strip().strip('\x00').strip('\n')
 
@@ -291,7 +605,6 @@ class cGuider(cFLIR):
         #   offset RA =   R.R arcsec, DEC =   D.D arcsec
         #   rate RA =   R.R arcsec/hr, DEC =   D.D arcsec/hr
         #   Cass ring angle = CCC.CC\x00
-        REQSTAT = self._send_command('REQSTAT\r')
         self.logger.debug(f"REQSTAT raw: {REQSTAT!r}")
         stat_lines = REQSTAT.split('\n')
         tel_id_str, focus_str, tubelen_str = stat_lines[1].split(',')
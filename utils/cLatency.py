@@ -0,0 +1,124 @@
+import json, threading, time
+from contextlib import contextmanager
+import numpy as np
+
+
+class cStageTimer:
+    """
+    Low overhead per-stage latency recorder for the guide loop.
+
+    Every stage owns a preallocated (size, 2) ring buffer of
+    (monotonic start time, duration) in seconds, so recording is an array store
+    under a lock (a couple of us) and memory stays fixed however long the night runs.
+    Percentiles are only computed when asked for (stats(), format_stats(), dump()).
+
+    Typical use on the hot path:
+
+        t0 = timer.start()
+        image_result = cam.GetNextImage(timeout)
+        timer.stop('grab', t0)
+
+    or, where a few extra hundred ns do not matter, `with timer.stage('grab'): ...`
+    """
+
+    def __init__(self, size=4096, enabled=True):
+        """
+        size    - int, samples kept per stage (the rolling window of the percentiles)
+        enabled - bool, when False start()/stop() cost one attribute lookup and record nothing
+        """
+        self.size    = int(size)
+        self.enabled = enabled
+        self.lock    = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """Drop all recorded samples."""
+        self.buffers = {}   # stage -> (size, 2) array of (t_start, duration)
+        self.counts  = {}   # stage -> samples recorded in total
+
+    @staticmethod
+    def start():
+        return time.perf_counter()
+
+    def stop(self, stage, t0):
+        """Record the time since t0 (from start()) for stage; returns the duration in seconds."""
+        t1 = time.perf_counter()
+        if self.enabled:
+            self.record(stage, t0, t1 - t0)
+        return t1 - t0
+
+    def record(self, stage, t_start, duration):
+        with self.lock:
+            buf = self.buffers.get(stage)
+            if buf is None:
+                buf = self.buffers[stage] = np.zeros((self.size, 2))
+                self.counts[stage] = 0
+            n = self.counts[stage]
+            i = n % self.size
+            buf[i, 0] = t_start
+            buf[i, 1] = duration
+            self.counts[stage] = n + 1
+
+    @contextmanager
+    def stage(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stop(stage, t0)
+
+    def samples(self, stage):
+        """(n, 2) array of (t_start, duration) for stage, oldest first"""
+        with self.lock:
+            buf, n = self.buffers.get(stage), self.counts.get(stage, 0)
+            if buf is None:
+                return np.zeros((0, 2))
+            if n <= self.size:
+                return buf[:n].copy()
+            i = n % self.size
+            return np.concatenate([buf[i:], buf[:i]])
+
+    def stats(self, percentiles=(50, 95, 99)):
+        """
+        returns {stage: {'n', 'mean', 'max', 'p50', 'p95', 'p99'}} in milliseconds over the
+        rolling window ('n' is the total number of samples ever recorded)
+        """
+        out = {}
+        for stage in list(self.buffers):
+            ms = 1e3 * self.samples(stage)[:, 1]
+            if len(ms) == 0:
+                continue
+            entry = {'n': self.counts[stage], 'mean': float(ms.mean()), 'max': float(ms.max())}
+            for q, v in zip(percentiles, np.percentile(ms, percentiles)):
+                entry[f'p{q}'] = float(v)
+            out[stage] = entry
+        return out
+
+    def format_stats(self):
+        """one line per stage: p50 / p95 / p99 in ms"""
+        return '\n'.join(f"{stage:>12s}: p50 {st['p50']:8.2f}  p95 {st['p95']:8.2f}  "
+                         f"p99 {st['p99']:8.2f} ms  (n={st['n']})"
+                         for stage, st in self.stats().items())
+
+    def dump(self, filename, raw=True):
+        """
+        Write the per-stage percentiles (and the raw samples if raw) to a JSON file.
+
+        returns the filename, or None if nothing was recorded
+        """
+        stats = self.stats()
+        if not stats:
+            return None
+        out = {'written': time.strftime('%Y-%m-%dT%H:%M:%S'), 'window': self.size, 'stats_ms': stats}
+        if raw:
+            out['samples'] = {stage: {'t_start': self.samples(stage)[:, 0].round(6).tolist(),
+                                      'ms': (1e3 * self.samples(stage)[:, 1]).round(4).tolist()}
+                              for stage in stats}
+        with open(filename, 'w') as f:
+            json.dump(out, f, indent=1)
+        return filename
+
+
+# shared recorder: the camera, the guider (incl. its TCS commands) and the GUI record
+# into this one, so a guide cycle's stages end up side by side
+stage_timer = cStageTimer()
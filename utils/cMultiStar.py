@@ -0,0 +1,190 @@
+import numpy as np
+from scipy import ndimage
+
+from cSubpixel import cSubpixelCentroid
+
+
+def clipped_mean(dx, dy, weights, nsigma=3.0, n_iter=3):
+    """
+    Weighted, sigma-clipped mean of a set of 2D offsets.
+
+    Outliers are rejected on the radial distance from the current mean using a
+    MAD-based scatter, so one misidentified or saturated star cannot drag the
+    correction.
+
+    returns (mean dx, mean dy, boolean mask of the offsets used)
+    """
+    dx, dy, weights = np.asarray(dx, float), np.asarray(dy, float), np.asarray(weights, float)
+    keep = np.isfinite(dx) & np.isfinite(dy) & (weights > 0)
+    for _ in range(n_iter):
+        if keep.sum() < 3:
+            break
+        mx = np.average(dx[keep], weights=weights[keep])
+        my = np.average(dy[keep], weights=weights[keep])
+        r = np.hypot(dx - mx, dy - my)
+        scatter = max(1.4826 * np.median(r[keep]), 1e-3)
+        new_keep = keep & (r <= nsigma * scatter)
+        if np.array_equal(new_keep, keep):
+            break
+        keep = new_keep
+    if not keep.any():
+        return np.nan, np.nan, keep
+    return np.average(dx[keep], weights=weights[keep]), np.average(dy[keep], weights=weights[keep]), keep
+
+
+class cMultiStarGuide:
+    """
+    Detect every star in the guide (sub)frame and guide on their combined motion.
+
+    detect() background-subtracts the frame, labels connected pixels above
+    `nsigma` x noise and measures all sources at once: fixed size cutouts are
+    gathered into an (N, box, box) stack and solved in one call by the
+    sub-pixel engine. Saturated sources are dropped.
+
+    The first measured frame becomes the reference catalogue. offset() matches
+    each new detection to its nearest reference star and combines the per-star
+    offsets with an inverse-variance, sigma-clipped mean, so guiding continues
+    when a cloud dims some stars or the primary saturates.
+    """
+
+    def __init__(self, nsigma=5.0, min_pix=5, box=15, max_stars=20, match_radius=20.0,
+                 saturation=65000, fwhm=4.0, method='wcom', min_stars=1):
+        """
+        nsigma       - float, detection threshold in units of the background noise
+        min_pix      - int, smallest connected source (rejects hot pixels / noise)
+        box          - int, side of the cutout measured for each source
+        max_stars    - int, keep only the brightest max_stars sources
+        match_radius - float, pixels a star may move between reference and frame
+        saturation   - float, sources with a peak at or above this are ignored
+        fwhm         - float, PSF FWHM in pixels for the sub-pixel engine
+        method       - str, sub-pixel engine ('wcom', 'gauss', 'quad')
+        min_stars    - int, fewest stars a reference catalogue may have
+        """
+        self.nsigma       = nsigma
+        self.min_pix      = min_pix
+        self.box          = box
+        self.max_stars    = max_stars
+        self.match_radius = match_radius
+        self.min_stars    = max(int(min_stars), 1)
+        self.saturation   = saturation
+        self.engine       = cSubpixelCentroid(method=method, fwhm=fwhm)
+        self.reset()
+
+    def reset(self):
+        """Forget the reference catalogue."""
+        self.reference = None   # dict of arrays from detect()
+        self.shape     = None
+        self.n_used    = 0      # stars that went into the last offset
+
+    @property
+    def has_reference(self):
+        return self.reference is not None
+
+    def _background(self, data):
+        """median background and MAD noise from a sparse subsample of the frame"""
+        step = max(1, int(np.sqrt(data.size / 65536)))
+        sample = data[::step, ::step].astype(np.float32)
+        bg = np.median(sample)
+        noise = 1.4826 * np.median(np.abs(sample - bg))
+        return bg, max(noise, 1.0)
+
+    def detect(self, data):
+        """
+        Find and measure all sources in data.
+
+        returns dict of (N,) arrays: x, y, xerr, yerr, flux, peak (brightest first)
+        """
+        data = np.asarray(data)
+        bg, noise = self._background(data)
+        mask = data > bg + self.nsigma * noise
+        labels, nlab = ndimage.label(mask)
+        empty = {k: np.zeros(0) for k in ('x', 'y', 'xerr', 'yerr', 'flux', 'peak')}
+        if nlab == 0:
+            return empty
+
+        # per-source stats from the labelled pixels only (a few thousand, not the frame)
+        pix = np.flatnonzero(labels)
+        lab = labels.ravel()[pix] - 1
+        val = data.ravel()[pix].astype(np.float32)
+        npix = np.bincount(lab, minlength=nlab)
+        flux = np.bincount(lab, weights=val - bg, minlength=nlab)
+        order = np.lexsort((val, lab))
+        last = np.flatnonzero(np.r_[lab[order][1:] != lab[order][:-1], True])
+        brightest = pix[order[last]] # flat index of each source's peak pixel
+        peak = val[order[last]]
+        seeds = np.stack(np.unravel_index(brightest, data.shape), axis=1)
+
+        good = (npix >= self.min_pix) & (peak < self.saturation)
+        if not good.any():
+            return empty
+        order = np.argsort(flux[good])[::-1][:self.max_stars]
+        flux, peak, seeds = flux[good][order], peak[good][order], seeds[good][order]
+
+        # gather all cutouts with one fancy-index, boxes slid back inside the frame
+        nrows, ncols = data.shape
+        h = min(self.box, nrows)
+        w = min(self.box, ncols)
+        r0 = np.clip(seeds[:, 0] - h // 2, 0, nrows - h)
+        c0 = np.clip(seeds[:, 1] - w // 2, 0, ncols - w)
+        stack = data[r0[:, None, None] + np.arange(h)[None, :, None],
+                     c0[:, None, None] + np.arange(w)[None, None, :]]
+
+        x, y, xerr, yerr = self.engine.measure_batch(stack)
+        return {'x': x + c0, 'y': y + r0, 'xerr': xerr, 'yerr': yerr,
+                'flux': flux, 'peak': peak}
+
+    def set_reference(self, data):
+        """
+        Detect the stars in data and keep them as the reference catalogue.
+
+        returns the number of stars; with fewer than min_stars (cloud, target not
+        acquired yet) no reference is kept, so the next frame is tried again
+        """
+        catalogue = self.detect(data)
+        nstars = len(catalogue['x'])
+        if nstars < self.min_stars:
+            self.reset()
+            return nstars
+        self.reference = catalogue
+        self.shape = np.shape(data)
+        self.n_used = nstars
+        return nstars
+
+    def offset(self, data):
+        """
+        Combined shift of the stars in data relative to the reference catalogue.
+
+        returns (dx, dy) in pixels, or None if no reference star could be matched
+        """
+        found = self.detect(data)
+        ref = self.reference
+        self.n_used = 0
+        if len(found['x']) == 0 or len(ref['x']) == 0:
+            return None
+
+        # nearest reference star for every detection
+        dist = np.hypot(found['x'][:, None] - ref['x'][None, :],
+                        found['y'][:, None] - ref['y'][None, :])
+        nearest = np.argmin(dist, axis=1)
+        matched = dist[np.arange(len(nearest)), nearest] <= self.match_radius
+        if not matched.any():
+            return None
+
+        # one detection per reference star (keep the closest)
+        idx = np.flatnonzero(matched)
+        idx = idx[np.argsort(dist[idx, nearest[idx]])]
+        _, first = np.unique(nearest[idx], return_index=True)
+        idx = idx[first]
+        j = nearest[idx]
+
+        dx = found['x'][idx] - ref['x'][j]
+        dy = found['y'][idx] - ref['y'][j]
+        var = (found['xerr'][idx]**2 + found['yerr'][idx]**2
+               + ref['xerr'][j]**2 + ref['yerr'][j]**2)
+        weights = 1.0 / np.maximum(np.nan_to_num(var, nan=np.inf), 1e-6)
+
+        mx, my, keep = clipped_mean(dx, dy, weights)
+        self.n_used = int(keep.sum())
+        if self.n_used == 0:
+            return None
+        return float(mx), float(my)
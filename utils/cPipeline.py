@@ -0,0 +1,302 @@
+import threading, time, logging
+from collections import deque
+
+
+class cStageQueue:
+    """
+    Bounded queue between two pipeline stages with a drop policy.
+
+    policy:
+        'latest'   - newest item wins: when full, the oldest queued item is
+                     discarded (and counted) so the consumer always sees the
+                     freshest frame. Used for guiding.
+        'lossless' - when full, put() blocks the producer until there is room.
+                     Used for archiving, where every frame must be kept.
+    """
+
+    def __init__(self, maxsize=1, policy='latest', on_drop=None):
+        """on_drop - optional callable(item) for items discarded by 'latest' (e.g. to release buffers)"""
+        if policy not in ('latest', 'lossless'):
+            raise ValueError(f"Unknown drop policy '{policy}', use 'latest' or 'lossless'")
+        self.maxsize  = max(1, int(maxsize))
+        self.policy   = policy
+        self.on_drop  = on_drop
+        self.items    = deque()
+        self.cond     = threading.Condition()
+        self.closed   = False
+        self.n_put    = 0
+        self.n_dropped = 0
+
+    def put(self, item):
+        """Queue item; returns False if the queue was closed (item is then passed to on_drop)."""
+        dropped = None
+        with self.cond:
+            if self.policy == 'lossless':
+                while len(self.items) >= self.maxsize and not self.closed:
+                    self.cond.wait()
+            elif len(self.items) >= self.maxsize:
+                dropped = self.items.popleft()
+                self.n_dropped += 1
+            queued = not self.closed
+            if queued:
+                self.items.append(item)
+                self.n_put += 1
+                self.cond.notify_all()
+        for lost in (dropped, None if queued else item):
+            if lost is not None and self.on_drop is not None:
+                self.on_drop(lost)
+        return queued
+
+    def get(self, timeout=None):
+        """Next item, or None on timeout / when closed and drained."""
+        with self.cond:
+            end = None if timeout is None else time.monotonic() + timeout
+            while not self.items:
+                if self.closed:
+                    return None
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        """Wake everybody up; get() keeps returning queued items until empty."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class cLatestSlot:
+    """
+    Single "latest result" slot between a producer running at its own rate and
+    a consumer that polls it at another, e.g. a GUI rendering at a capped frame
+    rate: post() replaces whatever was not yet taken (counted as dropped and
+    passed to on_drop), take() returns the newest item once.
+
+        slot.post(result)          # acquisition / processing thread, never blocks
+        result = slot.take()       # display timer; None if nothing new arrived
+    """
+
+    def __init__(self, on_drop=None):
+        """on_drop - optional callable(item) for items replaced before they were taken"""
+        self.on_drop   = on_drop
+        self.item      = None
+        self.lock      = threading.Lock()
+        self.cond      = threading.Condition(self.lock)
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.n_posted  = 0
+            self.n_shown   = 0
+            self.n_dropped = 0
+            self.t_start   = time.monotonic()
+
+    def post(self, item):
+        with self.lock:
+            dropped, self.item = self.item, item
+            self.n_posted += 1
+            if dropped is not None:
+                self.n_dropped += 1
+            self.cond.notify_all()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def take(self, timeout=0):
+        """newest item not taken yet, waiting up to timeout seconds (None: forever) for one; None if there is none"""
+        with self.lock:
+            if self.item is None and timeout != 0:
+                self.cond.wait_for(lambda: self.item is not None, timeout)
+            item, self.item = self.item, None
+            if item is not None:
+                self.n_shown += 1
+        return item
+
+    def clear(self):
+        """discard a pending item (passed to on_drop, not counted as dropped)"""
+        with self.lock:
+            item, self.item = self.item, None
+        if item is not None and self.on_drop is not None:
+            self.on_drop(item)
+
+    def stats(self):
+        """dict with items posted, shown (taken) and dropped, and the shown rate (items/s)"""
+        with self.lock:
+            elapsed = max(time.monotonic() - self.t_start, 1e-9)
+            return {'posted': self.n_posted, 'shown': self.n_shown,
+                    'dropped': self.n_dropped, 'rate': self.n_shown / elapsed}
+
+    def format_stats(self):
+        st = self.stats()
+        return f"shown {st['shown']} ({st['rate']:.1f}/s) dropped {st['dropped']}"
+
+
+class cStage(threading.Thread):
+    """
+    One pipeline stage running on its own thread.
+
+    A source stage (inq=None) calls func() in a loop; other stages call
+    func(item) for every item taken from inq. Non-None results are put on every
+    queue in outqs. Counts items, errors and busy time for throughput stats.
+    """
+
+    def __init__(self, name, func, inq=None, outqs=(), logger=None):
+        super().__init__(name=name, daemon=True)
+        self.func    = func
+        self.inq     = inq
+        self.outqs   = list(outqs)
+        self.logger  = logger or logging.getLogger()
+        self.running = threading.Event()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.n_done   = 0
+        self.n_errors = 0
+        self.busy     = 0.0     # seconds spent inside func
+        self.t_start  = time.monotonic()
+        self.last_error = None
+
+    def run(self):
+        self.running.set()
+        while self.running.is_set():
+            if self.inq is not None:
+                item = self.inq.get(timeout=0.1)
+                if item is None:
+                    if self.inq.closed:
+                        break
+                    continue
+                args = (item,)
+            else:
+                args = ()
+
+            t0 = time.monotonic()
+            try:
+                result = self.func(*args)
+            except Exception as e:
+                self.n_errors += 1
+                self.last_error = e
+                self.logger.error(f'Pipeline stage {self.name} failed: {type(e).__name__}: {e}')
+                if self.inq is None:
+                    time.sleep(0.1) # don't spin on a failing source (e.g. camera dropped)
+                continue
+            finally:
+                self.busy += time.monotonic() - t0
+            self.n_done += 1
+
+            if result is not None:
+                for q in self.outqs:
+                    q.put(result)
+
+    def stop(self):
+        self.running.clear()
+
+    def stats(self):
+        """dict with items done, rate (items/s), mean busy ms per item, utilisation and errors"""
+        elapsed = max(time.monotonic() - self.t_start, 1e-9)
+        return {'done':     self.n_done,
+                'rate':     self.n_done / elapsed,
+                'busy_ms':  1e3 * self.busy / max(self.n_done, 1),
+                'util':     self.busy / elapsed,
+                'errors':   self.n_errors}
+
+
+class cGuidePipeline:
+    """
+    Pipelined guide loop: acquisition, processing and TCS command stages run on
+    separate threads joined by bounded queues, so the camera starts the next
+    exposure while the previous frame is still being centroided and the offset
+    is still on the wire.
+
+        acquire() -> frame ──'latest'──> process(frame) -> result ──'latest'──> command(result)
+                        └──'lossless'──> archive(frame)                     └──> on_result(result)
+
+    The process and command queues are newest-frame-wins (a slow centroid or TCS
+    round trip never builds a backlog of stale corrections); the archive queue
+    is lossless and back-pressures acquisition instead of dropping frames.
+    """
+
+    def __init__(self, acquire, process, command=None, archive=None, on_result=None,
+                 process_queue=1, command_queue=1, archive_queue=8, on_drop=None, logger=None):
+        """
+        acquire       - callable() -> frame (anything) or None to skip
+        process       - callable(frame) -> result or None (no correction)
+        command       - callable(result), sends the correction to the TCS (optional)
+        archive       - callable(frame), writes the frame to disk (optional)
+        on_result     - callable(result), e.g. hand results to a display (optional, runs on
+                        the command stage thread, keep it cheap)
+        *_queue       - int, depth of each queue
+        on_drop       - callable(frame or result) for items the process / command queues
+                        discarded, e.g. to release pooled frame buffers (optional)
+        """
+        self.logger = logger or logging.getLogger()
+        self.queues = {'process': cStageQueue(process_queue, 'latest', on_drop)}
+        if command is not None or on_result is not None:
+            self.queues['command'] = cStageQueue(command_queue, 'latest', on_drop)
+        if archive is not None:
+            self.queues['archive'] = cStageQueue(archive_queue, 'lossless')
+
+        acq_out = [self.queues['process']]
+        if archive is not None:
+            acq_out.append(self.queues['archive'])
+        proc_out = [self.queues['command']] if 'command' in self.queues else []
+
+        def _command(result):
+            try:
+                if command is not None:
+                    command(result)
+            finally:
+                # the result is shown even if sending the offset failed
+                if on_result is not None:
+                    on_result(result)
+
+        self.stages = [cStage('acquire', acquire, None, acq_out, self.logger),
+                       cStage('process', process, self.queues['process'], proc_out, self.logger)]
+        if 'command' in self.queues:
+            self.stages.append(cStage('command', _command, self.queues['command'], (), self.logger))
+        if archive is not None:
+            self.stages.append(cStage('archive', archive, self.queues['archive'], (), self.logger))
+
+    @property
+    def running(self):
+        return any(stage.is_alive() for stage in self.stages)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        self.logger.info(f"Guide pipeline started ({', '.join(s.name for s in self.stages)})")
+
+    def stop(self, timeout=5.0):
+        """Stop acquisition, let the queued work drain (archive is lossless) and join the threads."""
+        acquire, *rest = self.stages
+        acquire.stop()
+        acquire.join(timeout)
+        # close queues in flow order so every stage drains what is already queued
+        for name in ('process', 'command', 'archive'):
+            if name in self.queues:
+                self.queues[name].close()
+                stage = [s for s in rest if s.name == name][0]
+                stage.join(timeout)
+        self.logger.info(f'Guide pipeline stopped: {self.format_stats()}')
+
+    def stats(self):
+        """per-stage throughput plus put/dropped counts for every queue"""
+        out = {stage.name: stage.stats() for stage in self.stages}
+        for name, q in self.queues.items():
+            out[name].update({'queued': q.n_put, 'dropped': q.n_dropped, 'depth': len(q)})
+        return out
+
+    def format_stats(self):
+        """one line summary, e.g. for the status bar or the log"""
+        parts = []
+        for name, st in self.stats().items():
+            part = f"{name} {st['rate']:.2f}/s {st['busy_ms']:.0f}ms"
+            if st.get('dropped'):
+                part += f" drop {st['dropped']}"
+            parts.append(part)
+        return ' | '.join(parts)
@@ -0,0 +1,157 @@
+import numpy as np
+
+
+class cPreviewPyramid:
+    """
+    Screen-resolution uint8 previews of a camera frame.
+
+    Instead of handing a full 4096x2160 uint16 frame to the plotting library,
+    render() reduces the part of the frame on screen by a power of two factor
+    that fits the screen (block max or mean over strided slices) and maps
+    it to uint8 through a lookup table (for integer frames a table over every
+    ADU value, so the stretch is one indexing pass).
+
+    Reductions are done per tile of `tile` output pixels and cached per level
+    until the next frame, so a zoomed view only reduces the tiles it shows at
+    the higher resolution, and panning or re-scaling reuses them.
+
+        preview = cPreviewPyramid(reduce='max')
+        preview.set_frame(image)
+        preview.set_scale(vmin, vmax)
+        data, (c0, c1, r0, r1) = preview.render(screen=(900, 550))              # whole frame
+        data, (c0, c1, r0, r1) = preview.render((1800, 1950, 1150, 1250), (900, 550))  # zoomed
+
+    data covers image columns c0:c1 and rows r0:r1 (tile aligned, at least the
+    requested region). No plotting dependency, so the guider GUI and a remote
+    viewer can share it.
+    """
+
+    STRETCHES = ('linear', 'sqrt', 'log', 'asinh')
+
+    def __init__(self, reduce='max', tile=256):
+        """
+        reduce - 'max' (keeps stars visible when shrinking) or 'mean' (keeps the noise look)
+        tile   - int, tile size in preview pixels
+        """
+        if reduce not in ('max', 'mean'):
+            raise ValueError(f"Unknown reduction '{reduce}', use 'max' or 'mean'")
+        self.reduce  = reduce
+        self.tile    = int(tile)
+        self.image   = None
+        self.tiles   = {}          # (factor, tile row, tile col) -> reduced block, for the current frame
+        self.scale   = None        # (vmin, vmax, stretch) of the lookup table
+        self.lut     = None
+
+    def set_frame(self, image):
+        """new frame (not copied; must stay unchanged while it is previewed)"""
+        self.image = image
+        self.tiles.clear()
+
+    def set_scale(self, vmin, vmax, stretch='linear'):
+        """display range and stretch; the lookup table is only rebuilt when they change"""
+        if stretch not in self.STRETCHES:
+            raise ValueError(f"Unknown stretch '{stretch}', use one of {self.STRETCHES}")
+        scale = (float(vmin), float(vmax), stretch)
+        if scale != self.scale:
+            self.scale = scale
+            self.lut = None
+
+    @staticmethod
+    def _stretch(x, stretch):
+        """x in [0, 1] -> [0, 1]"""
+        if stretch == 'sqrt':
+            return np.sqrt(x)
+        if stretch == 'log':
+            return np.log1p(1000 * x) / np.log1p(1000)
+        if stretch == 'asinh':
+            return np.arcsinh(10 * x) / np.arcsinh(10)
+        return x
+
+    def _to_uint8(self, values):
+        vmin, vmax, stretch = self.scale
+        if values.dtype.kind == 'u' and values.dtype.itemsize <= 2:
+            if self.lut is None:
+                levels = np.arange(np.iinfo(values.dtype).max + 1, dtype=np.float32)
+                x = np.clip((levels - vmin) / max(vmax - vmin, 1e-12), 0, 1)
+                self.lut = np.round(255 * self._stretch(x, stretch)).astype(np.uint8)
+            return self.lut[values]
+        # float / wide integer frames: the same mapping, computed on the (small) preview
+        x = np.clip((values.astype(np.float32) - vmin) / max(vmax - vmin, 1e-12), 0, 1)
+        return np.round(255 * self._stretch(x, stretch)).astype(np.uint8)
+
+    def _reduce(self, block, factor):
+        """block reduced by factor along both axes (ragged edge blocks included)"""
+        if factor == 1:
+            return block
+        return self._reduce_axis(self._reduce_axis(block, factor, 0), factor, 1)
+
+    def _reduce_axis(self, values, factor, axis):
+        """
+        combine every `factor` rows (axis 0) or columns (axis 1) by accumulating the
+        factor strided slices in place: a few passes without large temporaries
+        """
+        step = lambda k: (slice(k, None, factor),) if axis == 0 else (slice(None), slice(k, None, factor))
+        if self.reduce == 'max':
+            out = values[step(0)].copy()
+        else:
+            out = values[step(0)].astype(np.float32)
+        n_out = out.shape[axis]
+        for k in range(1, factor):
+            part = values[step(k)]
+            n = part.shape[axis]
+            if n == 0:
+                break
+            target = out[:n] if axis == 0 else out[:, :n]
+            if self.reduce == 'max':
+                np.maximum(target, part, out=target)
+            else:
+                np.add(target, part, out=target, casting='unsafe')
+        if self.reduce == 'mean':
+            counts = np.full(n_out, factor, dtype=np.float32)
+            counts[-1] = values.shape[axis] - (n_out - 1) * factor
+            out /= counts[:, None] if axis == 0 else counts[None, :]
+        return out
+
+    def _tile(self, factor, ty, tx):
+        key = (factor, ty, tx)
+        reduced = self.tiles.get(key)
+        if reduced is None:
+            span = self.tile * factor
+            block = self.image[ty * span:(ty + 1) * span, tx * span:(tx + 1) * span]
+            reduced = self.tiles[key] = self._reduce(block, factor)
+        return reduced
+
+    @staticmethod
+    def factor_for(region, screen):
+        """
+        power of two reduction of a (c0, c1, r0, r1) region for a screen area of
+        (width, height): the largest that still leaves at least screen resolution
+        """
+        c0, c1, r0, r1 = region
+        need = max((c1 - c0) / max(screen[0], 1), (r1 - r0) / max(screen[1], 1), 1)
+        return 1 << int(np.floor(np.log2(need) + 1e-9))
+
+    def render(self, region=None, screen=(1024, 1024)):
+        """
+        uint8 preview of region (c0, c1, r0, r1) in image pixels (default the whole frame)
+        for a screen area of (width, height) pixels; returns (data, (c0, c1, r0, r1))
+        with the tile-aligned region data actually covers
+        """
+        if self.image is None or self.scale is None:
+            raise RuntimeError('set_frame() and set_scale() first')
+        nrows, ncols = self.image.shape
+        if region is None:
+            region = (0, ncols, 0, nrows)
+        c0, c1, r0, r1 = (int(np.clip(v, 0, n)) for v, n in zip(region, (ncols, ncols, nrows, nrows)))
+        if c1 <= c0 or r1 <= r0:
+            c0, c1, r0, r1 = 0, ncols, 0, nrows
+        factor = self.factor_for((c0, c1, r0, r1), screen)
+        span = self.tile * factor
+        ty0, ty1 = r0 // span, (r1 - 1) // span + 1
+        tx0, tx1 = c0 // span, (c1 - 1) // span + 1
+
+        rows = [np.concatenate([self._tile(factor, ty, tx) for tx in range(tx0, tx1)], axis=1)
+                for ty in range(ty0, ty1)]
+        reduced = rows[0] if len(rows) == 1 else np.concatenate(rows, axis=0)
+        covered = (tx0 * span, min(tx1 * span, ncols), ty0 * span, min(ty1 * span, nrows))
+        return self._to_uint8(reduced), covered
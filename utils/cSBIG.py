@@ -8,6 +8,8 @@ import subprocess
 import sys, os
 from pathlib import Path
 from cLogging import setup_logging
+from cFITSWriter import cFITSWriter
+from astropy.io import fits
 import logging, yaml
 from datetime import datetime, timezone
 
@@ -53,6 +55,17 @@ class cSBIG:
         self.ybin = self.config['ybin']
         self.set_temperature = self.config['set_temperature']
 
+        # MaxIm saves plain FITS; with compression set, saved frames are re-written
+        # tile-compressed (.fits.fz) in the background and the uncompressed file removed
+        self.compression = self.config.get('compression', None)
+        self.writer = None
+        if self.compression:
+            self.writer = cFITSWriter(queue_size=self.config.get('write_queue', 4),
+                                      workers=self.config.get('write_workers', 2),
+                                      compression=self.compression,
+                                      processes=self.config.get('compress_processes', 2),
+                                      timer=None, logger=self.logger)
+
     def Expose(self,exptime,exptype):
         """
         Take exposure time, exosure type (0 or 1), and 
@@ -119,6 +132,11 @@ class cSBIG:
             self.logger.error("Cannot save file")
             raise EnvironmentError('Halting program')
 
+        if self.writer is not None:
+            data, header = fits.getdata(filename, header=True)
+            if data.dtype.kind in 'iu':   # float frames stay uncompressed (lossless)
+                self.writer.submit(filename, data, header, replaces=filename)
+
 
  
     def coolCCD(self):
@@ -165,6 +183,8 @@ class cSBIG:
 
 
     def disconnect(self):
+        if self.writer is not None:
+            self.writer.close()   # every saved frame compressed before we quit
         if self.CAMERA.CoolerOn:
             # Warm up cooler
             if self.CAMERA.TemperatureSetpoint < self.CAMERA.AmbientTemperature:
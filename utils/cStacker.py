@@ -0,0 +1,174 @@
+import warnings
+import numpy as np
+
+from cRegistration import cPhaseCorrelator
+
+
+class cFrameStacker:
+    """
+    Streaming combiner of the short exposures averaged into one guide frame.
+
+    All working memory is preallocated per frame shape and reused from stack to
+    stack, so averaging N full frames allocates nothing per frame:
+
+        'mean'   - frames are added in place into a float32 accumulator
+        'clip'   - sigma-clipped mean (around the median, MAD sigma) and
+        'median' - per-pixel median, both computed over a bounded buffer of
+                   `depth` frames; longer stacks are combined depth frames at a time
+                   and the partial results weighted into the accumulator
+
+    With register=True every frame is first aligned to the stack's first frame
+    (phase correlation, shift rounded to whole pixels) and shifted-and-added;
+    pixels not covered by a shifted frame don't count towards their mean.
+
+    Typical use:
+
+        stacker.start()
+        for _ in range(n): stacker.add(frame)
+        image = stacker.result(np.uint16)
+    """
+
+    MODES = ('mean', 'clip', 'median')
+    STRIP = 256   # rows combined at a time by 'clip' / 'median'
+
+    def __init__(self, mode='mean', depth=5, nsigma=3.0, register=False, correlator=None):
+        """
+        mode       - 'mean', 'clip' or 'median'
+        depth      - int, frames buffered for 'clip' / 'median' (memory: depth float32 frames)
+        nsigma     - float, clipping threshold of 'clip'
+        register   - bool, align frames to the first one of the stack (shift-and-add)
+        correlator - cPhaseCorrelator used for the alignment (default: a new one)
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown stacking mode '{mode}', use one of {self.MODES}")
+        self.mode       = mode
+        self.depth      = max(int(depth), 1)
+        self.nsigma     = nsigma
+        self.register   = register
+        self.correlator = correlator if correlator is not None else cPhaseCorrelator()
+        self.shape      = None
+        self.acc        = None   # (ny, nx) float32 sum
+        self.out        = None   # (ny, nx) float32 combined frame, before the cast of result()
+        self.weight     = None   # (ny, nx) float32 frames per pixel (clip / median / register)
+        self.buffer     = None   # (depth, ny, nx) float32 for clip / median
+        self.start()
+
+    def start(self):
+        """begin a new stack (buffers are reused if the frame shape doesn't change)"""
+        self.n       = 0      # frames added
+        self.k       = 0      # frames in the buffer
+        self.shifts  = []     # (dx, dy) whole-pixel shift applied to each frame
+        self._zeroed = False
+
+    def _allocate(self, shape):
+        self.shape  = shape
+        self.acc    = np.zeros(shape, dtype=np.float32)
+        self.out    = np.empty(shape, dtype=np.float32)
+        buffered    = self.mode != 'mean'
+        self.weight = np.zeros(shape, dtype=np.float32) if (buffered or self.register) else None
+        self.buffer = np.empty((self.depth,) + shape, dtype=np.float32) if buffered else None
+
+    def _align(self, frame):
+        """whole-pixel (dx, dy) of frame relative to the first frame of the stack"""
+        if not self.register:
+            return 0, 0
+        if self.n == 0:
+            self.correlator.set_reference(frame)
+            return 0, 0
+        dx, dy = self.correlator.shift(frame)
+        return int(round(dx)), int(round(dy))
+
+    @staticmethod
+    def _overlap(shape, dx, dy):
+        """(destination, source) slices that move content shifted by (dx, dy) back onto the reference"""
+        ny, nx = shape
+        dst = (slice(max(-dy, 0), ny - max(dy, 0)), slice(max(-dx, 0), nx - max(dx, 0)))
+        src = (slice(max(dy, 0), ny - max(-dy, 0)), slice(max(dx, 0), nx - max(-dx, 0)))
+        return dst, src
+
+    def add(self, frame):
+        """add one frame (any numeric dtype) to the stack"""
+        shape = np.shape(frame)
+        if shape != self.shape:
+            if self.n:
+                raise ValueError(f'Frame shape {shape} does not match the stack {self.shape}')
+            self._allocate(shape)
+        if not self._zeroed:
+            self.acc.fill(0)
+            if self.weight is not None:
+                self.weight.fill(0)
+            self._zeroed = True
+
+        dx, dy = self._align(frame)
+        self.shifts.append((dx, dy))
+        dst, src = self._overlap(shape, dx, dy)
+
+        if self.buffer is None:
+            self.acc[dst] += frame[src]
+            if self.weight is not None:
+                self.weight[dst] += 1
+        else:
+            slot = self.buffer[self.k]
+            if (dx, dy) == (0, 0):
+                np.copyto(slot, frame)
+            else:
+                slot.fill(np.nan)
+                slot[dst] = frame[src]
+            self.k += 1
+            if self.k == self.depth:
+                self._fold()
+        self.n += 1
+
+    def _fold(self):
+        """combine the buffered frames and weight the result into the accumulator"""
+        if self.k == 0:
+            return
+        frames = self.buffer[:self.k]
+        shifted = self.register and any(s != (0, 0) for s in self.shifts[-self.k:])
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)   # pixels no shifted frame covers
+            # in strips of rows, so the temporaries stay small next to the buffer
+            for r0 in range(0, self.shape[0], self.STRIP):
+                rows = slice(r0, r0 + self.STRIP)
+                value, weight = self._combine(frames[:, rows], shifted)
+                self.acc[rows] += value * weight
+                self.weight[rows] += weight
+        self.k = 0
+
+    def _combine(self, frames, shifted):
+        """(value, frames per pixel) of a (k, rows, nx) block; nan marks uncovered pixels if shifted"""
+        weight = np.isfinite(frames).sum(axis=0) if shifted else len(frames)
+        median = np.nanmedian if shifted else np.median
+        if self.mode == 'median':
+            value = median(frames, axis=0)
+        elif len(frames) < 3:
+            value = (np.nansum(frames, axis=0) if shifted else frames.sum(axis=0)) / np.maximum(weight, 1)
+        else:
+            center = median(frames, axis=0)
+            dev = np.abs(frames - center)
+            sigma = 1.4826 * median(dev, axis=0)
+            keep = dev <= self.nsigma * np.maximum(sigma, 1e-6)
+            weight = keep.sum(axis=0)
+            value = np.where(keep, frames, 0).sum(axis=0) / np.maximum(weight, 1)
+        return np.nan_to_num(value, copy=False), weight
+
+    def result(self, dtype=None, out=None):
+        """
+        combined frame as a new array (float32, or cast to dtype), or written into
+        out (e.g. a pooled frame buffer) and returned. The stack stays open, so more
+        frames can still be added.
+        """
+        if self.n == 0:
+            raise RuntimeError('No frames added to the stack')
+        self._fold()
+        if self.weight is None:
+            np.divide(self.acc, np.float32(self.n), out=self.out)
+        else:
+            np.divide(self.acc, np.maximum(self.weight, 1), out=self.out)
+        if dtype is not None and np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            np.clip(self.out, info.min, info.max, out=self.out)
+        if out is not None:
+            np.copyto(out, self.out, casting='unsafe')
+            return out
+        return self.out.astype(np.float32 if dtype is None else dtype)
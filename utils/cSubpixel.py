@@ -0,0 +1,261 @@
+import numpy as np
+
+
+def _as_stack(cutouts):
+    """Return cutouts as a float64 (N, h, w) stack plus whether the input was a single 2D image."""
+    stack = np.asarray(cutouts, dtype=float)
+    single = stack.ndim == 2
+    if single:
+        stack = stack[None]
+    if stack.ndim != 3:
+        raise ValueError(f'cutouts must be (h, w) or (N, h, w), got shape {np.shape(cutouts)}')
+    return stack, single
+
+
+def _background(stack):
+    """Per-cutout median background and MAD noise (both shape (N,))."""
+    flat = stack.reshape(len(stack), -1)
+    bg = np.median(flat, axis=1)
+    noise = 1.4826 * np.median(np.abs(flat - bg[:, None]), axis=1)
+    return bg, np.maximum(noise, 1e-6)
+
+
+def _peak_index(d):
+    """(row, col) of the brightest pixel of every cutout in a (N, h, w) stack."""
+    n, h, w = d.shape
+    flat = np.argmax(d.reshape(n, -1), axis=1)
+    return flat // w, flat % w
+
+
+def windowed_com_batch(cutouts, fwhm=4.0, n_iter=10, gain=1.0):
+    """
+    Iterative gaussian-windowed center of mass (SExtractor XWIN style).
+
+    Starts at the brightest pixel and iterates
+        x <- x + 2 sum(w I (x_i - x)) / sum(w I)
+    with a gaussian window w of the PSF sigma, which converges on the true
+    center for a gaussian-like PSF and is insensitive to the box edges.
+
+    inputs:
+    -------
+    cutouts - (h, w) or (N, h, w) array of background-containing star cutouts
+    fwhm    - float, expected PSF FWHM in pixels (sets the window size)
+    n_iter  - int, number of iterations
+    gain    - float, e-/ADU used for the photon noise term of the errors
+
+    returns
+    -------
+    x, y, xerr, yerr  (floats for a single cutout, (N,) arrays for a stack)
+    """
+    stack, single = _as_stack(cutouts)
+    bg, noise = _background(stack)
+    d = stack - bg[:, None, None]
+    _, h, w = d.shape
+    rows, cols = np.arange(h)[None, :, None], np.arange(w)[None, None, :]
+
+    iy, ix = _peak_index(d)
+    x, y = ix.astype(float), iy.astype(float)
+    sig2 = (fwhm / 2.3548) ** 2
+
+    for _ in range(n_iter):
+        dx = cols - x[:, None, None]
+        dy = rows - y[:, None, None]
+        wgt = np.exp(-(dx**2 + dy**2) / (2 * sig2))
+        wI = wgt * d
+        norm = wI.sum(axis=(1, 2))
+        norm = np.where(norm > 0, norm, np.nan)
+        x = np.clip(x + 2 * (wI * dx).sum(axis=(1, 2)) / norm, 0, w - 1)
+        y = np.clip(y + 2 * (wI * dy).sum(axis=(1, 2)) / norm, 0, h - 1)
+
+    # final window at the converged position for the error estimate
+    dx = cols - x[:, None, None]
+    dy = rows - y[:, None, None]
+    wgt = np.exp(-(dx**2 + dy**2) / (2 * sig2))
+    var = noise[:, None, None]**2 + np.maximum(d, 0) / gain
+    norm2 = (wgt * d).sum(axis=(1, 2))**2
+    xerr = np.sqrt(4 * (wgt**2 * var * dx**2).sum(axis=(1, 2)) / norm2)
+    yerr = np.sqrt(4 * (wgt**2 * var * dy**2).sum(axis=(1, 2)) / norm2)
+
+    if single:
+        return float(x[0]), float(y[0]), float(xerr[0]), float(yerr[0])
+    return x, y, xerr, yerr
+
+
+def quadratic_peak_batch(cutouts):
+    """
+    Quadratic (3-point parabola) interpolation of the brightest pixel along each axis.
+
+    Cheapest of the sub-pixel methods; best when the PSF is only a few pixels wide.
+
+    inputs:
+    -------
+    cutouts - (h, w) or (N, h, w) array of star cutouts
+
+    returns
+    -------
+    x, y, xerr, yerr  (floats for a single cutout, (N,) arrays for a stack)
+    """
+    stack, single = _as_stack(cutouts)
+    bg, noise = _background(stack)
+    d = stack - bg[:, None, None]
+    n, h, w = d.shape
+
+    iy, ix = _peak_index(d)
+    iy = np.clip(iy, 1, h - 2)
+    ix = np.clip(ix, 1, w - 2)
+    k = np.arange(n)
+
+    def _vertex(a, b, c):
+        """offset of the parabola vertex through (-1, a), (0, b), (1, c) and its 1-sigma error"""
+        curv = a - 2 * b + c
+        curv = np.where(curv < 0, curv, -1e-12) # not a maximum -> no shift
+        delta = np.clip(0.5 * (a - c) / curv, -0.5, 0.5)
+        err = noise * np.sqrt((0.5 - delta)**2 + (0.5 + delta)**2 + 4 * delta**2) / np.abs(curv)
+        return delta, err
+
+    b = d[k, iy, ix]
+    dx, xerr = _vertex(d[k, iy, ix - 1], b, d[k, iy, ix + 1])
+    dy, yerr = _vertex(d[k, iy - 1, ix], b, d[k, iy + 1, ix])
+    x, y = ix + dx, iy + dy
+    xerr, yerr = np.minimum(xerr, 0.5), np.minimum(yerr, 0.5)
+
+    if single:
+        return float(x[0]), float(y[0]), float(xerr[0]), float(yerr[0])
+    return x, y, xerr, yerr
+
+
+def gaussian_fit_batch(cutouts, fwhm=4.0, n_iter=15, gain=1.0):
+    """
+    Least-squares fit of a circular 2D gaussian plus constant background.
+
+    model = B + A exp(-((x - x0)^2 + (y - y0)^2) / (2 s^2))
+
+    All cutouts are solved together with a batched Levenberg-Marquardt: the
+    normal equations are (N, 5, 5) and solved in one np.linalg.solve call per
+    iteration. Starts from the windowed center of mass.
+
+    inputs:
+    -------
+    cutouts - (h, w) or (N, h, w) array of star cutouts
+    fwhm    - float, starting guess of the PSF FWHM in pixels
+    n_iter  - int, number of LM iterations
+    gain    - float, e-/ADU used for the photon noise term of the pixel weights
+
+    returns
+    -------
+    x, y, xerr, yerr  (floats for a single cutout, (N,) arrays for a stack)
+    errors are scaled by the reduced chi^2 of the fit
+    """
+    stack, single = _as_stack(cutouts)
+    n, h, w = stack.shape
+    rows, cols = np.arange(h)[None, :, None], np.arange(w)[None, None, :]
+
+    bg, noise = _background(stack)
+    # inverse-variance pixel weights: read/sky noise plus photon noise of the star
+    weight = (1.0 / (noise[:, None, None]**2 + np.maximum(stack - bg[:, None, None], 0) / gain)).reshape(n, -1)
+    x0, y0, _, _ = windowed_com_batch(stack, fwhm=fwhm, gain=gain)
+    x0 = np.nan_to_num(x0, nan=w / 2)
+    y0 = np.nan_to_num(y0, nan=h / 2)
+    amp = stack.reshape(n, -1).max(axis=1) - bg
+    p = np.stack([bg, amp, x0, y0, np.full(n, fwhm / 2.3548)], axis=1)
+
+    def _model(p):
+        B, A, xc, yc, s = [p[:, i, None, None] for i in range(5)]
+        dx, dy = cols - xc, rows - yc
+        r2 = dx**2 + dy**2
+        e = np.exp(-r2 / (2 * s**2))
+        model = B + A * e
+        # jacobian with respect to (B, A, x0, y0, s), shape (N, h*w, 5)
+        jac = np.stack([np.ones_like(e), e, A * e * dx / s**2, A * e * dy / s**2,
+                        A * e * r2 / s**3], axis=-1).reshape(len(p), -1, 5)
+        return model, jac
+
+    model, jac = _model(p)
+    resid = (stack - model).reshape(n, -1)
+    chi2 = (weight * resid**2).sum(axis=1)
+    lam = np.full(n, 1e-3)
+    eye = np.eye(5)
+
+    for _ in range(n_iter):
+        JtJ = np.einsum('npi,np,npj->nij', jac, weight, jac)
+        Jtr = np.einsum('npi,np->ni', jac, weight * resid)
+        damped = JtJ + lam[:, None, None] * JtJ * eye + 1e-12 * eye
+        step = np.linalg.solve(damped, Jtr[..., None])[..., 0]
+
+        trial = p + step
+        trial[:, 4] = np.abs(trial[:, 4]) + 1e-3
+        t_model, t_jac = _model(trial)
+        t_resid = (stack - t_model).reshape(n, -1)
+        t_chi2 = (weight * t_resid**2).sum(axis=1)
+
+        better = t_chi2 < chi2
+        p = np.where(better[:, None], trial, p)
+        jac = np.where(better[:, None, None], t_jac, jac)
+        resid = np.where(better[:, None], t_resid, resid)
+        chi2 = np.where(better, t_chi2, chi2)
+        lam = np.where(better, lam / 10, lam * 10)
+
+    JtJ = np.einsum('npi,np,npj->nij', jac, weight, jac) + 1e-12 * eye
+    cov = np.linalg.inv(JtJ) * (chi2 / max(h * w - 5, 1))[:, None, None]
+    x, y = p[:, 2], p[:, 3]
+    xerr, yerr = np.sqrt(np.abs(cov[:, 2, 2])), np.sqrt(np.abs(cov[:, 3, 3]))
+
+    if single:
+        return float(x[0]), float(y[0]), float(xerr[0]), float(yerr[0])
+    return x, y, xerr, yerr
+
+
+class cSubpixelCentroid:
+    """
+    Sub-pixel centroid engine with a shared single/batch interface.
+
+    method:
+        'wcom'  - iterative gaussian-windowed center of mass
+        'gauss' - 2D gaussian least-squares fit
+        'quad'  - quadratic interpolation of the peak pixel
+
+    measure() solves one cutout for real-time guiding; measure_batch() solves an
+    (N, h, w) stack in one vectorised call for offline reprocessing. Both use the
+    same code path, so results agree exactly.
+    """
+
+    METHODS = {'wcom':  windowed_com_batch,
+               'gauss': gaussian_fit_batch,
+               'quad':  quadratic_peak_batch}
+
+    def __init__(self, method='wcom', fwhm=4.0):
+        """
+        method - str, one of 'wcom', 'gauss', 'quad'
+        fwhm   - float, expected PSF FWHM in pixels (window size / fit starting guess)
+        """
+        self.method = method
+        self.fwhm   = fwhm
+
+    def _solver(self):
+        try:
+            return self.METHODS[self.method]
+        except KeyError:
+            raise ValueError(f"Unknown sub-pixel method '{self.method}', use one of {list(self.METHODS)}")
+
+    def measure_batch(self, cutouts):
+        """
+        cutouts - (N, h, w) stack
+
+        returns x, y, xerr, yerr as (N,) arrays in cutout pixel coords (x=col, y=row)
+        """
+        solver = self._solver()
+        stack = np.asarray(cutouts)
+        if stack.ndim == 2:
+            stack = stack[None]
+        if solver is quadratic_peak_batch:
+            return solver(stack)
+        return solver(stack, fwhm=self.fwhm)
+
+    def measure(self, cutout):
+        """
+        cutout - (h, w) image
+
+        returns x, y, xerr, yerr as floats in cutout pixel coords (x=col, y=row)
+        """
+        x, y, xerr, yerr = self.measure_batch(np.asarray(cutout)[None])
+        return float(x[0]), float(y[0]), float(xerr[0]), float(yerr[0])
@@ -0,0 +1,267 @@
+import asyncio, threading, time, logging
+from collections import deque
+
+
+class cTCSClient:
+    """
+    asyncio client for the P200 TCS remote command socket.
+
+    The event loop runs on its own daemon thread, so the synchronous request()
+    wrapper can be called from the GUI / guide threads, while asyncio callers
+    use arequest() directly.
+
+    framing:
+        Replies are split on a terminator instead of assuming one recv() per
+        reply. REQPOS / REQSTAT replies span several lines and end in NUL;
+        other replies end in NUL or newline. Stray terminators between replies
+        (e.g. '\\n\\x00') are skipped. Commands listed in UNFRAMED (PT answers
+        a bare '0') have no terminator at all: their reply is taken after
+        `idle` seconds without further bytes, and nothing else is sent while
+        one is outstanding so its reply cannot run into the next.
+
+    pipelining:
+        Requests are written as soon as they are issued and matched to replies
+        in order, so several can be in flight (see request_many()).
+
+    timeouts and reconnect:
+        Each request has its own deadline covering the wait for a connection
+        and for the reply. A timed out request leaves the stream out of step,
+        so the connection is dropped and re-opened. A dropped connection is
+        re-opened in the background with exponential backoff; queries waiting
+        on it are re-sent once connected, commands in NO_RETRY (telescope
+        moves) are not, so an offset is never applied twice.
+    """
+
+    TERMINATORS = {'REQPOS': b'\x00', 'REQSTAT': b'\x00'}
+    DEFAULT_TERMINATORS = (b'\x00', b'\n')
+    UNFRAMED = ('PT',)
+    NO_RETRY = ('PT',)
+
+    def __init__(self, host, port, timeout=10.0, connect_timeout=5.0, backoff=(0.5, 10.0),
+                 idle=0.05, logger=None):
+        """
+        host            - str, TCS address
+        port            - int, TCS port
+        timeout         - float, default per request timeout in seconds
+        connect_timeout - float, timeout of a single connection attempt
+        backoff         - (min, max) seconds between reconnection attempts, doubling each time
+        idle            - float, silence in seconds that ends an unterminated reply
+        """
+        self.host            = host
+        self.port            = port
+        self.timeout         = timeout
+        self.connect_timeout = connect_timeout
+        self.backoff         = backoff
+        self.idle            = idle
+        self.logger          = logger or logging.getLogger()
+
+        self.loop        = None
+        self._thread     = None
+        self._reader     = None
+        self._writer     = None
+        self._pending    = deque()  # (terminators, future) in send order
+        self._reader_task    = None
+        self._reconnect_task = None
+        self._closing    = False
+        self.n_reconnects = 0
+
+    # ── loop thread ───────────────────────────────────────────────────────────
+
+    def _run_loop(self, started):
+        asyncio.set_event_loop(self.loop)
+        self._connected = asyncio.Event()
+        self._send_lock = asyncio.Lock()
+        started.set()
+        self.loop.run_forever()
+
+    def _call(self, coro, timeout=None):
+        """run a coroutine on the client loop from any other thread and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    # ── connection ────────────────────────────────────────────────────────────
+
+    def connect(self):
+        """
+        Start the client loop and open the connection.
+
+        returns True if connected. On False the client is closed again (no
+        background retries), as with the old blocking socket.
+        """
+        if self._thread is None:
+            self._closing = False
+            self.loop = asyncio.new_event_loop()
+            started = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(started,),
+                                            name='tcs-client', daemon=True)
+            self._thread.start()
+            started.wait()
+        try:
+            self._call(self._open())
+        except Exception as e:
+            self.logger.error(f"Couldn't connect to TCS at {self.host}:{self.port}: {e}")
+            self.close()
+            return False
+        self.logger.info(f'Connected to TCS at {self.host}:{self.port}')
+        return True
+
+    async def _open(self):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port),
+                                                self.connect_timeout)
+        self._reader, self._writer = reader, writer
+        self._reader_task = asyncio.ensure_future(self._read_replies(reader))
+        self._connected.set()
+
+    def _drop(self, reason):
+        """close the current connection, fail everything in flight and start reconnecting"""
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        self._connected.clear()
+        if self._reader_task is not None and self._reader_task is not asyncio.current_task():
+            self._reader_task.cancel()
+        self._reader_task = None
+        while self._pending:
+            _, fut = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(ConnectionError(reason))
+        if not self._closing and (self._reconnect_task is None or self._reconnect_task.done()):
+            self.logger.warning(f'TCS connection lost ({reason}), reconnecting')
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        delay = self.backoff[0]
+        while not self._closing:
+            await asyncio.sleep(delay)
+            try:
+                await self._open()
+            except (OSError, asyncio.TimeoutError) as e:
+                self.logger.debug(f'TCS reconnect failed: {e}, next try in {delay:.1f} s')
+                delay = min(2 * delay, self.backoff[1])
+                continue
+            self.n_reconnects += 1
+            self.logger.info(f'Reconnected to TCS at {self.host}:{self.port}')
+            return
+
+    def close(self):
+        """Close the connection and stop the client loop."""
+        if self._thread is None:
+            return
+        self._closing = True
+
+        async def _shutdown():
+            if self._reconnect_task is not None:
+                self._reconnect_task.cancel()
+            self._drop('client closed')
+
+        try:
+            self._call(_shutdown(), timeout=5)
+        except Exception as e:
+            self.logger.warning(f"Couldn't close TCS connection cleanly: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self.loop.close()
+        self._thread = None
+        self.logger.info('Closed TCS connection')
+
+    # ── framing ───────────────────────────────────────────────────────────────
+
+    async def _read_replies(self, reader):
+        buf = b''
+        try:
+            while True:
+                if buf and self._pending:
+                    # skip stray terminators left over from the previous reply
+                    buf = buf.lstrip(b'\x00\r\n')
+                if buf and self._pending:
+                    terms, fut = self._pending[0]
+                    if terms:
+                        ends = [buf.find(t) for t in terms if t in buf]
+                        if ends:
+                            end = min(ends)
+                            self._resolve(buf[:end])
+                            buf = buf[end + 1:]
+                            continue
+                        chunk = await reader.read(4096)
+                    else:
+                        # unterminated reply: complete once the line goes quiet
+                        try:
+                            chunk = await asyncio.wait_for(reader.read(4096), self.idle)
+                        except asyncio.TimeoutError:
+                            self._resolve(buf)
+                            buf = b''
+                            continue
+                else:
+                    chunk = await reader.read(4096)
+                if not chunk:
+                    break
+                buf += chunk
+        except asyncio.CancelledError:
+            return
+        except OSError as e:
+            self._drop(f'{type(e).__name__}: {e}')
+            return
+        self._drop('closed by TCS')
+
+    def _resolve(self, frame):
+        _, fut = self._pending.popleft()
+        if not fut.done():
+            fut.set_result(frame.decode('ascii', errors='replace'))
+
+    # ── requests ──────────────────────────────────────────────────────────────
+
+    def _keyword(self, cmd):
+        words = cmd.split()
+        return words[0].lstrip('?').upper() if words else ''
+
+    async def arequest(self, cmd, timeout=None):
+        """
+        Send cmd and return the reply text (without its terminator).
+
+        raises asyncio.TimeoutError if no reply arrives in time, ConnectionError
+        if the connection dropped and cmd may not be re-sent.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        key = self._keyword(cmd)
+        unframed = key in self.UNFRAMED
+        terms = () if unframed else self.TERMINATORS.get(key, self.DEFAULT_TERMINATORS)
+        if isinstance(terms, bytes):
+            terms = (terms,)
+
+        while True:
+            remaining = deadline - time.monotonic()
+            await asyncio.wait_for(self._connected.wait(), max(remaining, 0))
+            fut = self.loop.create_future()
+            try:
+                async with self._send_lock:
+                    self._pending.append((terms, fut))
+                    self._writer.write(cmd.encode('ascii'))
+                    await self._writer.drain()
+                    if unframed:
+                        # hold the line until this reply is in (it has no terminator)
+                        await asyncio.wait_for(asyncio.shield(fut), max(deadline - time.monotonic(), 0))
+                return await asyncio.wait_for(fut, max(deadline - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                fut.cancel()
+                if self.connected:
+                    self._drop(f'timeout waiting for reply to {cmd.strip()!r}')
+                raise
+            except (ConnectionError, OSError, AttributeError) as e:
+                # AttributeError: the writer went away between the wait and the write
+                if key in self.NO_RETRY or time.monotonic() >= deadline:
+                    raise ConnectionError(f'TCS connection lost during {cmd.strip()!r}: {e}') from e
+                self.logger.debug(f'Re-sending {cmd.strip()!r} after reconnect')
+
+    def request(self, cmd, timeout=None):
+        """Blocking request() for use from non-asyncio threads."""
+        return self._call(self.arequest(cmd, timeout))
+
+    def request_many(self, cmds, timeout=None):
+        """Send all cmds back to back (pipelined) and return their replies in order."""
+        async def _gather():
+            return await asyncio.gather(*[self.arequest(cmd, timeout) for cmd in cmds])
+        return self._call(_gather())
@@ -0,0 +1,167 @@
+import threading, time, logging, bisect
+from collections import deque
+
+
+def sexagesimal_to_deg(text, hours=False):
+    """'[+-]dd:mm:ss.s' -> float degrees (hours=True: 'hh:mm:ss.ss' -> degrees, 15 deg per hour)"""
+    text = text.strip()
+    sign = -1.0 if text.startswith('-') else 1.0
+    d, m, s = (abs(float(v)) for v in text.lstrip('+-').split(':'))
+    value = sign * (d + m / 60 + s / 3600)
+    return 15 * value if hours else value
+
+
+def deg_to_sexagesimal(value, hours=False, decimals=1, signed=False):
+    """inverse of sexagesimal_to_deg; RA wraps into [0, 24h)"""
+    if hours:
+        value = (value % 360) / 15
+    sign = '-' if value < 0 else ('+' if signed else '')
+    total = round(abs(value) * 3600, decimals)
+    d, rest = divmod(total, 3600)
+    m, s = divmod(rest, 60)
+    width = 3 + decimals if decimals else 2
+    return f"{sign}{int(d):02d}:{int(m):02d}:{s:0{width}.{decimals}f}"
+
+
+def _decimals(text):
+    """number of decimals on the seconds field of a sexagesimal string"""
+    seconds = text.strip().rsplit(':', 1)[-1]
+    return len(seconds.split('.', 1)[1]) if '.' in seconds else 0
+
+
+class cTelemetryPoller:
+    """
+    Polls the TCS on a background thread and serves telemetry for a frame time.
+
+    fetch() (e.g. cGuider.get_telemetry) is called every `interval` seconds and
+    the parsed header dict is kept, timestamped at the middle of the request,
+    in a ring buffer of `size` samples. snapshot(t) returns immediately: RA, DEC
+    and AIRMASS are linearly interpolated between the samples bracketing t (and
+    extrapolated from the last two for a short way past the newest one), all
+    other keys come from the latest sample at or before t. The values keep the
+    string format of the TCS reply so FITS headers are unchanged.
+    """
+
+    INTERPOLATED = ('RA', 'DEC', 'AIRMASS')
+
+    def __init__(self, fetch, interval=1.0, size=256, max_age=None, logger=None):
+        """
+        fetch    - callable() -> dict of header values
+        interval - float, seconds between polls
+        size     - int, samples kept in the ring buffer
+        max_age  - float, seconds after which the newest sample counts as stale
+                   (default 5 x interval); stale values are returned but logged
+        """
+        self.fetch    = fetch
+        self.interval = interval
+        self.max_age  = 5 * interval if max_age is None else max_age
+        self.logger   = logger or logging.getLogger()
+
+        self.times    = deque(maxlen=size)
+        self.samples  = deque(maxlen=size)
+        self.lock     = threading.Lock()
+        self._stop    = threading.Event()
+        self.thread   = None
+        self.n_errors = 0
+        self._warned_stale = False
+
+    # ── polling thread ────────────────────────────────────────────────────────
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._poll, name='tcs-telemetry', daemon=True)
+        self.thread.start()
+        self.logger.info(f'Telemetry poller started ({self.interval:.1f} s cadence)')
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _poll(self):
+        while not self._stop.is_set():
+            t0 = time.time()
+            try:
+                values = self.fetch()
+            except Exception as e:
+                self.n_errors += 1
+                self.logger.warning(f'Telemetry poll failed: {type(e).__name__}: {e}')
+            else:
+                self.add(0.5 * (t0 + time.time()), values)
+            # sleep out the rest of the interval, but wake up at once on stop()
+            self._stop.wait(max(self.interval - (time.time() - t0), 0))
+
+    def add(self, t, values):
+        """Store one telemetry sample taken at unix time t."""
+        with self.lock:
+            if self.times and t < self.times[-1]:
+                return  # out of order, keep the buffer sorted
+            self.times.append(t)
+            self.samples.append(dict(values))
+        self._warned_stale = False
+
+    # ── lookups ───────────────────────────────────────────────────────────────
+
+    @property
+    def latest_time(self):
+        with self.lock:
+            return self.times[-1] if self.times else None
+
+    def snapshot(self, t=None):
+        """
+        Telemetry for unix time t (default now).
+
+        returns dict of header values, or None before the first successful poll
+        """
+        t = time.time() if t is None else t
+        with self.lock:
+            times, samples = list(self.times), list(self.samples)
+        if not times:
+            return None
+
+        if t - times[-1] > self.max_age and not self._warned_stale:
+            self.logger.warning(f'TCS telemetry is {t - times[-1]:.1f} s old')
+            self._warned_stale = True
+
+        i = bisect.bisect_right(times, t)
+        base = dict(samples[max(i - 1, 0)])
+        if len(times) < 2:
+            return base
+
+        # bracketing pair; past the newest sample extrapolate from the last two,
+        # but not further than one poll interval
+        if i <= 0:
+            return base
+        if i >= len(times):
+            lo, hi = len(times) - 2, len(times) - 1
+            t = min(t, times[hi] + self.interval)
+        else:
+            lo, hi = i - 1, i
+        frac = (t - times[lo]) / max(times[hi] - times[lo], 1e-9)
+
+        for key in self.INTERPOLATED:
+            try:
+                base[key] = self._interpolate(key, samples[lo][key], samples[hi][key], frac)
+            except (KeyError, ValueError, TypeError):
+                pass    # unparsable value, keep the sample's own
+        return base
+
+    def _interpolate(self, key, a, b, frac):
+        if key == 'AIRMASS':
+            decimals = len(a.split('.', 1)[1]) if '.' in a else 3
+            va, vb = float(a), float(b)
+            return f"{va + frac * (vb - va):.{decimals}f}"
+
+        hours = key == 'RA'
+        va, vb = sexagesimal_to_deg(a, hours), sexagesimal_to_deg(b, hours)
+        if hours and abs(vb - va) > 180:     # crossing 0h
+            vb += 360 if vb < va else -360
+        return deg_to_sexagesimal(va + frac * (vb - va), hours=hours, decimals=_decimals(a),
+                                  signed=a.strip()[:1] in '+-')
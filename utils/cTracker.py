@@ -0,0 +1,108 @@
+import numpy as np
+
+
+class cROITracker:
+    """
+    Region-of-interest tracker for guiding.
+
+    Once the star has been found in the full (sub)frame, later frames are only
+    centroided inside a small window around the last position, so per-frame
+    cost scales with the window rather than the sensor. If the star is not
+    detected in the window, the window grows by `grow` each frame (up to
+    `max_window`); after `max_lost` consecutive misses the lock is dropped and
+    the next frame is searched in full (reacquisition).
+
+    Positions are (x=col, y=row) in the coordinates of the array passed to update().
+    """
+
+    def __init__(self, window=128, max_window=512, grow=2.0, min_snr=8.0, max_lost=3):
+        """
+        window     - int, side of the tracking box in pixels while locked
+        max_window - int, largest box the window may grow to while the star is lost
+        grow       - float, factor applied to the box side for every missed frame
+        min_snr    - float, peak signal-to-noise needed to count the star as detected
+        max_lost   - int, consecutive misses before dropping back to a full-frame search
+        """
+        self.base_window = int(window)
+        self.max_window  = int(max_window)
+        self.grow        = float(grow)
+        self.min_snr     = float(min_snr)
+        self.max_lost    = int(max_lost)
+        self.reset()
+
+    def reset(self):
+        """Forget the lock; the next update() does a full-frame search."""
+        self.locked   = False
+        self.position = None   # (x, y) last good centroid
+        self.window   = self.base_window
+        self.n_lost   = 0
+        self.last_box = None   # (r0, r1, c0, c1) searched on the last update
+        self.last_snr = None
+
+    def box(self, shape):
+        """
+        Return the (r0, r1, c0, c1) window around the last position.
+
+        The box keeps a fixed size and is slid back inside the frame at the
+        edges, so the centroid filter sees the same shape every frame.
+        """
+        nrows, ncols = shape
+        h = min(self.window, nrows)
+        w = min(self.window, ncols)
+        x, y = self.position
+        r0 = int(np.clip(int(round(y)) - h // 2, 0, nrows - h))
+        c0 = int(np.clip(int(round(x)) - w // 2, 0, ncols - w))
+        return r0, r0 + h, c0, c0 + w
+
+    def snr(self, cutout):
+        """Peak signal-to-noise of a cutout using a median/MAD background."""
+        background = np.median(cutout)
+        noise = 1.4826 * np.median(np.abs(cutout - background))
+        if noise <= 0:
+            noise = max(np.sqrt(max(background, 1.0)), 1.0) # poisson floor for flat/quantized images
+        return (np.max(cutout) - background) / noise
+
+    def update(self, data, centroid):
+        """
+        Locate the star in data.
+
+        inputs:
+        -------
+        data     - 2D array, guide (sub)frame
+        centroid - callable(cutout) -> (x, y) in cutout coords (e.g. cGuider._find_centroid)
+
+        returns
+        -------
+        (x, y) in data coords, or None if the star was not detected
+        """
+        if not self.locked:
+            self.last_box = (0, data.shape[0], 0, data.shape[1])
+            cutout = data
+        else:
+            self.last_box = self.box(data.shape)
+            r0, r1, c0, c1 = self.last_box
+            cutout = data[r0:r1, c0:c1]
+
+        self.last_snr = self.snr(cutout)
+        if self.last_snr < self.min_snr:
+            self._lost(data.shape)
+            return None
+
+        cx, cy = centroid(cutout)
+        r0, _, c0, _ = self.last_box
+        self.position = (cx + c0, cy + r0)
+        self.locked   = True
+        self.window   = self.base_window
+        self.n_lost   = 0
+        return self.position
+
+    def _lost(self, shape):
+        """Grow the window after a miss, and drop the lock after max_lost misses."""
+        if not self.locked:
+            return
+        self.n_lost += 1
+        grown = int(self.window * self.grow)
+        if self.n_lost >= self.max_lost or grown >= max(shape):
+            self.reset()
+        else:
+            self.window = min(grown, self.max_window)